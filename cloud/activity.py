@@ -1,110 +1,174 @@
 # cloud/activity.py
-import time, math
-from typing import Optional, Tuple
-
-# Track memory
-_STATE = {}  # tid -> dict(last_xy, last_t, fast_ema, slow_ema, label, last_change_t, below_since)
-
-def _dist(a, b):
-    return math.hypot(a[0] - b[0], a[1] - b[1])
-
-def classify_activity(
-    track,
-    now: Optional[float] = None,
-    frame_size: Optional[Tuple[int, int]] = None,  # (h, w)
-    v_walk_norm: float = 0.040,   # threshold as fraction of frame height per second
-    alpha_fast: float = 0.60,     # fast EMA (responsive)
-    alpha_slow: float = 0.18,     # slow EMA (stable)
-    promote_hold_s: float = 0.35, # time required to switch TO walking
-    demote_hold_s: float  = 1.20, # time required to switch TO stationary (slower!)
-    hysteresis: float = 0.12,     # deadband around threshold
-    demote_below_s: float = 0.80  # how long both EMAs must stay below thr to demote
-):
+import time
+import numpy as np
+
+WALKING, STATIONARY = 1, 0
+LABELS = ("stationary", "walking")
+
+class ActivityEngine:
     """
-    Two-class activity: 'walking' or 'stationary'.
-    Uses dual-rate EMA, asymmetric holds, and requires sustained below-threshold
-    evidence before demoting to stationary.
+    Two-class activity ("walking" / "stationary") for the tracks of one
+    stream. Box-centre speed, normalised by frame height (per second), feeds
+    a fast and a slow EMA. Promotion is quick: the fast EMA above
+    `v_walk_norm` plus `hysteresis` and rising, `promote_hold_s` after the
+    last change. Demotion is slow: both EMAs below the threshold minus
+    `hysteresis` for `demote_below_s`, and `demote_hold_s` after the last
+    change. State lives in parallel NumPy arrays (one slot per track), so
+    classify() handles every track of a frame at once.
+
+    Slots not seen for `idle_s` are evicted (checked at most every
+    `evict_every_s`); at `max_tracks` the least recently seen slot is
+    reused, so memory per stream is bounded whatever the track count (a
+    single frame with more tracks than that grows the arrays to fit it).
     """
-    if now is None:
-        now = time.time()
-
-    tid = track.id
-    x1, y1, x2, y2 = map(float, track.box)
-    cx, cy = (x1 + x2) / 2.0, (y1 + y2) / 2.0
-    bh = max(1.0, (y2 - y1))  # bbox height fallback normalizer
-
-    st = _STATE.get(tid)
-    if st is None:
-        st = {
-            "last_xy": (cx, cy),
-            "last_t": now,
-            "fast_ema": 0.0,
-            "slow_ema": 0.0,
-            "label": "stationary",
-            "last_change_t": now,
-            "below_since": None  # when both EMAs first fell below demote threshold
-        }
-        _STATE[tid] = st
-        return "stationary"
-
-    dt = max(1e-3, now - st["last_t"])
-    inst_speed_px = _dist((cx, cy), st["last_xy"]) / dt
-
-    # Normalize speed by frame height (preferred) or bbox height
-    if frame_size is not None:
-        fh = max(1.0, float(frame_size[0]))
-    else:
-        fh = bh
-    inst_speed_norm = inst_speed_px / fh
-
-    # Dual EMA update
-    fast = alpha_fast * inst_speed_norm + (1.0 - alpha_fast) * st["fast_ema"]
-    slow = alpha_slow * inst_speed_norm + (1.0 - alpha_slow) * st["slow_ema"]
-
-    st["last_xy"] = (cx, cy)
-    st["last_t"] = now
-    st["fast_ema"] = fast
-    st["slow_ema"] = slow
-
-    # Hysteresis thresholds
-    walk_up = v_walk_norm * (1.0 + hysteresis)
-    walk_dn = v_walk_norm * (1.0 - hysteresis)
-
-    cur = st["label"]
-    proposed = cur
-
-    # Promotion logic — be quick when motion ramps up
-    if cur == "stationary" and fast >= walk_up and fast > slow:
-        proposed = "walking"
-        if (now - st["last_change_t"]) >= promote_hold_s:
-            st["label"] = "walking"
-            st["last_change_t"] = now
-            st["below_since"] = None
-            return st["label"]
-
-    # Demotion logic — be SLOW and require sustained evidence
-    # 1) Both EMAs must be below walk_dn
-    # 2) Start a timer (below_since) when both go below; only demote if duration >= demote_below_s
-    elif cur == "walking":
-        both_below = (fast <= walk_dn and slow <= walk_dn)
-        if both_below:
-            if st["below_since"] is None:
-                st["below_since"] = now
-            below_dur = now - st["below_since"]
-        else:
-            st["below_since"] = None
-            below_dur = 0.0
-
-        if both_below and below_dur >= demote_below_s:
-            proposed = "stationary"
-            if (now - st["last_change_t"]) >= demote_hold_s:
-                st["label"] = "stationary"
-                st["last_change_t"] = now
-                st["below_since"] = None
-                return st["label"]
-
-    # If neither branch commits a label change, keep the current one
-    return st["label"]
-
-def forget_track(track_id: int):
-    _STATE.pop(track_id, None)
+    def __init__(self, v_walk_norm=0.040, alpha_fast=0.60, alpha_slow=0.18,
+                 promote_hold_s=0.35, demote_hold_s=1.20, hysteresis=0.12,
+                 demote_below_s=0.80, idle_s=10.0, max_tracks=256, evict_every_s=1.0):
+        self.v_walk_norm = v_walk_norm
+        self.alpha_fast = alpha_fast
+        self.alpha_slow = alpha_slow
+        self.promote_hold_s = promote_hold_s
+        self.demote_hold_s = demote_hold_s
+        self.hysteresis = hysteresis
+        self.demote_below_s = demote_below_s
+        self.idle_s = idle_s
+        self.max_tracks = max_tracks
+        self.evict_every_s = evict_every_s
+        self._slot = {}             # track id -> slot
+        self._free = []
+        self._last_evict = 0.0
+        self._alloc(min(16, max_tracks))
+
+    def _alloc(self, cap):
+        old = getattr(self, "tid", None)
+        n = 0 if old is None else len(old)
+        def grow(a, fill, dtype):
+            out = np.full(cap, fill, dtype=dtype)
+            if a is not None:
+                out[:n] = a
+            return out
+        g = lambda name, fill, dtype=np.float64: grow(getattr(self, name, None), fill, dtype)
+        self.tid = g("tid", -1, np.int64)
+        self.x, self.y, self.t = g("x", 0.0), g("y", 0.0), g("t", 0.0)
+        self.fast, self.slow = g("fast", 0.0), g("slow", 0.0)
+        self.label = g("label", STATIONARY, np.int8)
+        self.changed = g("changed", 0.0)
+        self.below = g("below", np.nan)        # nan = not below the demote threshold
+        self.seen = g("seen", 0.0)
+        self._free.extend(range(cap - 1, n - 1, -1))
+
+    def __len__(self):
+        return len(self._slot)
+
+    def _take(self, tid, keep=()):
+        # `keep`: slots already handed out in the current call, never evicted; a
+        # frame with more tracks than max_tracks grows the arrays instead
+        if not self._free:
+            n = len(self.tid)
+            seen = np.where(self.tid >= 0, self.seen, np.inf)
+            seen[np.asarray(keep, dtype=np.int64)] = np.inf
+            if n < self.max_tracks:
+                self._alloc(min(self.max_tracks, 2 * n))
+            elif np.isinf(seen).all():
+                self._alloc(2 * n)
+            else:
+                self._release(int(np.argmin(seen)))
+        k = self._free.pop()
+        self._slot[tid] = k
+        self.tid[k] = tid
+        return k
+
+    def _release(self, k):
+        self._slot.pop(int(self.tid[k]), None)
+        self.tid[k] = -1
+        self._free.append(k)
+
+    def forget(self, tid):
+        k = self._slot.get(tid)
+        if k is not None:
+            self._release(k)
+
+    def state_rows(self):
+        """(tid, x, y, t, fast, slow, label, changed, below, seen) per live slot, for snapshots."""
+        k = np.nonzero(self.tid >= 0)[0]
+        cols = (self.tid[k].tolist(), self.x[k].tolist(), self.y[k].tolist(), self.t[k].tolist(),
+                self.fast[k].tolist(), self.slow[k].tolist(), self.label[k].tolist(),
+                self.changed[k].tolist(), self.below[k].tolist(), self.seen[k].tolist())
+        return list(zip(*cols))
+
+    def load_rows(self, rows):
+        # inverse of state_rows(); rows beyond max_tracks are ignored
+        for tid, x, y, t, fast, slow, label, changed, below, seen in rows[:self.max_tracks]:
+            k = self._slot.get(tid)
+            if k is None:
+                k = self._take(tid)
+            self.x[k], self.y[k], self.t[k] = x, y, t
+            self.fast[k], self.slow[k] = fast, slow
+            self.label[k], self.changed[k], self.below[k], self.seen[k] = label, changed, below, seen
+
+    def evict_idle(self, now):
+        for k in np.nonzero((self.tid >= 0) & (self.seen < now - self.idle_s))[0]:
+            self._release(int(k))
+        self._last_evict = now
+
+    def classify(self, tids, boxes, now=None, frame_size=None):
+        """Labels ("walking"/"stationary") for tracks `tids` with xyxy `boxes`, in order."""
+        if now is None:
+            now = time.time()
+        if now - self._last_evict >= self.evict_every_s:
+            self.evict_idle(now)
+        if not len(tids):
+            return []
+        b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        cx, cy = (b[:, 0] + b[:, 2]) / 2.0, (b[:, 1] + b[:, 3]) / 2.0
+        fh = (np.full(len(b), max(1.0, float(frame_size[0]))) if frame_size is not None
+              else np.maximum(1.0, b[:, 3] - b[:, 1]))
+
+        fresh = np.zeros(len(tids), bool)
+        slots = np.empty(len(tids), np.int64)
+        for n, tid in enumerate(tids):
+            k = self._slot.get(tid)
+            if k is None:
+                k = self._take(tid, keep=slots[:n])
+                fresh[n] = True
+            self.seen[k] = now
+            slots[n] = k
+        k = slots
+
+        # new tracks start stationary with zero EMAs
+        kn = k[fresh]
+        self.x[kn], self.y[kn], self.t[kn] = cx[fresh], cy[fresh], now
+        self.fast[kn] = self.slow[kn] = 0.0
+        self.label[kn] = STATIONARY
+        self.changed[kn] = now
+        self.below[kn] = np.nan
+
+        ko, old = k[~fresh], ~fresh
+        if len(ko):
+            dt = np.maximum(1e-3, now - self.t[ko])
+            speed = np.hypot(cx[old] - self.x[ko], cy[old] - self.y[ko]) / dt / fh[old]
+            fast = self.alpha_fast * speed + (1.0 - self.alpha_fast) * self.fast[ko]
+            slow = self.alpha_slow * speed + (1.0 - self.alpha_slow) * self.slow[ko]
+            self.x[ko], self.y[ko], self.t[ko] = cx[old], cy[old], now
+            self.fast[ko], self.slow[ko] = fast, slow
+
+            up = self.v_walk_norm * (1.0 + self.hysteresis)
+            dn = self.v_walk_norm * (1.0 - self.hysteresis)
+            cur = self.label[ko]
+            since = now - self.changed[ko]
+
+            promote = (cur == STATIONARY) & (fast >= up) & (fast > slow) & (since >= self.promote_hold_s)
+
+            walking = cur == WALKING
+            both_below = walking & (fast <= dn) & (slow <= dn)
+            below = self.below[ko]
+            below = np.where(both_below, np.where(np.isnan(below), now, below),
+                             np.where(walking, np.nan, below))
+            demote = both_below & (now - below >= self.demote_below_s) & (since >= self.demote_hold_s)
+
+            flip = promote | demote
+            self.label[ko] = np.where(promote, WALKING, np.where(demote, STATIONARY, cur))
+            self.changed[ko] = np.where(flip, now, self.changed[ko])
+            self.below[ko] = np.where(flip, np.nan, below)
+
+        return [LABELS[v] for v in self.label[k]]
@@ -1,6 +1,6 @@
 # cloud/annotator.py  (AVI writer)
-import os, cv2
-from typing import List, Tuple
+import os, re, cv2, time, queue, threading
+from typing import Dict, List, Tuple
 
 COLORS = {
     "walking":    (60, 220, 60),   # green
@@ -10,18 +10,51 @@ COLORS = {
 
 class ActivityAnnotator:
     def __init__(self, out_path="/results/annotated_activity.avi", fps=15,
-                 show_legend=True):
+                 show_legend=True, segment_s=0.0, segment_bytes=0):
         self.out_path = out_path
         self.fps = fps
         self.writer = None
         self.show_legend = show_legend
+        # segment_s / segment_bytes > 0: roll over to <stem>_0001.avi, _0002.avi, ...
+        # A frame size change always starts the next numbered file, segmented or not.
+        self.segment_s = segment_s
+        self.segment_bytes = segment_bytes
+        self.segment = 0
+        self._path = out_path
+        self._opened = 0.0
+        self._frames = 0
+        self._size = None
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
+    def _segment_path(self):
+        if not (self.segment_s or self.segment_bytes) and self.segment == 0:
+            return self.out_path
+        stem, ext = os.path.splitext(self.out_path)
+        return f"{stem}_{self.segment:04d}{ext}"
+
+    def _segment_full(self):
+        if self.segment_s and time.time() - self._opened >= self.segment_s:
+            return True
+        # file size is checked every second's worth of frames, not per frame
+        if self.segment_bytes and self._frames % max(1, int(self.fps)) == 0:
+            try:
+                return os.path.getsize(self._path) >= self.segment_bytes
+            except OSError:
+                return False
+        return False
+
     def _ensure_writer(self, frame):
+        h, w = frame.shape[:2]
+        if self.writer is not None and ((w, h) != self._size or self._segment_full()):
+            self.release()
+            self.segment += 1
         if self.writer is None:
-            h, w = frame.shape[:2]
             fourcc = cv2.VideoWriter_fourcc(*"MJPG")  # robust AVI
-            self.writer = cv2.VideoWriter(self.out_path, fourcc, self.fps, (w, h))
+            self._path = self._segment_path()
+            self.writer = cv2.VideoWriter(self._path, fourcc, self.fps, (w, h))
+            self._size = (w, h)
+            self._opened = time.time()
+            self._frames = 0
 
     def _draw_legend(self, img):
         if not self.show_legend: return
@@ -37,12 +70,14 @@ class ActivityAnnotator:
 
     def draw(self,
              frame_bgr,
-             items: List[Tuple[Tuple[int,int,int,int], int, str]]):
+             items: List[Tuple[Tuple[int,int,int,int], int, str]],
+             in_place=False):
         """
         items: list of ((x1,y1,x2,y2), track_id, label) where label in {walking, stationary}
+        in_place: draw straight onto frame_bgr (caller owns a scratch frame) instead of a copy
         """
         self._ensure_writer(frame_bgr)
-        out = frame_bgr.copy()
+        out = frame_bgr if in_place else frame_bgr.copy()
 
         for (x1,y1,x2,y2), tid, label in items:
             lbl = label if label in COLORS else "unknown"
@@ -58,8 +93,91 @@ class ActivityAnnotator:
 
         self._draw_legend(out)
         self.writer.write(out)
+        self._frames += 1
 
     def release(self):
         if self.writer is not None:
             self.writer.release()
             self.writer = None
+
+
+class AnnotationService:
+    """
+    Background annotation, one writer per stream. submit() only enqueues
+    (render_fn, items) on the stream's bounded queue and returns; the
+    stream's thread decodes via render_fn(), draws in place and writes to
+    its own AVI (`<stem>_<stream><ext>`, segmented as configured). When a
+    queue is full (slow disk) the frame is dropped and counted, so ingest
+    never waits on video writing.
+    """
+    def __init__(self, out_path, fps=15, qsize=8, segment_s=0.0, segment_bytes=0):
+        self.out_path = out_path
+        self.fps = fps
+        self.qsize = qsize
+        self.segment_s = segment_s
+        self.segment_bytes = segment_bytes
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._streams: Dict[str, Tuple[queue.Queue, threading.Thread, ActivityAnnotator]] = {}
+        self._lock = threading.Lock()
+        self._stop = False
+
+    def _path_for(self, stream_id):
+        stem, ext = os.path.splitext(self.out_path)
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", stream_id) or "default"
+        return f"{stem}_{safe}{ext}"
+
+    def _stream(self, stream_id):
+        st = self._streams.get(stream_id)
+        if st is None:
+            with self._lock:
+                st = self._streams.get(stream_id)
+                if st is None:
+                    ann = ActivityAnnotator(self._path_for(stream_id), fps=self.fps,
+                                            segment_s=self.segment_s, segment_bytes=self.segment_bytes)
+                    q = queue.Queue(maxsize=self.qsize)
+                    th = threading.Thread(target=self._run, args=(q, ann), daemon=True,
+                                          name=f"annot-{stream_id}")
+                    st = self._streams[stream_id] = (q, th, ann)
+                    th.start()
+        return st
+
+    def submit(self, stream_id, render_fn, items):
+        if self._stop:
+            return False
+        try:
+            self._stream(stream_id)[0].put_nowait((render_fn, items))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self, q, ann):
+        while True:
+            job = q.get()
+            if job is None:
+                break
+            render_fn, items = job
+            try:
+                frame = render_fn()     # freshly decoded, so drawing in place is safe
+                if frame is not None:
+                    ann.draw(frame, items, in_place=True)
+                    self.written += 1
+            except Exception:
+                self.errors += 1
+        ann.release()
+
+    def stats(self):
+        return {"annot_streams": len(self._streams), "annot_written": self.written,
+                "annot_dropped": self.dropped, "annot_errors": self.errors}
+
+    def release(self, timeout=5.0):
+        # drain what is queued, then close every writer
+        self._stop = True
+        with self._lock:
+            streams = list(self._streams.values())
+        for q, _, _ in streams:
+            q.put(None)
+        for _, th, _ in streams:
+            th.join(timeout=timeout)
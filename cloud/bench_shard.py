@@ -0,0 +1,83 @@
+# cloud/bench_shard.py
+# Scaling of the sharded cloud (router.py) with worker count. For each entry
+# of --workers it starts `router.py --workers N` on a local port, drives it
+# with loadtest.py's concurrent binary streams and prints throughput and
+# latency, speedup over the first entry and per-worker efficiency. Also
+# reports how sticky the ring is: the share of stream ids that change owner
+# going from N to N+1 workers (ideal 1/(N+1)).
+#
+#   python bench_shard.py --workers 1,2,4 --streams 32 --seconds 15
+import argparse, http.client, json, os, subprocess, sys, time
+
+from loadtest import run_level
+from router import HashRing, shard_names
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def stickiness(n, keys=10000, vnodes=64):
+    a, b = HashRing(shard_names(n), vnodes), HashRing(shard_names(n + 1), vnodes)
+    ids = [f"cam-{i}" for i in range(keys)]
+    return sum(a.owner(k) != b.owner(k) for k in ids) / keys
+
+def wait_health(port, workers, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            r = conn.getresponse()
+            body = json.loads(r.read() or b"{}")
+            conn.close()
+            if r.status == 200 and body.get("status") == "ok" and len(body.get("workers", {})) == workers:
+                return True
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    return False
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", default="1,2,4", help="comma list of shard counts")
+    ap.add_argument("--streams", type=int, default=32, help="concurrent streams per run")
+    ap.add_argument("--seconds", type=float, default=15.0)
+    ap.add_argument("--port", type=int, default=18000)
+    ap.add_argument("--fps", type=float, default=0.0, help="per-stream pacing; 0 = closed loop")
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=720)
+    ap.add_argument("--dets", type=int, default=8)
+    ap.add_argument("--stream-header", action="store_true")
+    ap.add_argument("--json", default="")
+    args = ap.parse_args()
+    args.host = "127.0.0.1"
+
+    rows, base = [], None
+    print(f"{'workers':>8}{'fps':>10}{'speedup':>9}{'eff':>7}{'p50':>9}{'p95':>9}{'errors':>8}{'moved@+1':>10}")
+    for n in [int(x) for x in args.workers.split(",") if x.strip()]:
+        shard_dir = f"/tmp/bench-shards-{n}"
+        proc = subprocess.Popen([sys.executable, "router.py", "--workers", str(n), "--host", "127.0.0.1",
+                                 "--port", str(args.port), "--shard-dir", shard_dir], cwd=HERE)
+        try:
+            if not wait_health(args.port, n):
+                print(f"[BENCH] router with {n} workers did not become healthy", flush=True)
+                continue
+            r = run_level(args, args.streams, b"")
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        base = base or (n, r["fps"])
+        speedup = r["fps"] / base[1] if base[1] else 0.0
+        eff = speedup / (n / base[0])
+        r.update({"workers": n, "speedup": round(speedup, 2), "efficiency": round(eff, 2),
+                  "moved_next": round(stickiness(n), 3)})
+        rows.append(r)
+        print(f"{n:>8}{r['fps']:>10.1f}{speedup:>9.2f}{eff:>7.2f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['errors']:>8}{r['moved_next']:>10.3f}", flush=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# cloud/bench_tracker.py
+# Tracker.update cost over a long simulated run with people continuously
+# entering and leaving. Prints per-window update cost and live track count
+# for the expiring tracker vs. one with expiry disabled (the old behaviour,
+# where every track ever seen stays in the list).
+#
+#   python bench_tracker.py --hours 2 --fps 15 --people 25
+import argparse, time
+import numpy as np
+
+from tracker import Tracker
+
+class Crowd:
+    """
+    `people` walkers at a time on a WxH frame; each leaves after a random
+    dwell and is replaced by a new one (new ground-truth id). `speed` is the
+    max walking speed in box heights per second.
+    """
+    def __init__(self, people, w=1280, h=720, seed=0, speed=0.3):
+        self.rng = np.random.default_rng(seed)
+        self.w, self.h = w, h
+        self.speed = speed
+        self.p = np.zeros((people, 6), np.float32)   # x, y, vx, vy, t_leave, bh
+        self.gt = np.zeros(people, np.int64)
+        self._next_gt = 0
+        for k in range(people):
+            self._spawn(k, 0.0)
+
+    def _spawn(self, k, ts):
+        r = self.rng
+        bh = r.uniform(120, 260)
+        v = self.speed * bh
+        self.p[k] = (r.uniform(0, self.w - bh / 2), r.uniform(0, self.h - bh),
+                     r.uniform(-v, v), r.uniform(-v / 4, v / 4), ts + r.uniform(10, 120), bh)
+        self.gt[k] = self._next_gt
+        self._next_gt += 1
+
+    def step(self, ts, dt, with_ids=False):
+        p = self.p
+        p[:, 0] = p[:, 0] + p[:, 2] * dt
+        p[:, 1] = p[:, 1] + p[:, 3] * dt
+        # bounce off the frame edges
+        for c, lim, v in ((0, self.w - p[:, 5] / 2, 2), (1, self.h - p[:, 5], 3)):
+            out = (p[:, c] < 0) | (p[:, c] > lim)
+            p[out, v] *= -1
+            p[:, c] = np.clip(p[:, c], 0, lim)
+        for k in np.nonzero(p[:, 4] <= ts)[0]:
+            self._spawn(int(k), ts)
+        jitter = self.rng.normal(0, 2, (len(p), 2))
+        x, y = p[:, 0] + jitter[:, 0], p[:, 1] + jitter[:, 1]
+        keep = self.rng.random(len(p)) > 0.05                  # ~5% missed detections
+        boxes = [(int(a), int(b), int(a + bh / 2), int(b + bh))
+                 for a, b, bh, k in zip(x, y, p[:, 5], keep) if k]
+        if with_ids:
+            return boxes, [int(g) for g, k in zip(self.gt, keep) if k]
+        return boxes
+
+def run(tracker, args):
+    crowd = Crowd(args.people, seed=args.seed)
+    dt = 1.0 / args.fps
+    window = int(args.window_min * 60 * args.fps)
+    n = int(args.hours * 3600 * args.fps)
+    rows, acc = [], 0.0
+    for i in range(n):
+        ts = i * dt
+        boxes = crowd.step(ts, dt)
+        t0 = time.perf_counter()
+        tracker.update(boxes, ts)
+        acc += time.perf_counter() - t0
+        if (i + 1) % window == 0:
+            rows.append((ts / 60.0, acc / window * 1e6, len(tracker.tracks)))
+            acc = 0.0
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, default=1.0, help="simulated capture time")
+    ap.add_argument("--fps", type=float, default=15.0)
+    ap.add_argument("--people", type=int, default=25, help="people in view at any time")
+    ap.add_argument("--window-min", type=float, default=10.0)
+    ap.add_argument("--max-missed", type=int, default=30)
+    ap.add_argument("--max-age-s", type=float, default=5.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    for name, trk in (("expiring", Tracker(max_missed=args.max_missed, max_age_s=args.max_age_s)),
+                      ("no-expiry", Tracker(max_missed=0, max_age_s=0))):
+        print(f"[{name}] {'minute':>8}{'us/update':>12}{'tracks':>9}")
+        for minute, us, ntr in run(trk, args):
+            print(f"[{name}] {minute:>8.0f}{us:>12.1f}{ntr:>9}", flush=True)
+
+if __name__ == "__main__":
+    main()
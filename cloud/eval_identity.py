@@ -0,0 +1,78 @@
+# cloud/eval_identity.py
+# Does track identity survive sparse forwarding? Simulates walkers with
+# ground-truth ids at --fps, forwards every k-th frame (the edge Sampler at
+# 1/k of the frame rate) into each tracker mode and reports, per k:
+#   id_switches   times a ground-truth person's matched track id changed
+#   sw_per_person id_switches / ground-truth people seen
+#   identity      share of a person's matched detections that carry their
+#                 majority track id (1.0 = one stable id each)
+#
+#   python eval_identity.py --rates 1,2,3,5,8 --minutes 5 --speed 0.8
+import argparse
+from collections import Counter, defaultdict
+
+from tracker import make_tracker
+from bench_tracker import Crowd
+
+def evaluate(mode, k, args):
+    crowd = Crowd(args.people, seed=args.seed, speed=args.speed)
+    trk = make_tracker(mode, max_missed=args.max_missed, max_age_s=args.max_age_s)
+    dt = 1.0 / args.fps
+    last_tid, switches = {}, 0
+    per_gt = defaultdict(Counter)
+    forwarded = 0
+    for i in range(int(args.minutes * 60 * args.fps)):
+        ts = i * dt
+        boxes, gts = crowd.step(ts, dt, with_ids=True)
+        if i % k:
+            continue
+        forwarded += 1
+        owner = {id(b): g for b, g in zip(boxes, gts)}
+        for tr in trk.update(boxes, ts):
+            if tr.ts != ts:
+                continue
+            g = owner.get(id(tr.box))
+            if g is None:
+                continue
+            per_gt[g][tr.id] += 1
+            if g in last_tid and last_tid[g] != tr.id:
+                switches += 1
+            last_tid[g] = tr.id
+    total = sum(sum(c.values()) for c in per_gt.values())
+    majority = sum(max(c.values()) for c in per_gt.values())
+    return {"forwarded": forwarded, "id_switches": switches,
+            "sw_per_person": switches / max(1, len(per_gt)),
+            "identity": majority / max(1, total)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rates", default="1,2,3,4,5,8", help="forward every k-th frame")
+    ap.add_argument("--modes", default="iou,kalman")
+    ap.add_argument("--minutes", type=float, default=5.0)
+    ap.add_argument("--fps", type=float, default=15.0)
+    ap.add_argument("--people", type=int, default=8)
+    ap.add_argument("--speed", type=float, default=0.8, help="max walking speed, box heights/s")
+    ap.add_argument("--max-missed", type=int, default=30)
+    ap.add_argument("--max-age-s", type=float, default=5.0)
+    ap.add_argument("--min-identity", type=float, default=0.95)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    rates = [int(r) for r in args.rates.split(",") if r.strip()]
+    print(f"{'mode':<8}{'k':>4}{'fwd':>8}{'switches':>10}{'sw/person':>11}{'identity':>10}")
+    best = {}
+    for mode in modes:
+        for k in rates:
+            r = evaluate(mode, k, args)
+            print(f"{mode:<8}{k:>4}{r['forwarded']:>8}{r['id_switches']:>10}"
+                  f"{r['sw_per_person']:>11.3f}{r['identity']:>10.3f}", flush=True)
+            if r["identity"] >= args.min_identity:
+                best[mode] = max(best.get(mode, 0), k)
+    for mode in modes:
+        k = best.get(mode)
+        print(f"{mode}: identity >= {args.min_identity} up to 1/{k} forwarding" if k
+              else f"{mode}: identity < {args.min_identity} at every rate")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# cloud/executor.py
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+class StreamExecutors:
+    """
+    N single-thread executors; a stream always hashes to the same one, so
+    its frames run serially in submit order while different streams run in
+    parallel (cv2 decode/draw and numpy release the GIL).
+    """
+    def __init__(self, workers=4):
+        self.workers = max(1, int(workers))
+        self._ex = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ingest-{i}")
+                    for i in range(self.workers)]
+
+    def lane(self, stream_id):
+        return zlib.crc32(stream_id.encode("utf-8")) % self.workers
+
+    def submit(self, stream_id, fn, *args, **kwargs):
+        return self._ex[self.lane(stream_id)].submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        for ex in self._ex:
+            ex.shutdown(wait=wait)
@@ -0,0 +1,89 @@
+# cloud/histogram.py
+# Fixed-memory log-bucketed latency histogram (HDR-style, ~4.4% bucket width).
+# Same module as edge/histogram.py (the two images build separately); keep the two identical
+# (cloud/tests/test_histogram.py checks).
+import math, threading
+
+class LogHistogram:
+    """
+    Values (ms) from `lo` to `hi` map to SUB buckets per power of two;
+    smaller values land in bucket 0 and larger ones in the last bucket.
+    Memory is fixed (a few hundred ints) whatever the sample count.
+    record() takes a short uncontended lock so a reader never sees a torn
+    count; percentiles are bucket upper bounds, i.e. within one bucket width.
+    """
+    SUB = 16
+
+    def __init__(self, lo=0.001, hi=100_000.0):
+        self.lo = lo
+        self.n_buckets = int(math.ceil(math.log2(hi / lo) * self.SUB)) + 1
+        self.counts = [0] * self.n_buckets
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def bucket(self, v):
+        if v <= self.lo:
+            return 0
+        return min(self.n_buckets - 1, int(math.log2(v / self.lo) * self.SUB))
+
+    def upper(self, i):
+        return self.lo * 2.0 ** ((i + 1) / self.SUB)
+
+    def record(self, v):
+        i = self.bucket(v)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += v
+            if v < self.min:
+                self.min = v
+            if v > self.max:
+                self.max = v
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.min, self.max
+
+    def percentiles(self, ps=(50, 95, 99)):
+        counts, n, _, lo, hi = self.snapshot()
+        if not n:
+            return [0.0 for _ in ps]
+        out, targets = [], [max(1, math.ceil(p / 100.0 * n)) for p in ps]
+        acc, i = 0, 0
+        for t in targets:
+            while acc + counts[i] < t:
+                acc += counts[i]
+                i += 1
+            out.append(min(hi, max(lo, self.upper(i))))
+        return out
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles((50, 95, 99))
+        with self._lock:
+            n, s, hi = self.count, self.sum, self.max
+        if not n:
+            return {"n": 0}
+        return {"n": n, "mean_ms": round(s / n, 3), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+                "p99_ms": round(p99, 3), "max_ms": round(hi, 3)}
+
+# ---- Prometheus text exposition ----
+LATENCY_LES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+def prom_histogram(name, hist, labels="", les=LATENCY_LES):
+    """Lines for one histogram series; log buckets are folded into the `le` bounds they fit under."""
+    counts, n, s, _, _ = hist.snapshot()
+    lab = labels + "," if labels else ""
+    out, acc, i = [], 0, 0
+    for le in les:
+        while i < len(counts) and hist.upper(i) <= le:
+            acc += counts[i]
+            i += 1
+        out.append(f'{name}_bucket{{{lab}le="{le}"}} {acc}')
+    out.append(f'{name}_bucket{{{lab}le="+Inf"}} {n}')
+    sel = "{" + labels + "}" if labels else ""
+    out.append(f"{name}_sum{sel} {s:.6f}")
+    out.append(f"{name}_count{sel} {n}")
+    return out
@@ -0,0 +1,111 @@
+# cloud/loadtest.py
+# Concurrent-stream load test for POST /ingest_bin. One thread per stream,
+# each on its own keep-alive http.client connection, sending binary records
+# (wire.py layout) back to back or paced at --fps. Runs each entry of
+# --streams in turn so throughput scaling with concurrency is visible.
+#
+#   python loadtest.py --host localhost --port 8000 --streams 1,2,4,8,16 --seconds 10
+#   python loadtest.py --streams 8 --jpeg 1280x720      # include pixels (annotation path)
+import argparse, http.client, json, threading, time, zlib
+import numpy as np
+
+from wire import MAGIC, VERSION, HDR, DET
+
+def make_record(stream_id, frame_id, ts, w, h, dets, jpeg=b""):
+    sid = stream_id.encode("utf-8")
+    hdr = HDR.pack(MAGIC, VERSION, 0, len(sid), frame_id & 0xFFFFFFFF, ts, time.time(),
+                   w, h, len(dets), len(jpeg))
+    return b"".join((hdr, sid, dets.tobytes(), jpeg))
+
+def fake_dets(rng, n, w, h, i):
+    d = np.zeros(n, dtype=DET)
+    x = (np.arange(n) * (w // max(1, n)) + 3 * i) % max(1, w - 80)
+    d["x1"], d["y1"] = x, h // 4
+    d["x2"], d["y2"] = x + 80, h // 4 + 180
+    d["score"] = rng.uniform(0.5, 0.99, n)
+    return d
+
+def _stream(args, stream_id, stop_at, jpeg, out):
+    rng = np.random.default_rng(zlib.crc32(stream_id.encode()))
+    conn = http.client.HTTPConnection(args.host, args.port, timeout=10)
+    lat, errors, i = [], 0, 0
+    period = 1.0 / args.fps if args.fps > 0 else 0.0
+    t_next = time.time()
+    while time.time() < stop_at:
+        body = make_record(stream_id, i, time.time(), args.width, args.height,
+                           fake_dets(rng, args.dets, args.width, args.height, i), jpeg)
+        t0 = time.perf_counter()
+        try:
+            headers = {"Content-Type": "application/octet-stream"}
+            if args.stream_header:
+                headers["X-Stream-Id"] = stream_id
+            conn.request("POST", "/ingest_bin", body, headers)
+            r = conn.getresponse()
+            r.read()
+            if r.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(args.host, args.port, timeout=10)
+        lat.append((time.perf_counter() - t0) * 1e3)
+        i += 1
+        if period:
+            t_next += period
+            time.sleep(max(0.0, t_next - time.time()))
+    conn.close()
+    out.append((lat, errors))
+
+def run_level(args, n_streams, jpeg):
+    out, threads = [], []
+    t0 = time.time()
+    stop_at = t0 + args.seconds
+    for k in range(n_streams):
+        th = threading.Thread(target=_stream, args=(args, f"load-{k}", stop_at, jpeg, out))
+        th.start()
+        threads.append(th)
+    for th in threads:
+        th.join()
+    wall = time.time() - t0
+    lat = np.concatenate([np.asarray(l, dtype=np.float64) for l, _ in out if l]) if out else np.zeros(0)
+    errors = sum(e for _, e in out)
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if lat.size else (0, 0, 0)
+    return {"streams": n_streams, "frames": int(lat.size), "errors": errors,
+            "fps": round(lat.size / wall, 1), "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--streams", default="1,2,4,8", help="comma list of concurrent stream counts")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--fps", type=float, default=0.0, help="per-stream pacing; 0 = closed loop")
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=720)
+    ap.add_argument("--dets", type=int, default=4)
+    ap.add_argument("--jpeg", default="", help="WxH: attach a JPEG of that size to every record")
+    ap.add_argument("--stream-header", action="store_true", help="send X-Stream-Id (router skips the record peek)")
+    ap.add_argument("--json", default="")
+    args = ap.parse_args()
+
+    jpeg = b""
+    if args.jpeg:
+        import cv2
+        jw, jh = map(int, args.jpeg.lower().split("x"))
+        img = np.random.default_rng(0).integers(0, 255, (jh, jw, 3), dtype=np.uint8)
+        jpeg = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 80])[1].tobytes()
+
+    rows = []
+    print(f"{'streams':>8}{'frames':>9}{'fps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}")
+    for n in [int(x) for x in args.streams.split(",") if x.strip()]:
+        r = run_level(args, n, jpeg)
+        rows.append(r)
+        print(f"{r['streams']:>8}{r['frames']:>9}{r['fps']:>9.1f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['errors']:>8}", flush=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# cloud/metrics.py
+# In-process latency histograms + counters, exposed as Prometheus text on GET /metrics,
+# and the buffered CSV sink behind cloud_metrics.csv.
+import os, csv, threading, time
+import psutil
+
+from histogram import LogHistogram, prom_histogram
+
+class CloudMetrics:
+    """Ingest / e2e latency histograms and frame counters; record calls are cheap and lock-light."""
+    def __init__(self):
+        self.ingest_ms = LogHistogram()
+        self.e2e_ms = LogHistogram()
+        self.counters = {"cloud_frames_total": 0, "cloud_frames_with_image_total": 0,
+                         "cloud_frames_replayed_total": 0, "cloud_frames_rejected_total": 0}
+        self._lock = threading.Lock()
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_frame(self, cloud_latency_ms, e2e_ms, has_pixels=False, replay=False):
+        self.ingest_ms.record(cloud_latency_ms)
+        with self._lock:
+            self.counters["cloud_frames_total"] += 1
+            self.counters["cloud_frames_with_image_total"] += int(has_pixels)
+            self.counters["cloud_frames_replayed_total"] += int(replay)
+        if not replay:          # late spool replays would swamp the live e2e distribution
+            self.e2e_ms.record(e2e_ms)
+
+    def prometheus_text(self, gauges=None):
+        lines = ["# TYPE cloud_ingest_latency_ms histogram"]
+        lines += prom_histogram("cloud_ingest_latency_ms", self.ingest_ms)
+        lines.append("# TYPE cloud_e2e_latency_ms histogram")
+        lines += prom_histogram("cloud_e2e_latency_ms", self.e2e_ms)
+        with self._lock:
+            counters = dict(self.counters)
+        for name, v in counters.items():
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {v}")
+        for name, v in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {v}")
+        return "\n".join(lines) + "\n"
+
+
+class CsvSink:
+    """
+    Buffered CSV writer. append() only adds a row to an in-memory list; a
+    background thread writes the buffer every `flush_every_s` (or as soon as
+    it holds `max_rows`), keeping the file open between flushes. When the
+    file passes `max_bytes` it is rotated to path.1 .. path.<keep>.
+
+    The same thread samples CPU/memory every `resource_every_s`; rows built
+    with row_with_resources() carry the latest sample instead of calling
+    psutil per request. close() flushes whatever is left.
+    """
+    def __init__(self, path, header, flush_every_s=1.0, max_rows=2048,
+                 max_bytes=64 << 20, keep=3, resource_every_s=1.0):
+        self.path = path
+        self.header = header
+        self.flush_every_s = flush_every_s
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.resource_every_s = resource_every_s
+        self.cpu_pct = 0.0
+        self.mem_pct = 0.0
+        self.rows_written = 0
+        self.rotations = 0
+        self._buf = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._f = None
+        self._w = None
+        psutil.cpu_percent(interval=None)  # prime; first call always returns 0
+        self.th = threading.Thread(target=self._run, daemon=True)
+        self.th.start()
+
+    def append(self, row):
+        with self._lock:
+            self._buf.append(row)
+            full = len(self._buf) >= self.max_rows
+        if full:
+            self._wake.set()
+
+    def row_with_resources(self, *values):
+        return [*values, self.cpu_pct, self.mem_pct]
+
+    def _open(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._f = open(self.path, "a", newline="")
+        self._w = csv.writer(self._f)
+        if new and self.header:
+            self._w.writerow(self.header)
+
+    def _rotate(self):
+        self._f.close()
+        self._f = None
+        for i in range(self.keep - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.rotations += 1
+        self._open()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buf = self._buf, []
+        if not rows:
+            return
+        if self._f is None:
+            self._open()
+        self._w.writerows(rows)
+        self._f.flush()
+        self.rows_written += len(rows)
+        if self.max_bytes and self._f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        next_res = time.time()
+        while not self._stop.is_set():
+            now = time.time()
+            if now >= next_res:
+                self.cpu_pct = psutil.cpu_percent(interval=None)
+                self.mem_pct = psutil.virtual_memory().percent
+                next_res = now + self.resource_every_s
+            try:
+                self.flush()
+            except OSError:
+                pass
+            self._wake.wait(min(self.flush_every_s, max(0.0, next_res - time.time())))
+            self._wake.clear()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self.th.join(timeout=5)
+        try:
+            self.flush()
+        finally:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
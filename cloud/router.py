@@ -0,0 +1,380 @@
+# cloud/router.py
+# Sharded cloud. All per-stream state in server.py (trackers, hit maps,
+# activity, annotation writers) lives in process globals, so instead of
+# uvicorn --workers we run N independent server:app processes, each on its
+# own unix socket, and this router in front. A consistent-hash ring over
+# stream_id gives every stream one owner; adding a worker only moves the
+# streams that land on its new ring points (~1/N), the rest stay put.
+#
+# Routing key: the X-Stream-Id header (set by the edge sender), else the
+# stream_id of each binary record (mixed-stream /ingest_bin bodies are split
+# per owner and the results merged back in request order), else the
+# stream_id form field for the multipart endpoints.
+#
+#   python router.py --workers 4 --port 8000        # spawns the workers, then routes
+#   CLOUD_WORKERS=4 uvicorn router:app --port 8000  # route to workers started elsewhere
+import argparse, asyncio, bisect, hashlib, json, os, re, subprocess, sys, threading, time
+from urllib.parse import quote
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from wire import record_spans
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node (md5, 64-bit)."""
+    def __init__(self, nodes=(), vnodes=64):
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._owners: List[str] = []
+        for n in nodes:
+            self.add(n)
+
+    @staticmethod
+    def _hash(s):
+        return int.from_bytes(hashlib.md5(s.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, node):
+        for v in range(self.vnodes):
+            k = self._hash(f"{node}#{v}")
+            i = bisect.bisect(self._keys, k)
+            self._keys.insert(i, k)
+            self._owners.insert(i, node)
+
+    def remove(self, node):
+        keep = [(k, o) for k, o in zip(self._keys, self._owners) if o != node]
+        self._keys = [k for k, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def owner(self, key):
+        if not self._keys:
+            raise LookupError("empty ring")
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[i]
+
+    @property
+    def nodes(self):
+        return sorted(set(self._owners))
+
+
+class ShardClient:
+    """
+    Minimal async HTTP/1.1 client for one worker's unix socket, with a pool
+    of keep-alive connections (at most `max_conns` requests in flight).
+    """
+    def __init__(self, name, path, max_conns=64):
+        self.name = name
+        self.path = path
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._max_conns = max_conns
+
+    async def _connect(self):
+        while self._idle:
+            r, w = self._idle.pop()
+            if not w.is_closing() and not r.at_eof():
+                return r, w, True
+        r, w = await asyncio.open_unix_connection(self.path)
+        return r, w, False
+
+    async def request(self, method, path, body=b"", headers=None):
+        """(status, headers, body); raises OSError if the worker is unreachable."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._max_conns)   # bound to the running loop
+        head = [f"{method} {path} HTTP/1.1", "Host: shard", f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        head = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+        async with self._sem:
+            while True:
+                r, w, reused = await self._connect()
+                try:
+                    w.write(head)
+                    if body:
+                        w.write(body)
+                    await w.drain()
+                except ConnectionError:
+                    w.close()
+                    if reused:
+                        continue        # stale keep-alive connection; the request never went out
+                    raise ConnectionResetError(f"{self.name} unreachable")
+                try:
+                    status_line = await r.readline()
+                    if not status_line:
+                        raise ConnectionResetError("closed before response")
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    w.close()
+                    # the request was written and may have been processed: only GETs are safe to repeat
+                    if reused and method == "GET":
+                        continue
+                    raise ConnectionResetError(f"{self.name} closed the connection before responding")
+                try:
+                    status, hdrs, data = await self._read_response(r, status_line)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                    w.close()
+                    raise ConnectionResetError(f"bad response: {e}")
+                if hdrs.get("connection", "").lower() == "close":
+                    w.close()
+                else:
+                    self._idle.append((r, w))
+                return status, hdrs, data
+
+    @staticmethod
+    async def _read_response(r, status_line):
+        status = int(status_line.split()[1])
+        hdrs = {}
+        while True:
+            line = await r.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            hdrs[k.strip().lower()] = v.strip()
+        if hdrs.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                n = int((await r.readline()).split(b";")[0], 16)
+                if n == 0:
+                    await r.readline()
+                    break
+                chunks.append(await r.readexactly(n))
+                await r.readexactly(2)
+            return status, hdrs, b"".join(chunks)
+        return status, hdrs, await r.readexactly(int(hdrs.get("content-length", "0")))
+
+    def close(self):
+        for _, w in self._idle:
+            w.close()
+        self._idle.clear()
+
+
+# -----------------
+# Config (via env)
+# -----------------
+CLOUD_WORKERS = int(os.getenv("CLOUD_WORKERS", "2"))
+SHARD_DIR     = os.getenv("SHARD_DIR", "/tmp/cloud-shards")     # one <name>.sock per worker
+SHARD_VNODES  = int(os.getenv("SHARD_VNODES", "64"))            # ring points per worker
+
+RING = HashRing()
+SHARDS: Dict[str, ShardClient] = {}
+COUNTS = {"requests": {}, "split": 0, "errors": 0}
+
+def shard_names(n):
+    return [f"w{i}" for i in range(n)]
+
+def shard_socket(name, shard_dir=None):
+    return os.path.join(shard_dir or SHARD_DIR, f"{name}.sock")
+
+def configure(workers, shard_dir=SHARD_DIR, vnodes=SHARD_VNODES):
+    global RING, SHARDS
+    names = shard_names(workers)
+    RING = HashRing(names, vnodes=vnodes)
+    SHARDS = {n: ShardClient(n, shard_socket(n, shard_dir)) for n in names}
+
+configure(CLOUD_WORKERS)
+
+# =========
+# FastAPI
+# =========
+app = FastAPI(title="Cloud Router")
+
+_FORM_SID = re.compile(rb'name="stream_id"\r\n\r\n([^\r\n]*)\r\n')
+_META_SID = re.compile(rb'"stream_id":\s*"((?:[^"\\]|\\.)*)"')
+
+def _form_stream_id(body):
+    # multipart: the stream_id field, else the first meta entry's stream_id (batches);
+    # raises ValueError on a malformed JSON escape
+    m = _FORM_SID.search(body) or _META_SID.search(body)
+    return json.loads(b'"' + m.group(1) + b'"') if m else "default"
+
+def _sid_header(sid):
+    # client-supplied: percent-encode so CR/LF can't inject headers and non-latin-1 can't fail the encode
+    return quote(sid, safe="-_.:@#")
+
+async def _send(shard, path, body, headers):
+    COUNTS["requests"][shard] = COUNTS["requests"].get(shard, 0) + 1
+    try:
+        return await SHARDS[shard].request("POST", path, body, headers)
+    except OSError:
+        COUNTS["errors"] += 1
+        return 503, {"content-type": "application/json"}, json.dumps(
+            {"error": "shard_unavailable", "shard": shard}).encode()
+
+def _response(status, hdrs, data):
+    return Response(content=data, status_code=status, media_type=hdrs.get("content-type"))
+
+async def _forward_one(request, path, sid):
+    body = await request.body()
+    headers = {"Content-Type": request.headers.get("content-type", "application/octet-stream"),
+               "X-Stream-Id": _sid_header(sid)}
+    return _response(*await _send(RING.owner(sid), path, body, headers))
+
+async def _request_sid(request):
+    sid = request.headers.get("x-stream-id")
+    if sid is None:
+        sid = _form_stream_id(await request.body())
+    sid.encode("utf-8")     # lone surrogates from a \ud800 escape: UnicodeEncodeError (a ValueError)
+    return sid
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    try:
+        sid = await _request_sid(request)
+    except ValueError:
+        return JSONResponse({"error": "bad_stream_id"}, status_code=400)
+    return await _forward_one(request, "/ingest", sid)
+
+@app.post("/ingest_batch")
+async def ingest_batch(request: Request):
+    # edge senders post one stream per multipart batch; without the header the first entry decides
+    try:
+        sid = await _request_sid(request)
+    except ValueError:
+        return JSONResponse({"error": "bad_stream_id"}, status_code=400)
+    return await _forward_one(request, "/ingest_batch", sid)
+
+@app.post("/ingest_bin")
+async def ingest_bin(request: Request):
+    sid = request.headers.get("x-stream-id")
+    if sid is not None:
+        return await _forward_one(request, "/ingest_bin", sid)
+    body = await request.body()
+    try:
+        spans = record_spans(body)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad_record: {e}"}, status_code=400)
+    groups: Dict[str, List[int]] = {}
+    for i, (s, _, _) in enumerate(spans):
+        groups.setdefault(RING.owner(s), []).append(i)
+    headers = {"Content-Type": "application/octet-stream"}
+    if len(groups) <= 1:
+        shard = next(iter(groups), RING.owner("default"))
+        return _response(*await _send(shard, "/ingest_bin", body, headers))
+
+    # mixed owners: split per shard (record order kept within each), merge results by index
+    COUNTS["split"] += 1
+    mv = memoryview(body)
+    shards = list(groups)
+    replies = await asyncio.gather(*(
+        _send(sh, "/ingest_bin", b"".join(mv[spans[i][1]:spans[i][2]] for i in groups[sh]), headers)
+        for sh in shards))
+    results = [None] * len(spans)
+    for sh, (status, _, data) in zip(shards, replies):
+        res = json.loads(data).get("results", []) if status == 200 else []
+        for k, i in enumerate(groups[sh]):
+            results[i] = res[k] if k < len(res) else {"ok": False, "error": f"shard_{status}"}
+    return {"ok": True, "results": results}
+
+@app.get("/health")
+async def health():
+    async def one(name):
+        try:
+            status, _, _ = await SHARDS[name].request("GET", "/health")
+            return status == 200
+        except OSError:
+            return False
+    names = list(SHARDS)
+    up = dict(zip(names, await asyncio.gather(*(one(n) for n in names))))
+    return {"status": "ok" if all(up.values()) else "degraded", "workers": up}
+
+def _relabel(text, shard, seen_types):
+    # tag every sample with shard="wN"; keep one # TYPE line per metric family
+    out = []
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith("#"):
+            if line not in seen_types:
+                seen_types.add(line)
+                out.append(line)
+            continue
+        name, _, rest = line.partition(" ")
+        if "{" in name:
+            name = name.replace("{", f'{{shard="{shard}",', 1)
+        else:
+            name = f'{name}{{shard="{shard}"}}'
+        out.append(f"{name} {rest}")
+    return out
+
+@app.get("/metrics")
+async def metrics():
+    names = list(SHARDS)
+
+    async def one(name):
+        try:
+            status, _, data = await SHARDS[name].request("GET", "/metrics")
+            return data.decode("utf-8") if status == 200 else ""
+        except OSError:
+            return ""
+    lines, seen = [], set()
+    for name, text in zip(names, await asyncio.gather(*(one(n) for n in names))):
+        lines += _relabel(text, name, seen)
+    lines.append("# TYPE cloud_router_requests_total counter")
+    lines += [f'cloud_router_requests_total{{shard="{n}"}} {COUNTS["requests"].get(n, 0)}' for n in names]
+    lines.append("# TYPE cloud_router_split_total counter")
+    lines.append(f"cloud_router_split_total {COUNTS['split']}")
+    lines.append("# TYPE cloud_router_errors_total counter")
+    lines.append(f"cloud_router_errors_total {COUNTS['errors']}")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+# ---------
+# Launcher
+# ---------
+def spawn_worker(name, shard_dir):
+    sock = shard_socket(name, shard_dir)
+    if os.path.exists(sock):
+        os.unlink(sock)
+    env = dict(os.environ, SHARD_ID=name)      # server.py names its CSV after the shard
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--uds", sock,
+                             "--log-level", "warning"], cwd=HERE, env=env)
+
+def wait_ready(names, shard_dir, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if all(os.path.exists(shard_socket(n, shard_dir)) for n in names):
+            return True
+        time.sleep(0.1)
+    return False
+
+def _supervise(procs, shard_dir, stop):
+    # a crashed worker comes back on the same socket, so it keeps its slice of the ring
+    while not stop.wait(1.0):
+        for name, p in list(procs.items()):
+            if p.poll() is not None:
+                print(f"[ROUTER] worker {name} exited ({p.returncode}); restarting", flush=True)
+                procs[name] = spawn_worker(name, shard_dir)
+
+def main():
+    import uvicorn
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=CLOUD_WORKERS)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--shard-dir", default=SHARD_DIR)
+    ap.add_argument("--vnodes", type=int, default=SHARD_VNODES)
+    args = ap.parse_args()
+
+    os.makedirs(args.shard_dir, exist_ok=True)
+    configure(args.workers, args.shard_dir, args.vnodes)
+    names = shard_names(args.workers)
+    procs = {n: spawn_worker(n, args.shard_dir) for n in names}
+    stop = threading.Event()
+    try:
+        if not wait_ready(names, args.shard_dir):
+            raise RuntimeError("workers did not come up")
+        threading.Thread(target=_supervise, args=(procs, args.shard_dir, stop), daemon=True).start()
+        print(f"[ROUTER] {args.workers} workers ready; listening on {args.host}:{args.port}", flush=True)
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    finally:
+        stop.set()
+        for p in procs.values():
+            p.terminate()           # SIGTERM: workers run their atexit flushes
+        for p in procs.values():
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+if __name__ == "__main__":
+    main()
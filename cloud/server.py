@@ -1,30 +1,21 @@
 # cloud/server.py
-import os, time, json, csv
-from typing import Dict
-from fastapi import FastAPI, UploadFile, Form
-from fastapi.responses import JSONResponse
-import numpy as np, cv2, psutil
+import os, time, json, asyncio
+from typing import Dict, List, Optional
+from fastapi import FastAPI, UploadFile, Form, File, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+import numpy as np, cv2
 
-from tracker import Tracker
-from activity import classify_activity, forget_track  # walking / stationary only
-from annotator import ActivityAnnotator               # writes AVI
+from tracker import Tracker, KalmanTracker, iou_matrix, make_tracker
+from activity import ActivityEngine                    # walking / stationary only
+from annotator import AnnotationService              # per-stream background AVI writers
+from wire import decode_records, jpeg_size, FLAG_REPLAY            # binary ingest protocol
+from metrics import CloudMetrics, CsvSink                         # /metrics histograms + counters, CSV sink
+from executor import StreamExecutors                              # per-stream serial workers
+from snapshot import SnapshotWriter, dump_stream, read_snapshot    # warm-restart state
 
 # =========================
 # Ghost-track control utils
 # =========================
-def _iou(a, b):
-    ax1, ay1, ax2, ay2 = a
-    bx1, by1, bx2, by2 = b
-    x1, y1 = max(ax1, bx1), max(ay1, by1)
-    x2, y2 = min(ax2, bx2), min(ay2, by2)
-    iw, ih = max(0, x2 - x1), max(0, y2 - y1)
-    inter = iw * ih
-    if inter <= 0:
-        return 0.0
-    area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
-    area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
-    return inter / max(1e-6, area_a + area_b - inter)
-
 # Last time each track had a real detection hit (not just prediction)
 LAST_HIT: Dict[str, Dict[int, float]] = {}   # stream_id -> {track_id: last_detection_time}
 # Consecutive hit counter to draw only stable tracks
@@ -38,6 +29,8 @@ RESULTS_DIR = "/results"
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
 TRACKERS: Dict[str, Tracker] = {}  # stream_id -> Tracker
+ACTIVITY: Dict[str, ActivityEngine] = {}  # stream_id -> per-stream activity state
+METRICS = CloudMetrics()
 
 # -----------------
 # Tunables (via env)
@@ -47,65 +40,177 @@ STALE_DRAW_S          = float(os.getenv("STALE_DRAW_S",          "0.8"))   # hid
 STALE_FORGET_S        = float(os.getenv("STALE_FORGET_S",        "2.0"))   # forget track state after this long
 MIN_HITS_BEFORE_DRAW  = int(os.getenv("MIN_HITS_BEFORE_DRAW",    "3"))     # need N consecutive hits to draw
 MAX_DRAW_PER_FRAME    = int(os.getenv("MAX_DRAW_PER_FRAME",      "6"))     # cap boxes per frame in overlay
+TRACK_MAX_MISSED      = int(os.getenv("TRACK_MAX_MISSED",        "30"))    # drop tracks after N unmatched updates
+TRACK_MAX_AGE_S       = float(os.getenv("TRACK_MAX_AGE_S",       "5.0"))   # ... or this long (capture time) unmatched
+TRACK_MODE            = os.getenv("TRACK_MODE", "iou")                    # iou | kalman (predicts across sparse frames)
+ACT_IDLE_S            = float(os.getenv("ACT_IDLE_S",            "10.0"))  # evict activity state unseen this long
+ACT_MAX_TRACKS        = int(os.getenv("ACT_MAX_TRACKS",          "256"))   # activity slots per stream (LRU beyond)
 
 ACT_ANNOTATE          = os.getenv("ACT_ANNOTATE", "0") in ("1", "true", "True")
 ACT_ANNOTATE_FPS      = int(os.getenv("ACT_ANNOTATE_FPS", "15"))
 OUT_PATH              = os.getenv("ACT_ANNOTATE_OUT", "/results/annotated_activity.avi")
-ANNOT = ActivityAnnotator(OUT_PATH, fps=ACT_ANNOTATE_FPS) if ACT_ANNOTATE else None
+ACT_ANNOTATE_QSIZE    = int(os.getenv("ACT_ANNOTATE_QSIZE",      "8"))     # per-stream frames waiting to be written
+ACT_SEGMENT_S         = float(os.getenv("ACT_SEGMENT_S",         "0"))     # rotate AVI segments by time (0 = off)
+ACT_SEGMENT_MB        = float(os.getenv("ACT_SEGMENT_MB",        "0"))     # ... or by size (0 = off)
+ANNOT = AnnotationService(OUT_PATH, fps=ACT_ANNOTATE_FPS, qsize=ACT_ANNOTATE_QSIZE,
+                          segment_s=ACT_SEGMENT_S,
+                          segment_bytes=int(ACT_SEGMENT_MB * (1 << 20))) if ACT_ANNOTATE else None
+# Metadata-only edges: ask for a full frame at most this often per stream (annotation on; 0 = never)
+ANNOT_FRAME_EVERY_S   = float(os.getenv("ANNOT_FRAME_EVERY_S",   "0.0"))
+LAST_FRAME: Dict[str, float] = {}  # stream_id -> last time pixels arrived
+# Ingest work (decode, tracking, activity, CSV, annotation) runs off the event loop
+INGEST_WORKERS        = int(os.getenv("INGEST_WORKERS", str(min(8, os.cpu_count() or 4))))
+EXEC = StreamExecutors(INGEST_WORKERS)
+# Buffered metrics CSV: rows are flushed in batches off the request path
+CSV_FLUSH_S           = float(os.getenv("CSV_FLUSH_S",           "1.0"))
+CSV_MAX_MB            = float(os.getenv("CSV_MAX_MB",            "64"))    # rotate cloud_metrics.csv past this
+# Sharded mode (router.py): each worker owns a slice of the streams and writes its own CSV
+SHARD_ID              = os.getenv("SHARD_ID", "")
+METRICS_CSV = CsvSink(f"{RESULTS_DIR}/cloud_metrics{'.' + SHARD_ID if SHARD_ID else ''}.csv", ["ts", "cloud_latency_ms", "cpu_pct", "mem_pct"],
+                      flush_every_s=CSV_FLUSH_S, max_bytes=int(CSV_MAX_MB * (1 << 20)))
 
-def write_csv(path, row, header=None):
-    exists = os.path.exists(path)
-    with open(path, "a", newline="") as f:
-        w = csv.writer(f)
-        if not exists and header:
-            w.writerow(header)
-        w.writerow(row)
+# Warm restart: per-stream tracker / hit maps / activity snapshotted in the background
+SNAPSHOT_PATH         = os.getenv("SNAPSHOT_PATH",
+                                  f"{RESULTS_DIR}/state/cloud_state{'.' + SHARD_ID if SHARD_ID else ''}.snap")
+SNAPSHOT_EVERY_S      = float(os.getenv("SNAPSHOT_EVERY_S",      "5.0"))   # 0 = no snapshots
+SNAPSHOT_MAX_AGE_S    = float(os.getenv("SNAPSHOT_MAX_AGE_S",    "30.0"))  # ignore state older than this on load
 
-# -------
-# Ingest
-# -------
-@app.post("/ingest")
-async def ingest(
-    image: UploadFile,
-    ts_capture: str = Form(...),
-    ts_edge_send: str = Form(...),
-    stream_id: str = Form("default"),
-    detections: str = Form("[]")
-):
-    cloud_t0 = time.time()
+# Spool replays ("<stream>#replay", see /ingest_bin) get their own tracker while they drain;
+# it is torn down once no replayed frame has arrived for this long
+REPLAY_IDLE_S         = float(os.getenv("REPLAY_IDLE_S",         "30.0"))
+REPLAY_SEEN: Dict[str, float] = {}  # replay stream_id -> last replayed frame (cloud time)
+_REPLAY_SWEEP = {"next": 0.0}
+
+def _is_replay(stream_id):
+    return stream_id.endswith("#replay")
+
+def _drop_replay(sid):
+    # runs on the stream's executor, so no frame of it is mid-update
+    if time.time() - REPLAY_SEEN.get(sid, 0.0) < REPLAY_IDLE_S:
+        return      # replay resumed since the sweep
+    for state in (TRACKERS, ACTIVITY, LAST_HIT, HIT_COUNT, LAST_FRAME, REPLAY_SEEN):
+        state.pop(sid, None)
 
-    # Decode image
-    img_bytes = await image.read()
+def _sweep_replays(now):
+    if now < _REPLAY_SWEEP["next"]:
+        return
+    _REPLAY_SWEEP["next"] = now + 1.0
+    for sid, t in list(REPLAY_SEEN.items()):
+        if now - t >= REPLAY_IDLE_S:
+            EXEC.submit(sid, _drop_replay, sid)
+
+def _new_tracker(kalman=None):
+    mode = TRACK_MODE if kalman is None else ("kalman" if kalman else "iou")
+    return make_tracker(mode, max_missed=TRACK_MAX_MISSED, max_age_s=TRACK_MAX_AGE_S)
+
+def _new_activity():
+    return ActivityEngine(idle_s=ACT_IDLE_S, max_tracks=ACT_MAX_TRACKS)
+
+def _dump_stream(sid):
+    return dump_stream(sid, TRACKERS[sid], LAST_HIT.get(sid, {}), HIT_COUNT.get(sid, {}), ACTIVITY.get(sid))
+
+def _collect_snapshot():
+    # each stream is serialised on its own executor, between frames, so no locks are needed;
+    # replay trackers are transient and not worth restoring
+    futs = [EXEC.submit(sid, _dump_stream, sid) for sid in list(TRACKERS) if not _is_replay(sid)]
+    return [f.result(timeout=10) for f in futs]
+
+def _restore_state():
+    t0 = time.perf_counter()
+    state = read_snapshot(SNAPSHOT_PATH, _new_tracker, _new_activity, SNAPSHOT_MAX_AGE_S)
+    kalman = TRACK_MODE == "kalman"
+    for sid, (trk, hits, cnts, act) in state.items():
+        if isinstance(trk, KalmanTracker) != kalman:
+            continue    # TRACK_MODE changed since the snapshot; this stream starts cold
+        TRACKERS[sid], LAST_HIT[sid], HIT_COUNT[sid], ACTIVITY[sid] = trk, hits, cnts, act
+    if state:
+        print(f"[CLOUD] restored {len(TRACKERS)} streams, {sum(len(t.tracks) for t in TRACKERS.values())} tracks "
+              f"from {SNAPSHOT_PATH} in {(time.perf_counter() - t0) * 1000:.1f} ms", flush=True)
+
+SNAPSHOT = None
+if SNAPSHOT_EVERY_S > 0:
+    _restore_state()
+    SNAPSHOT = SnapshotWriter(SNAPSHOT_PATH, _collect_snapshot, every_s=SNAPSHOT_EVERY_S)
+
+def _decode(img_bytes):
     img_arr = np.frombuffer(img_bytes, dtype=np.uint8)
-    frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
-    if frame is None:
-        return JSONResponse({"error": "decode_failed"}, status_code=400)
-    h, w = frame.shape[:2]
+    return cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
 
-    ts_cap = float(ts_capture)
+def _boxes(dets):
+    # JSON detections [{"x1","y1","x2","y2","score"}, ...] -> [(x1,y1,x2,y2), ...]
+    return [(d["x1"], d["y1"], d["x2"], d["y2"]) for d in dets]
+
+def _frame_size(image, width=0, height=0):
+    # (h, w) from explicit fields, else from the JPEG header; never decodes pixels
+    if width and height:
+        return (int(height), int(width))
+    if image:
+        return jpeg_size(image)
+    return None
+
+def _render(size, image=None, parts=None):
+    """
+    Full-res BGR frame for annotation. A downscaled `image` is resized back to
+    `size`; crop `parts` [(x, y, w, h, jpeg), ...] are pasted at their offsets
+    on a black canvas. Detection coordinates are full-res either way.
+    """
+    h, w = size
+    if image:
+        frame = _decode(image)
+        if frame is not None and frame.shape[:2] != (h, w):
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_LINEAR)
+        return frame
+    frame = np.zeros((h, w, 3), np.uint8)
+    for (x, y, pw, ph, jpg) in parts or ():
+        crop = _decode(jpg)
+        if crop is None:
+            continue
+        pw, ph = min(pw, w - x), min(ph, h - y)
+        if pw <= 0 or ph <= 0:
+            continue
+        if crop.shape[:2] != (ph, pw):
+            crop = cv2.resize(crop, (pw, ph), interpolation=cv2.INTER_LINEAR)
+        frame[y:y + ph, x:x + pw] = crop
+    return frame
+
+def process_frame(stream_id, size, ts_cap, det_boxes, cloud_t0, image=None, parts=None):
+    """
+    Track, classify, log and annotate one frame of `stream_id`.
+    Tracking and activity only need the boxes and `size` (h, w); the JPEG
+    `image` or crop `parts` (optional) are decoded only when annotating.
+    Runs on the stream's executor (see submit_frames), never on the event loop.
+    """
+    h, w = size
 
     # Per-stream tracker & state
-    trk = TRACKERS.get(stream_id) or Tracker()
+    act = ACTIVITY.get(stream_id) or _new_activity()
+    ACTIVITY[stream_id] = act
+    trk = TRACKERS.get(stream_id) or _new_tracker()
     TRACKERS[stream_id] = trk
     LAST_HIT.setdefault(stream_id, {})
     HIT_COUNT.setdefault(stream_id, {})
 
-    # Parse detections and update tracker
-    dets = json.loads(detections)
-    det_boxes = [(d["x1"], d["y1"], d["x2"], d["y2"]) for d in dets]
+    # Update tracker with this frame's detections
     trks = trk.update(det_boxes, ts_cap)
 
     now = time.time()
     hit_map = LAST_HIT[stream_id]
     cnt_map = HIT_COUNT[stream_id]
-    acts = []
     items = []
 
+    # Tracks the tracker expired: release their per-track state now
+    for tid in trk.expired:
+        hit_map.pop(tid, None)
+        cnt_map.pop(tid, None)
+        act.forget(tid)
+
     # For each track, require an IoU hit with any current detection.
     # Only classify/draw "fresh" AND "stable" tracks.
-    for tr in trks:
+    best_iou = (iou_matrix([tr.box for tr in trks], det_boxes).max(axis=1)
+                if trks and det_boxes else np.zeros(len(trks)))
+    for tr, tr_iou in zip(trks, best_iou):
         box = tuple(map(int, tr.box))
-        matched = any(_iou(box, db) >= IOU_DRAW_THR for db in det_boxes)
+        matched = tr_iou >= IOU_DRAW_THR
         if matched:
             hit_map[tr.id] = now
             cnt_map[tr.id] = cnt_map.get(tr.id, 0) + 1
@@ -115,47 +220,177 @@ async def ingest(
 
         last_hit = hit_map.get(tr.id, 0.0)
         if (now - last_hit) <= STALE_DRAW_S and cnt_map.get(tr.id, 0) >= MIN_HITS_BEFORE_DRAW:
-            lbl = classify_activity(tr, now=now, frame_size=(h, w))  # walking / stationary
-            acts.append((tr.id, lbl))
-            items.append((box, tr.id, lbl))
+            items.append((box, tr.id))
         # else: skip stale or unstable tracks this frame
 
+    # walking / stationary for every fresh + stable track in one call
+    labels = act.classify([tid for _, tid in items], [b for b, _ in items], now=now, frame_size=(h, w))
+    items = [(box, tid, lbl) for (box, tid), lbl in zip(items, labels)]
+    acts = [(tid, lbl) for _, tid, lbl in items]
+
     # Forget very stale tracks entirely
     forget_cut = now - STALE_FORGET_S
     for tid, tlast in list(hit_map.items()):
         if tlast < forget_cut:
             hit_map.pop(tid, None)
             cnt_map.pop(tid, None)
-            try:
-                forget_track(tid)
-            except Exception:
-                pass
+            act.forget(tid)
 
     # Metrics
     cloud_latency_ms = (time.time() - cloud_t0) * 1000.0
     e2e_est_ms = (now - ts_cap) * 1000.0
-    write_csv(
-        f"{RESULTS_DIR}/cloud_metrics.csv",
-        [time.time(), cloud_latency_ms, psutil.cpu_percent(), psutil.virtual_memory().percent],
-        header=["ts", "cloud_latency_ms", "cpu_pct", "mem_pct"],
-    )
-
-    # Annotation: cap by area to reduce clutter
-    if ANNOT is not None and items:
+    replay = _is_replay(stream_id)
+    METRICS.observe_frame(cloud_latency_ms, e2e_est_ms, has_pixels=bool(image) or bool(parts),
+                          replay=replay)
+    if replay:
+        REPLAY_SEEN[stream_id] = now
+    _sweep_replays(now)
+    METRICS_CSV.append(METRICS_CSV.row_with_resources(time.time(), cloud_latency_ms))
+
+    # Annotation: cap by area to reduce clutter; late replayed frames are not annotated
+    want_frame = False
+    has_pixels = bool(image) or bool(parts)
+    if ANNOT is not None and not replay:
+        if has_pixels:
+            LAST_FRAME[stream_id] = now
+        else:
+            want_frame = (ANNOT_FRAME_EVERY_S > 0
+                          and (now - LAST_FRAME.get(stream_id, 0.0)) >= ANNOT_FRAME_EVERY_S)
+    if ANNOT is not None and not replay and items and has_pixels:
         items.sort(key=lambda it: (it[0][2] - it[0][0]) * (it[0][3] - it[0][1]), reverse=True)
         items = items[:MAX_DRAW_PER_FRAME]
-        try:
-            ANNOT.draw(frame, items)
-        except Exception:
-            pass
+        # decode + draw + write happen on the stream's annotation thread
+        ANNOT.submit(stream_id, lambda: _render((h, w), image, parts), items)
 
     return {
         "ok": True,
         "activities": [{"track_id": tid, "label": lbl} for tid, lbl in acts],
         "cloud_latency_ms": cloud_latency_ms,
         "e2e_est_ms": e2e_est_ms,
+        "want_frame": want_frame,
     }
 
+def _process_many(jobs):
+    # one stream's frames, already in capture order
+    return [process_frame(*args, **kw) for args, kw in jobs]
+
+async def submit_frames(jobs):
+    """
+    jobs: [(stream_id, (args, kwargs)), ...] for process_frame. Frames are
+    grouped per stream, sorted by ts_capture and run serially on that
+    stream's executor; streams run in parallel. Results in `jobs` order.
+    """
+    by_stream: Dict[str, List[int]] = {}
+    for i, (sid, (args, _)) in enumerate(jobs):
+        by_stream.setdefault(sid, []).append(i)
+    futs, groups = [], []
+    for sid, idx in by_stream.items():
+        idx.sort(key=lambda i: jobs[i][1][0][2])        # args[2] = ts_capture
+        groups.append(idx)
+        futs.append(asyncio.wrap_future(EXEC.submit(sid, _process_many, [jobs[i][1] for i in idx])))
+    results = [None] * len(jobs)
+    for idx, res in zip(groups, await asyncio.gather(*futs)):
+        for i, r in zip(idx, res):
+            results[i] = r
+    return results
+
+# -------
+# Ingest
+# -------
+@app.post("/ingest")
+async def ingest(
+    image: Optional[UploadFile] = File(None),
+    ts_capture: str = Form(...),
+    ts_edge_send: str = Form(...),
+    stream_id: str = Form("default"),
+    detections: str = Form("[]"),
+    width: int = Form(0),
+    height: int = Form(0)
+):
+    cloud_t0 = time.time()
+
+    # Frame size from the form fields or JPEG header; pixels stay encoded
+    img_bytes = await image.read() if image is not None else None
+    size = _frame_size(img_bytes, width, height)
+    if size is None:
+        METRICS.inc("cloud_frames_rejected_total")
+        return JSONResponse({"error": "no_frame_size"}, status_code=400)
+
+    args = (stream_id, size, float(ts_capture), _boxes(json.loads(detections)), cloud_t0)
+    return (await submit_frames([(stream_id, (args, {"image": img_bytes}))]))[0]
+
+@app.post("/ingest_batch")
+async def ingest_batch(
+    images: Optional[List[UploadFile]] = File(None),
+    meta: str = Form(...)
+):
+    """
+    Several frames in one request. `meta` is a JSON list, one entry per frame:
+    {"ts_capture", "ts_edge_send", "stream_id", "detections", "width", "height",
+    "has_image"}; `images` holds the JPEGs of the entries with has_image (default
+    true) in the same order. Frames are processed in capture order per
+    stream_id; results come back in request order.
+    """
+    cloud_t0 = time.time()
+    metas = json.loads(meta)
+    images = images or []
+    if sum(1 for m in metas if m.get("has_image", True)) != len(images):
+        METRICS.inc("cloud_frames_rejected_total", len(metas))
+        return JSONResponse({"error": "meta_mismatch"}, status_code=400)
+    blobs, it = [], iter(images)
+    for m in metas:
+        blobs.append(await next(it).read() if m.get("has_image", True) else None)
+
+    results, jobs, slots = [None] * len(metas), [], []
+    for i, m in enumerate(metas):
+        size = _frame_size(blobs[i], m.get("width", 0), m.get("height", 0))
+        if size is None:
+            METRICS.inc("cloud_frames_rejected_total")
+            results[i] = {"ok": False, "error": "no_frame_size"}
+            continue
+        sid = m.get("stream_id", "default")
+        args = (sid, size, float(m["ts_capture"]), _boxes(m.get("detections", [])), cloud_t0)
+        jobs.append((sid, (args, {"image": blobs[i]})))
+        slots.append(i)
+    for i, r in zip(slots, await submit_frames(jobs)):
+        results[i] = r
+    return {"ok": True, "results": results}
+
+@app.post("/ingest_bin")
+async def ingest_bin(request: Request):
+    """
+    Raw-body binary protocol (see wire.py): one or more concatenated frame
+    records, no multipart/JSON parsing. Same per-frame results and ordering
+    rules as /ingest_batch. Records without image bytes are metadata-only;
+    records with crop parts carry only padded regions around detections.
+    Records replayed from the edge spool (FLAG_REPLAY) run on their own
+    "<stream>#replay" tracker so late frames don't disturb live tracks; it is
+    never snapshotted or annotated and is dropped REPLAY_IDLE_S after the
+    replay drains.
+    """
+    cloud_t0 = time.time()
+    try:
+        recs = decode_records(await request.body())
+    except ValueError as e:
+        METRICS.inc("cloud_frames_rejected_total")
+        return JSONResponse({"error": f"bad_record: {e}"}, status_code=400)
+
+    results, jobs, slots = [None] * len(recs), [], []
+    for i, r in enumerate(recs):
+        image = r.image if len(r.image) else None
+        size = _frame_size(image, r.width, r.height)
+        if size is None:
+            METRICS.inc("cloud_frames_rejected_total")
+            results[i] = {"ok": False, "error": "no_frame_size"}
+            continue
+        sid = r.stream_id + "#replay" if r.flags & FLAG_REPLAY else r.stream_id
+        args = (sid, size, r.ts_capture, r.det_boxes(), cloud_t0)
+        jobs.append((sid, (args, {"image": image, "parts": r.parts})))
+        slots.append(i)
+    for i, r in zip(slots, await submit_frames(jobs)):
+        results[i] = r
+    return {"ok": True, "results": results}
+
 # -------
 # Health
 # -------
@@ -163,12 +398,27 @@ async def ingest(
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    # Prometheus text format; reads histogram snapshots, never blocks ingest for long
+    gauges = {"cloud_streams": len(TRACKERS)}
+    if ANNOT is not None:
+        gauges.update({f"cloud_{k}": v for k, v in ANNOT.stats().items()})
+    if SNAPSHOT is not None:
+        gauges.update({f"cloud_{k}": v for k, v in SNAPSHOT.stats().items()})
+    return PlainTextResponse(METRICS.prometheus_text(gauges),
+                             media_type="text/plain; version=0.0.4")
+
 # --------------
 # Clean shutdown
 # --------------
 import atexit
 @atexit.register
 def _close_annot():
+    if SNAPSHOT is not None:
+        SNAPSHOT.close()      # final snapshot, queued behind each stream's pending frames
+    EXEC.shutdown(wait=True)  # finish queued frames before closing the writers
+    METRICS_CSV.close()
     try:
         if ANNOT is not None:
             ANNOT.release()
@@ -0,0 +1,187 @@
+# cloud/snapshot.py
+# Compact binary snapshots of per-stream cloud state (tracker, hit maps,
+# activity engine) for warm restarts. Little-endian struct layout:
+#
+#   file     <4sBxxxdI   magic b"CSNP", version, wall time written, n_streams
+#   stream   <H sid_len, sid (utf-8), then the three sections below
+#   tracker  <BqI        kind (0 iou, 1 kalman), next_id, n_tracks
+#     track  <q4dddiiH   id, box xyxy, ts (edge clock), last hit (cloud wall time,
+#                        0 = none), missed, hits, n_history
+#            n_history x <5d (ts, cx, cy, w, h)
+#            kalman only: <4d16d2dddd  x, P, wh, kf_ts, accel_frac, meas_frac
+#   hits     <I n, then n x <qdi (track id, last hit wall time, consecutive hits)
+#   activity <I n, then n x <q5dbddd (tid, x, y, t, fast, slow, label, changed, below, seen)
+#
+# Files are written to a temp name and os.replace()d, so a crash mid-write
+# leaves the previous snapshot intact.
+import os, struct, threading, time
+from collections import deque
+import numpy as np
+
+from tracker import Track, KalmanTrack, KalmanTracker
+
+MAGIC = b"CSNP"
+VERSION = 2
+FILE = struct.Struct("<4sBxxxdI")
+SID = struct.Struct("<H")
+TRACKER = struct.Struct("<BqI")
+TRACK = struct.Struct("<q4dddiiH")
+HIST = struct.Struct("<5d")
+KALMAN = struct.Struct("<4d16d2dddd")
+COUNT = struct.Struct("<I")
+HIT = struct.Struct("<qdi")
+ACT = struct.Struct("<q5dbddd")
+
+# ---------- encode ----------
+def dump_stream(stream_id, trk, hit_map, cnt_map, act):
+    """One stream's record. Call on the stream's executor so the state is not mid-update."""
+    out = []
+    sid = stream_id.encode("utf-8")
+    out.append(SID.pack(len(sid)) + sid)
+
+    kalman = isinstance(trk, KalmanTracker)
+    out.append(TRACKER.pack(1 if kalman else 0, trk.next_id, len(trk.tracks)))
+    for tr in trk.tracks:
+        # ts is on the edge clock; restore ages tracks by the cloud-side last hit instead
+        out.append(TRACK.pack(tr.id, *map(float, tr.box), tr.ts, hit_map.get(tr.id, 0.0),
+                              tr.missed, tr.hits, len(tr.history)))
+        out.extend(HIST.pack(*h) for h in tr.history)
+        if kalman:
+            out.append(KALMAN.pack(*tr.x, *tr.P.ravel(), *tr.wh, tr.kf_ts, tr.accel_frac, tr.meas_frac))
+
+    out.append(COUNT.pack(len(hit_map)))
+    out.extend(HIT.pack(tid, t, cnt_map.get(tid, 0)) for tid, t in hit_map.items())
+
+    rows = act.state_rows() if act is not None else []
+    out.append(COUNT.pack(len(rows)))
+    out.extend(ACT.pack(*r) for r in rows)
+    return b"".join(out)
+
+def write_snapshot(path, records, wall_ts=None):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(FILE.pack(MAGIC, VERSION, time.time() if wall_ts is None else wall_ts, len(records)))
+        for rec in records:
+            f.write(rec)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# ---------- decode ----------
+def _restore_track(kalman, vals, hist, kf):
+    tid, x1, y1, x2, y2, ts, _, missed, hits, _ = vals
+    cls = KalmanTrack if kalman else Track
+    tr = cls.__new__(cls)               # fields come from the snapshot, not __init__
+    tr.id, tr.box, tr.ts = tid, (x1, y1, x2, y2), ts
+    tr.missed, tr.hits = missed, hits
+    tr.history = deque(hist, maxlen=32)
+    if kalman:
+        tr.x = np.array(kf[0:4])
+        tr.P = np.array(kf[4:20]).reshape(4, 4)
+        tr.wh = np.array(kf[20:22])
+        tr.kf_ts, tr.accel_frac, tr.meas_frac = kf[22], kf[23], kf[24]
+    return tr
+
+def read_snapshot(path, make_tracker, make_activity, max_age_s, now=None):
+    """
+    {stream_id: (tracker, hit_map, cnt_map, activity)} from `path`, or {} if
+    it is missing, unreadable or older than `max_age_s`. Tracks, hit entries
+    and activity slots last updated more than `max_age_s` ago on the cloud's
+    wall clock are dropped (tracks without a recorded hit too); streams left
+    empty are skipped. make_tracker(kalman: bool) and
+    make_activity() build the empty containers with the server's settings.
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(path, "rb") as f:
+            buf = f.read()
+        magic, ver, wall_ts, n_streams = FILE.unpack_from(buf, 0)
+    except (OSError, struct.error):
+        return {}
+    if magic != MAGIC or ver != VERSION or now - wall_ts > max_age_s:
+        return {}
+    cut = now - max_age_s
+    out, off = {}, FILE.size
+    try:
+        for _ in range(n_streams):
+            (n,) = SID.unpack_from(buf, off); off += SID.size
+            sid = buf[off:off + n].decode("utf-8"); off += n
+
+            kind, next_id, n_tracks = TRACKER.unpack_from(buf, off); off += TRACKER.size
+            trk = make_tracker(kind == 1)
+            trk.next_id = next_id           # ids keep counting up, never reused
+            for _ in range(n_tracks):
+                vals = TRACK.unpack_from(buf, off); off += TRACK.size
+                hist = [HIST.unpack_from(buf, off + k * HIST.size) for k in range(vals[-1])]
+                off += vals[-1] * HIST.size
+                kf = None
+                if kind == 1:
+                    kf = KALMAN.unpack_from(buf, off); off += KALMAN.size
+                if vals[6] >= cut:        # cloud-side last hit, not the edge-clock ts
+                    trk.tracks.append(_restore_track(kind == 1, vals, hist, kf))
+
+            (n,) = COUNT.unpack_from(buf, off); off += COUNT.size
+            hit_map, cnt_map = {}, {}
+            for tid, t, cnt in HIT.iter_unpack(buf[off:off + n * HIT.size]):
+                if t >= cut:
+                    hit_map[tid], cnt_map[tid] = t, cnt
+            off += n * HIT.size
+
+            (n,) = COUNT.unpack_from(buf, off); off += COUNT.size
+            rows = [r for r in ACT.iter_unpack(buf[off:off + n * ACT.size]) if r[-1] >= cut]
+            off += n * ACT.size
+            act = make_activity()
+            act.load_rows(rows)
+
+            if trk.tracks or hit_map or rows:
+                out[sid] = (trk, hit_map, cnt_map, act)
+    except (struct.error, UnicodeDecodeError, ValueError):
+        return {}   # truncated or corrupt: cold start rather than half a state
+    return out
+
+
+class SnapshotWriter:
+    """
+    Background thread writing a snapshot every `every_s`. collect_fn()
+    returns the encoded stream records (the server gathers them from each
+    stream's executor); write errors are counted, never raised.
+    """
+    def __init__(self, path, collect_fn, every_s=5.0):
+        self.path = path
+        self.collect_fn = collect_fn
+        self.every_s = every_s
+        self.written = 0
+        self.errors = 0
+        self.last_ms = 0.0
+        self.last_bytes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._stop = threading.Event()
+        self._th = threading.Thread(target=self._run, daemon=True, name="snapshot")
+        self._th.start()
+
+    def _run(self):
+        while not self._stop.wait(self.every_s):
+            self.write()
+
+    def write(self):
+        t0 = time.perf_counter()
+        try:
+            recs = self.collect_fn()
+            write_snapshot(self.path, recs)
+        except Exception:
+            self.errors += 1
+            return False
+        self.written += 1
+        self.last_bytes = sum(len(r) for r in recs) + FILE.size
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        return True
+
+    def stats(self):
+        return {"snapshot_written": self.written, "snapshot_errors": self.errors,
+                "snapshot_last_ms": round(self.last_ms, 2), "snapshot_last_bytes": self.last_bytes}
+
+    def close(self, final=True):
+        self._stop.set()
+        self._th.join(timeout=5)
+        if final:
+            self.write()
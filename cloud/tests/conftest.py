@@ -0,0 +1,5 @@
+# cloud/tests/conftest.py
+# The cloud modules are flat scripts run from cloud/ (the image WORKDIR), not a package.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+# cloud/tests/test_histogram.py
+import os
+import pytest
+
+from histogram import LogHistogram, prom_histogram
+
+EDGE_COPY = os.path.join(os.path.dirname(__file__), "..", "..", "edge", "histogram.py")
+CLOUD_COPY = os.path.join(os.path.dirname(__file__), "..", "histogram.py")
+
+
+def _code(path):
+    # everything after the header comment
+    with open(path) as f:
+        lines = f.read().splitlines()
+    return lines[next(i for i, l in enumerate(lines) if not l.startswith("#")):]
+
+
+@pytest.mark.skipif(not os.path.exists(EDGE_COPY), reason="edge tree not present")
+def test_cloud_copy_matches_edge():
+    assert _code(CLOUD_COPY) == _code(EDGE_COPY)
+
+
+def test_percentiles_within_one_bucket():
+    h = LogHistogram()
+    for v in range(1, 1001):
+        h.record(float(v))
+    p50, p99 = h.percentiles((50, 99))
+    assert 500 <= p50 <= 500 * 2 ** (1 / LogHistogram.SUB)
+    assert 990 <= p99 <= 1000
+    s = h.summary()
+    assert s["n"] == 1000 and s["max_ms"] == 1000.0
+
+
+def test_prom_buckets_are_cumulative():
+    h = LogHistogram()
+    for v in (0.5, 3.0, 3.0, 40.0, 20000.0):
+        h.record(v)
+    lines = prom_histogram("x_ms", h)
+    counts = [int(l.rsplit(" ", 1)[1]) for l in lines if l.startswith("x_ms_bucket")]
+    assert counts == sorted(counts)
+    assert counts[0] == 1 and counts[-1] == 5
+    assert 'x_ms_bucket{le="5"} 3' in lines
@@ -0,0 +1,86 @@
+# cloud/tests/test_router.py
+import json, socketserver, threading
+import pytest
+from fastapi.testclient import TestClient
+
+import router
+
+
+class _ShardHandler(socketserver.StreamRequestHandler):
+    # keep-alive HTTP/1.1 worker stand-in: records every request, answers {"ok": true}
+    def handle(self):
+        srv = self.server
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            hdrs = {}
+            while True:
+                h = self.rfile.readline()
+                if h in (b"\r\n", b""):
+                    break
+                k, _, v = h.decode("latin-1").partition(":")
+                hdrs[k.strip().lower()] = v.strip()
+            body = self.rfile.read(int(hdrs.get("content-length", "0")))
+            srv.requests.append((line, hdrs, body))
+            if srv.drop_from is not None and len(srv.requests) >= srv.drop_from:
+                return          # read the request, then hang up without answering
+            data = b'{"ok": true}'
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(data), data))
+            self.wfile.flush()
+
+
+@pytest.fixture
+def shard(tmp_path):
+    router.configure(1, shard_dir=str(tmp_path))
+    srv = socketserver.ThreadingUnixStreamServer(router.shard_socket("w0", str(tmp_path)), _ShardHandler)
+    srv.daemon_threads = True
+    srv.requests, srv.drop_from = [], None
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _post_form(client, sid):
+    return client.post("/ingest", data={"stream_id": sid, "ts_capture": "0", "detections": "[]"})
+
+
+def _post_batch(client, meta):
+    body = (b'--b\r\nContent-Disposition: form-data; name="meta"\r\n\r\n' + meta + b'\r\n--b--\r\n')
+    return client.post("/ingest_batch", content=body, headers={"Content-Type": "multipart/form-data; boundary=b"})
+
+
+def test_stream_id_cannot_inject_headers(shard):
+    with TestClient(router.app) as c:
+        r = _post_batch(c, json.dumps([{"stream_id": "cam1\r\nX-Evil: 1"}]).encode())
+    assert r.status_code == 200
+    _, hdrs, _ = shard.requests[0]
+    assert "x-evil" not in hdrs
+    assert hdrs["x-stream-id"] == "cam1%0D%0AX-Evil:%201"
+
+
+def test_non_latin1_stream_id_is_forwarded(shard):
+    with TestClient(router.app) as c:
+        r = _post_form(c, "камера")
+    assert r.status_code == 200
+    assert shard.requests[0][1]["x-stream-id"].isascii()
+
+
+def test_bad_json_escape_is_rejected(shard):
+    with TestClient(router.app) as c:
+        r = _post_batch(c, b'[{"stream_id": "\\ud800"}]')
+        assert r.status_code == 400
+        r = _post_batch(c, b'[{"stream_id": "\\x41"}]')
+        assert r.status_code == 400
+    assert shard.requests == []
+
+
+def test_post_is_not_retried_once_written(shard):
+    shard.drop_from = 2
+    with TestClient(router.app) as c:
+        assert _post_form(c, "cam1").status_code == 200
+        r = _post_form(c, "cam1")       # reused connection; shard reads it and hangs up
+    assert r.status_code == 503
+    assert len(shard.requests) == 2
@@ -0,0 +1,80 @@
+# cloud/tests/test_snapshot.py
+import struct
+import numpy as np
+import pytest
+
+from activity import ActivityEngine
+from snapshot import FILE, MAGIC, dump_stream, read_snapshot, write_snapshot
+from tracker import KalmanTracker, make_tracker
+
+NOW = 1_700_000_000.0
+
+
+def _stream(mode):
+    trk = make_tracker(mode, max_missed=30, max_age_s=5.0)
+    act = ActivityEngine()
+    hits, cnts = {}, {}
+    for k in range(4):
+        ts = 100.0 + 0.1 * k        # edge clock, nowhere near the cloud's
+        tracks = trk.update([(10 + 5 * k, 20, 60 + 5 * k, 140), (300, 40, 350, 170)], ts)
+        for tr in tracks:
+            hits[tr.id] = NOW - 1.0 + 0.1 * k
+            cnts[tr.id] = cnts.get(tr.id, 0) + 1
+        act.classify([tr.id for tr in tracks], [tr.box for tr in tracks], now=NOW - 1.0 + 0.1 * k,
+                     frame_size=(480, 640))
+    return trk, hits, cnts, act
+
+
+def _load(path, now=NOW):
+    return read_snapshot(str(path), lambda kalman: make_tracker("kalman" if kalman else "iou"),
+                         ActivityEngine, max_age_s=30.0, now=now)
+
+
+@pytest.mark.parametrize("mode", ["iou", "kalman"])
+def test_round_trip(tmp_path, mode):
+    trk, hits, cnts, act = _stream(mode)
+    path = tmp_path / "state.snap"
+    write_snapshot(str(path), [dump_stream("cam1", trk, hits, cnts, act)], wall_ts=NOW)
+    (rtrk, rhits, rcnts, ract), = _load(path).values()
+
+    assert isinstance(rtrk, KalmanTracker) == (mode == "kalman")
+    assert rtrk.next_id == trk.next_id
+    assert [t.id for t in rtrk.tracks] == [t.id for t in trk.tracks]
+    for a, b in zip(rtrk.tracks, trk.tracks):
+        assert a.box == pytest.approx(b.box) and a.ts == b.ts
+        assert (a.missed, a.hits) == (b.missed, b.hits)
+        np.testing.assert_allclose(np.array(a.history), np.array(b.history))
+        if mode == "kalman":
+            np.testing.assert_allclose(a.x, b.x)
+            np.testing.assert_allclose(a.P, b.P)
+            assert a.kf_ts == b.kf_ts
+    assert rhits == pytest.approx(hits) and rcnts == cnts
+    np.testing.assert_allclose(np.array(ract.state_rows(), float), np.array(act.state_rows(), float))
+    # the restored tracker carries on with the same ids
+    rtrk.update([(300, 40, 350, 170)], 100.5)
+    assert 2 in [t.id for t in rtrk.tracks]
+
+
+def test_stale_cut_uses_cloud_hit_time_not_edge_clock(tmp_path):
+    trk, hits, cnts, act = _stream("iou")
+    hits[1] = NOW - 120.0       # track 1 last hit two minutes ago on the cloud clock
+    path = tmp_path / "state.snap"
+    write_snapshot(str(path), [dump_stream("cam1", trk, hits, cnts, act)], wall_ts=NOW)
+    (rtrk, rhits, _, _), = _load(path).values()
+    assert [t.id for t in rtrk.tracks] == [2]
+    assert 1 not in rhits
+
+
+def test_old_file_version_or_corruption_starts_cold(tmp_path):
+    trk, hits, cnts, act = _stream("iou")
+    path = tmp_path / "state.snap"
+    write_snapshot(str(path), [dump_stream("cam1", trk, hits, cnts, act)], wall_ts=NOW)
+    buf = path.read_bytes()
+
+    path.write_bytes(buf[:len(buf) // 2])
+    assert _load(path) == {}
+    path.write_bytes(FILE.pack(MAGIC, 1, NOW, 1) + buf[FILE.size:])
+    assert _load(path) == {}
+    path.write_bytes(buf)
+    assert _load(path, now=NOW + 60.0) == {}       # whole file older than max_age_s
+    assert _load(tmp_path / "missing.snap") == {}
@@ -0,0 +1,61 @@
+# cloud/tests/test_wire.py
+import importlib.util, os
+import numpy as np
+import cv2
+import pytest
+
+from wire import FLAG_PARTS, FLAG_REPLAY, decode_records, jpeg_size, record_spans
+
+ENCODER = os.path.join(os.path.dirname(__file__), "..", "..", "edge", "sender_worker.py")
+
+
+@pytest.fixture(scope="module")
+def enc():
+    # the encoder lives in the edge tree; load it by path so its module names don't mix with the cloud's
+    if not os.path.exists(ENCODER):
+        pytest.skip("edge tree not present")
+    spec = importlib.util.spec_from_file_location("edge_sender_worker", ENCODER)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _jpeg(h, w):
+    ok, buf = cv2.imencode(".jpg", np.full((h, w, 3), 128, np.uint8))
+    return buf.tobytes()
+
+
+def test_round_trip_mixed_records(enc):
+    img = _jpeg(48, 64)
+    parts = [(10, 20, 32, 16, _jpeg(16, 32)), (100, 50, 8, 8, _jpeg(8, 8))]
+    body = b"".join([
+        enc.encode_frame_bin("cam1", 7, 1.5, 2.5, 640, 480, [(1, 2, 30, 40, 0.9)], img),
+        enc.encode_frame_bin("cäm2", 2 ** 32 + 3, 3.0, 4.0, 1280, 720, [], b""),
+        enc.encode_frame_bin("cam1", 8, 5.0, 6.0, 640, 480, [(5, 6, 7, 8, 0.25)], parts=parts,
+                             flags=enc.FLAG_REPLAY),
+    ])
+    a, b, c = decode_records(body)
+
+    assert (a.stream_id, a.frame_id, a.ts_capture, a.ts_edge_send, a.width, a.height) == \
+        ("cam1", 7, 1.5, 2.5, 640, 480)
+    assert a.det_boxes() == [(1, 2, 30, 40)] and a.dets["score"][0] == pytest.approx(0.9)
+    assert bytes(a.image) == img and a.parts is None and jpeg_size(a.image) == (48, 64)
+
+    assert (b.stream_id, b.frame_id, len(b.image), b.det_boxes()) == ("cäm2", 3, 0, [])
+
+    assert c.flags & FLAG_REPLAY and c.flags & FLAG_PARTS and len(c.image) == 0
+    assert [(x, y, w, h, bytes(j)) for (x, y, w, h, j) in c.parts] == parts
+
+    spans = record_spans(body)
+    assert [s for s, _, _ in spans] == ["cam1", "cäm2", "cam1"]
+    assert spans[0][1] == 0 and spans[-1][2] == len(body)
+    assert all(spans[i][2] == spans[i + 1][1] for i in range(2))
+
+
+def test_truncated_or_foreign_bodies_raise(enc):
+    rec = enc.encode_frame_bin("cam1", 1, 0.0, 0.0, 64, 48, [(0, 0, 1, 1, 0.5)], _jpeg(48, 64))
+    for bad in (rec[:10], rec[:-1], b"XXXX" + rec[4:]):
+        with pytest.raises(ValueError):
+            decode_records(bad)
+        with pytest.raises(ValueError):
+            record_spans(bad)
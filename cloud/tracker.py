@@ -1,5 +1,6 @@
 from collections import deque
 import math
+import numpy as np
 
 def iou(b1, b2):
     x1=max(b1[0],b2[0]); y1=max(b1[1],b2[1]); x2=min(b1[2],b2[2]); y2=min(b1[3],b2[3])
@@ -8,13 +9,47 @@ def iou(b1, b2):
     a2=max(0,b2[2]-b2[0])*max(0,b2[3]-b2[1])
     return inter/max(1e-6, a1+a2-inter)
 
+def iou_matrix(a, b):
+    # a: (N,4), b: (M,4) xyxy -> (N,M) in one shot
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    area_a = np.maximum(0.0, a[:, 2] - a[:, 0]) * np.maximum(0.0, a[:, 3] - a[:, 1])
+    area_b = np.maximum(0.0, b[:, 2] - b[:, 0]) * np.maximum(0.0, b[:, 3] - b[:, 1])
+    return inter / np.maximum(1e-6, area_a[:, None] + area_b[None, :] - inter)
+
+def greedy_assign(score, thr):
+    """One-to-one (row, col) pairs by descending score, stopping below `thr`."""
+    pairs = []
+    if score.size == 0:
+        return pairs
+    used_r, used_c = set(), set()
+    n = min(score.shape)
+    for flat in np.argsort(-score, axis=None):
+        r, c = divmod(int(flat), score.shape[1])
+        if score[r, c] < thr:
+            break
+        if r in used_r or c in used_c:
+            continue
+        used_r.add(r); used_c.add(c)
+        pairs.append((r, c))
+        if len(pairs) == n:
+            break
+    return pairs
+
 class Track:
     def __init__(self, tid, box, ts):
         self.id=tid; self.box=box; self.ts=ts; self.history=deque(maxlen=32)
+        self.missed=0; self.hits=0
         self.push(ts, box)
     def push(self, ts, box):
         x1,y1,x2,y2=box; cx=(x1+x2)/2; cy=(y1+y2)/2; w=x2-x1; h=y2-y1
         self.history.append((ts,cx,cy,w,h)); self.box=box; self.ts=ts
+        self.missed=0; self.hits+=1
     def speed_px_s(self):
         if len(self.history)<2: return 0.0
         (t0,cx0,cy0,_,_), (t1,cx1,cy1,_,_) = self.history[-2], self.history[-1]
@@ -23,19 +58,122 @@ class Track:
         _,_,_,w,h=self.history[-1]; return h/max(1.0,w)
 
 class Tracker:
-    def __init__(self, iou_thr=0.3):
+    """
+    IoU tracker. Each update builds the track x detection IoU matrix in
+    NumPy and assigns greedily by IoU (one-to-one, >= iou_thr); unmatched
+    detections start new tracks. A track expires after `max_missed`
+    consecutive updates without a match or `max_age_s` of capture time since
+    its last match (0 disables either); ids dropped by the last update are
+    in `expired` so callers can release per-track state.
+    """
+    def __init__(self, iou_thr=0.3, max_missed=30, max_age_s=5.0):
         self.iou_thr=iou_thr; self.tracks=[]; self.next_id=1
+        self.max_missed=max_missed; self.max_age_s=max_age_s
+        self.expired=[]
     def update(self, boxes, ts):
-        assigned=set()
-        for tr in self.tracks:
-            best=None; best_iou=0.0; best_j=-1
-            for j,b in enumerate(boxes):
-                if j in assigned: continue
-                i=iou(tr.box,b)
-                if i>best_iou: best, best_iou, best_j=b, i, j
-            if best is not None and best_iou>=self.iou_thr:
-                tr.push(ts,best); assigned.add(best_j)
+        assigned=set(); matched=set()
+        if self.tracks and boxes:
+            m = iou_matrix([tr.box for tr in self.tracks], boxes)
+            for i, j in greedy_assign(m, self.iou_thr):
+                self.tracks[i].push(ts, boxes[j]); assigned.add(j); matched.add(i)
+        for i, tr in enumerate(self.tracks):
+            if i not in matched:
+                tr.missed += 1
+        self._expire(ts)
         for j,b in enumerate(boxes):
             if j not in assigned:
                 tr=Track(self.next_id,b,ts); self.next_id+=1; self.tracks.append(tr)
         return self.tracks
+    def _expire(self, ts):
+        keep, self.expired = [], []
+        for tr in self.tracks:
+            if ((self.max_missed and tr.missed > self.max_missed)
+                    or (self.max_age_s and ts - tr.ts > self.max_age_s)):
+                self.expired.append(tr.id)
+            else:
+                keep.append(tr)
+        self.tracks = keep
+
+class KalmanTrack(Track):
+    """
+    Track with a constant-velocity Kalman filter on the box centre
+    (state cx, cy, vx, vy); width/height are smoothed separately. Noise is
+    scaled by box height so the filter behaves the same near and far.
+    """
+    def __init__(self, tid, box, ts, accel_frac=1.5, meas_frac=0.05, vel0_frac=1.0):
+        self.accel_frac = accel_frac
+        self.meas_frac = meas_frac
+        x1, y1, x2, y2 = box
+        h = max(1.0, y2 - y1)
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, 0.0, 0.0])
+        self.P = np.diag([(meas_frac * h) ** 2] * 2 + [(vel0_frac * h) ** 2] * 2)
+        self.wh = np.array([x2 - x1, h], dtype=np.float64)
+        self.kf_ts = ts
+        super().__init__(tid, box, ts)
+
+    def _predict(self, ts):
+        dt = max(0.0, ts - self.kf_ts)
+        F = np.eye(4); F[0, 2] = F[1, 3] = dt
+        q = (self.accel_frac * self.wh[1]) ** 2
+        dt2, dt3, dt4 = dt * dt, dt ** 3 / 2, dt ** 4 / 4
+        Q = q * np.array([[dt4, 0, dt3, 0], [0, dt4, 0, dt3], [dt3, 0, dt2, 0], [0, dt3, 0, dt2]])
+        return F @ self.x, F @ self.P @ F.T + Q
+
+    def predicted(self, ts):
+        """(box xyxy, 2x2 innovation covariance of the centre) at capture time `ts`."""
+        x, P = self._predict(ts)
+        w, h = self.wh
+        S = P[:2, :2] + np.eye(2) * (self.meas_frac * h) ** 2
+        return (x[0] - w / 2, x[1] - h / 2, x[0] + w / 2, x[1] + h / 2), S
+
+    def push(self, ts, box):
+        if ts > self.kf_ts:
+            x, P = self._predict(ts)
+            x1, y1, x2, y2 = box
+            z = np.array([(x1 + x2) / 2, (y1 + y2) / 2])
+            S = P[:2, :2] + np.eye(2) * (self.meas_frac * self.wh[1]) ** 2
+            K = P[:, :2] @ np.linalg.inv(S)
+            self.x = x + K @ (z - x[:2])
+            self.P = (np.eye(4) - K @ np.eye(2, 4)) @ P
+            self.wh = 0.6 * np.array([x2 - x1, max(1.0, y2 - y1)]) + 0.4 * self.wh
+            self.kf_ts = ts
+        super().push(ts, box)
+
+class KalmanTracker(Tracker):
+    """
+    Tracker that matches detections against each track's Kalman-predicted
+    box at the frame's ts_capture, so identities survive sparse forwarding
+    (people moving further than a box width between forwarded frames).
+    Pairs with IoU >= iou_thr against the prediction win first; the rest
+    may match on centre distance inside a chi-square gate (Mahalanobis
+    d^2 <= gate) on the predicted innovation covariance.
+    """
+    def __init__(self, iou_thr=0.3, max_missed=30, max_age_s=5.0, gate=9.21):
+        super().__init__(iou_thr, max_missed, max_age_s)
+        self.gate = gate            # chi-square, 2 dof, 99%
+
+    def update(self, boxes, ts):
+        assigned=set(); matched=set()
+        if self.tracks and boxes:
+            preds = [tr.predicted(ts) for tr in self.tracks]
+            b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+            m = iou_matrix([p[0] for p in preds], b)
+            centres = np.stack([(b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2], axis=1)
+            d2 = np.empty_like(m)
+            for i, (pbox, S) in enumerate(preds):
+                r = centres - np.array([(pbox[0] + pbox[2]) / 2, (pbox[1] + pbox[3]) / 2])
+                d2[i] = np.einsum("ni,ij,nj->n", r, np.linalg.inv(S), r)
+            score = np.where(m >= self.iou_thr, 1.0 + m, np.where(d2 <= self.gate, 1.0 / (1.0 + d2), 0.0))
+            for i, j in greedy_assign(score, 1e-9):
+                self.tracks[i].push(ts, boxes[j]); assigned.add(j); matched.add(i)
+        for i, tr in enumerate(self.tracks):
+            if i not in matched:
+                tr.missed += 1
+        self._expire(ts)
+        for j,b in enumerate(boxes):
+            if j not in assigned:
+                tr=KalmanTrack(self.next_id,b,ts); self.next_id+=1; self.tracks.append(tr)
+        return self.tracks
+
+def make_tracker(mode="iou", **kw):
+    return KalmanTracker(**kw) if mode == "kalman" else Tracker(**kw)
@@ -0,0 +1,123 @@
+# cloud/wire.py  (binary ingest protocol, decoder side)
+#
+# One record per frame, records may be concatenated in one body (batch):
+#   header  <4sBBHIddHHHI  magic b"PNF1", version, flags, sid_len, frame_id,
+#                          ts_capture, ts_edge_send, width, height, n_dets, img_len
+#   stream_id              sid_len bytes, utf-8
+#   detections             n_dets x <iiiif (x1, y1, x2, y2, score)
+#   image                  img_len bytes of JPEG (0 = metadata only; size from width/height)
+#                          flags & FLAG_PARTS: <H n_parts, n_parts x <HHHHI (x, y, w, h,
+#                          nbytes) in full-res coords, then the part JPEGs (crops/downscaled)
+#                          flags & FLAG_REPLAY: late delivery from the edge spool
+# Must stay in sync with the encoder in edge/sender_worker.py.
+import struct
+import numpy as np
+
+MAGIC = b"PNF1"
+VERSION = 1
+HDR = struct.Struct("<4sBBHIddHHHI")
+PART = struct.Struct("<HHHHI")
+FLAG_PARTS = 0x01
+FLAG_REPLAY = 0x02      # delivered late from the edge spool
+DET = np.dtype([("x1", "<i4"), ("y1", "<i4"), ("x2", "<i4"), ("y2", "<i4"), ("score", "<f4")])
+
+class Record:
+    __slots__ = ("flags", "stream_id", "frame_id", "ts_capture", "ts_edge_send",
+                 "width", "height", "dets", "image", "parts")
+
+    def det_boxes(self):
+        d = self.dets
+        return list(zip(d["x1"].tolist(), d["y1"].tolist(), d["x2"].tolist(), d["y2"].tolist()))
+
+def decode_records(body):
+    """Parse every record in `body`; raises ValueError on malformed input."""
+    mv = memoryview(body)
+    off, out = 0, []
+    while off < len(mv):
+        if len(mv) - off < HDR.size:
+            raise ValueError("truncated header")
+        (magic, ver, flags, sid_len, frame_id, ts_cap, ts_send,
+         w, h, n_dets, img_len) = HDR.unpack_from(mv, off)
+        if magic != MAGIC or ver != VERSION:
+            raise ValueError("bad magic/version")
+        off += HDR.size
+        end = off + sid_len + n_dets * DET.itemsize + img_len
+        if end > len(mv):
+            raise ValueError("truncated record")
+        r = Record()
+        r.flags, r.frame_id, r.ts_capture, r.ts_edge_send = flags, frame_id, ts_cap, ts_send
+        r.width, r.height = w, h
+        r.stream_id = bytes(mv[off:off + sid_len]).decode("utf-8"); off += sid_len
+        r.dets = np.frombuffer(mv[off:off + n_dets * DET.itemsize], dtype=DET); off += n_dets * DET.itemsize
+        r.image = mv[off:off + img_len]; off += img_len
+        r.parts = None
+        if flags & FLAG_PARTS:
+            r.parts = _decode_parts(r.image)
+            r.image = mv[0:0]
+        out.append(r)
+    return out
+
+def _decode_parts(sec):
+    if len(sec) < 2:
+        raise ValueError("truncated parts")
+    (n,) = struct.unpack_from("<H", sec, 0)
+    off = 2 + n * PART.size
+    if off > len(sec):
+        raise ValueError("truncated parts")
+    parts = []
+    for k in range(n):
+        x, y, w, h, nb = PART.unpack_from(sec, 2 + k * PART.size)
+        if off + nb > len(sec):
+            raise ValueError("truncated part")
+        parts.append((x, y, w, h, sec[off:off + nb]))
+        off += nb
+    return parts
+
+# JPEG start-of-frame markers carrying the image size (baseline, progressive, ...)
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def jpeg_size(buf):
+    """(h, w) from the JPEG SOF segment without decoding pixels; None if not found."""
+    b = memoryview(buf)
+    n = len(b)
+    if n < 4 or b[0] != 0xFF or b[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if b[i] != 0xFF:
+            i += 1
+            continue
+        marker = b[i + 1]
+        if marker == 0xFF:                          # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # standalone markers
+            i += 2
+            continue
+        if marker in _SOF:
+            return ((b[i + 5] << 8) | b[i + 6], (b[i + 7] << 8) | b[i + 8])
+        i += 2 + ((b[i + 2] << 8) | b[i + 3])
+    return None
+
+def record_spans(body):
+    """
+    [(stream_id, start, end), ...] for every record in `body`, reading only
+    the fixed headers (no numpy, no image parsing). Used by the router to
+    split a mixed-stream body between shards; raises ValueError like
+    decode_records.
+    """
+    mv = memoryview(body)
+    off, out = 0, []
+    while off < len(mv):
+        if len(mv) - off < HDR.size:
+            raise ValueError("truncated header")
+        magic, ver, _, sid_len, _, _, _, _, _, n_dets, img_len = HDR.unpack_from(mv, off)
+        if magic != MAGIC or ver != VERSION:
+            raise ValueError("bad magic/version")
+        sid_at = off + HDR.size
+        end = sid_at + sid_len + n_dets * DET.itemsize + img_len
+        if end > len(mv):
+            raise ValueError("truncated record")
+        out.append((bytes(mv[sid_at:sid_at + sid_len]).decode("utf-8"), off, end))
+        off = end
+    return out
@@ -1,10 +1,11 @@
 # edge/annotator.py
-import cv2, os
+import cv2, os, threading, time
 
 class Annotator:
-    def __init__(self, out_path="/results/annotated.mp4", fps=15):
+    def __init__(self, out_path="/results/annotated.mp4", fps=15, show_motion=False):
         self.out_path = out_path
         self.fps = fps
+        self.show_motion = show_motion
         self.writer = None
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
@@ -14,10 +15,15 @@ class Annotator:
             fourcc = cv2.VideoWriter_fourcc(*"mp4v")
             self.writer = cv2.VideoWriter(self.out_path, fourcc, self.fps, (w, h))
 
-    def draw_and_write(self, frame_bgr, detections):
+    def draw_and_write(self, frame_bgr, detections, motion=None):
         # detections: [(x1,y1,x2,y2,score), ...]
+        # motion: optional MotionResult; its block map is outlined, no extra gray pass
         self._ensure_writer(frame_bgr)
         out = frame_bgr.copy()
+        if self.show_motion and motion is not None:
+            k = motion.block / motion.scale
+            for r, c in zip(*motion.active().nonzero()):
+                cv2.rectangle(out, (int(c*k), int(r*k)), (int((c+1)*k), int((r+1)*k)), (0,0,255), 1)
         for (x1,y1,x2,y2,score) in detections:
             x1,y1,x2,y2 = map(int, (x1,y1,x2,y2))
             cv2.rectangle(out, (x1,y1), (x2,y2), (0,255,0), 2)
@@ -28,3 +34,64 @@ class Annotator:
         if self.writer is not None:
             self.writer.release()
             self.writer = None
+
+
+class AsyncAnnotator:
+    """
+    Runs an Annotator on its own thread so debug video never sits on the
+    detect path. submit() is cheap: frames arriving faster than `fps`
+    (capture time `ts`) are skipped, the rest go on a bounded LatestQueue
+    whose oldest entry is dropped when the writer falls behind. Drawing and
+    encoding are timed as the "annotate" metrics stage.
+    """
+    def __init__(self, annotator, fps=15, qsize=2, metrics=None):
+        from pipeline import LatestQueue
+        self.annot = annotator
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.metrics = metrics
+        self.q = LatestQueue(qsize)
+        self.written = 0
+        self.skipped = 0        # over the output frame rate
+        self._next = 0.0
+        self._th = threading.Thread(target=self._run, name="edge-annotate", daemon=True)
+        self._th.start()
+
+    @property
+    def dropped(self):
+        return self.q.dropped   # writer fell behind
+
+    def submit(self, frame_id, frame, persons, motion=None, ts=None):
+        ts = time.time() if ts is None else ts
+        if ts < self._next:
+            self.skipped += 1
+            return False
+        # keep the cadence; resync after a gap instead of bursting to catch up
+        self._next = self._next + self.period if ts - self._next < self.period else ts + self.period
+        self.q.put((frame_id, frame, persons, motion))
+        return True
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                if self.q.drained:
+                    break
+                continue
+            frame_id, frame, persons, motion = item
+            if self.metrics is not None:
+                self.metrics.record_queue_depth("annotate", self.q.qsize())
+            t0 = time.time()
+            self.annot.draw_and_write(frame, persons, motion)
+            self.written += 1
+            if self.metrics is not None:
+                self.metrics.mark("annotate", frame_id, t0)
+
+    def stats(self):
+        return {"annot_written": self.written, "annot_skipped": self.skipped,
+                "annot_dropped": self.dropped}
+
+    def release(self, timeout=5.0):
+        # write what is queued, then close the file
+        self.q.close()
+        self._th.join(timeout=timeout)
+        self.annot.release()
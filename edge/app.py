@@ -2,11 +2,19 @@ import os, time, json
 import cv2
 
 from metrics import EdgeMetrics
-from video_source import open_source          # resilient capture wrapper
+from video_source import open_source, ThreadedCapture  # resilient capture wrappers
 from detector import HogPersonDetector
+from detector_pool import HogDetectorPool
+from scheduler import DetectionScheduler
 from sampler import Sampler
 from sender_worker import SenderWorker        # async, bounded queue HTTP sender
-from annotator import Annotator
+from encoder import AdaptiveEncoder
+from spool import DiskSpool, SpoolReplayer
+from annotator import Annotator, AsyncAnnotator
+from motion import MotionAnalyzer
+from pipeline import EdgePipeline
+from multicam import CameraStream, MultiCamRunner, parse_sources, parse_fps
+from metrics_server import start_metrics_server
 
 RESULTS_DIR = "/results"
 os.makedirs(RESULTS_DIR, exist_ok=True)
@@ -20,89 +28,256 @@ def env(name, default=None, cast=str):
 
 # Env config
 VIDEO_SOURCE  = env("VIDEO_SOURCE", "samples/input.mp4")
+# Multi-camera: "cam1=rtsp://...,cam2=rtsp://..." (overrides VIDEO_SOURCE; ids become stream_ids)
+VIDEO_SOURCES = env("VIDEO_SOURCES", "")
+STREAM_FPS    = env("STREAM_FPS", "")                  # detection fps target: "10" or "cam1=15,cam2=5" (empty = no cap)
+MULTICAM_POLICY = env("MULTICAM_POLICY", "rr")         # rr | deadline (earliest deadline over STREAM_FPS)
 SAMPLER_MODE  = env("SAMPLER_MODE", "motion")
 MOTION_THR    = env("MOTION_THR", 12.0, float)
 HEARTBEAT_S   = env("HEARTBEAT_S", 2.0, float)
 CLOUD_URL     = env("CLOUD_URL", "http://cloud:8000/ingest")
 ANNOTATE      = env("ANNOTATE", "0") in ("1", "true", "True")
-ANNOTATE_FPS  = env("ANNOTATE_FPS", 15, int)  # match your RTSP fps
+ANNOTATE_FPS  = env("ANNOTATE_FPS", 15, int)  # output video rate; faster capture is skipped down to it
+ANNOTATE_QSIZE = env("ANNOTATE_QSIZE", 2, int)  # frames waiting for the annotate thread (oldest dropped)
+CAPTURE_THREAD = env("CAPTURE_THREAD", "0") in ("1", "true", "True")  # grab/decode on its own thread
+PIPELINE      = env("PIPELINE", "0") in ("1", "true", "True")  # staged multi-threaded loop
+PIPELINE_QSIZE = env("PIPELINE_QSIZE", 2, int)                  # per-stage queue bound
+DET_BACKEND   = env("DET_BACKEND", "hog")        # hog | pool (multi-process HOG)
+DET_WORKERS   = env("DET_WORKERS", 4, int)
+# frames: one frame per worker (needs PIPELINE=1 to keep frames in flight)
+# tiles:  horizontal bands of one frame in parallel (helps the sequential loop)
+DET_POOL_MODE = env("DET_POOL_MODE", "frames" if PIPELINE else "tiles")
+DET_TILE_OVERLAP = env("DET_TILE_OVERLAP", 0.25, float)
+# Detection scheduling: skip HOG on quiet / non-key frames and carry boxes forward
+DET_SCHED     = env("DET_SCHED", "0") in ("1", "true", "True")
+DET_EVERY_N   = env("DET_EVERY_N", 1, int)          # key frame interval
+DET_MOTION_THR = env("DET_MOTION_THR", 2.0, float)  # same units as MOTION_THR
+DET_MAX_INTERVAL_S = env("DET_MAX_INTERVAL_S", 1.0, float)  # forced full detection
+DET_ROI_MOTION = env("DET_ROI_MOTION", "0") in ("1", "true", "True")  # search moving blocks only (DET_SCHED=1)
+# Shared motion analysis (decimated grayscale, block map)
+MOTION_WORK_W = env("MOTION_WORK_W", 160, int)        # analysis width in px
+MOTION_BLOCK  = env("MOTION_BLOCK", 8, int)           # block edge in analysis px
+MOTION_BLOCK_THR = env("MOTION_BLOCK_THR", 15.0, float)
+ANNOTATE_MOTION = env("ANNOTATE_MOTION", "0") in ("1", "true", "True")
+# Sender
+STREAM_ID     = env("STREAM_ID", "default")
+SENDER_QSIZE  = env("SENDER_QSIZE", 5, int)
+SEND_BATCH    = env("SEND_BATCH", 1, int)              # >1 = POST /ingest_batch
+SEND_LINGER_MS = env("SEND_LINGER_MS", 0.0, float)     # max wait to fill a batch
+SEND_WIRE     = env("SEND_WIRE", "multipart")          # multipart | bin (POST /ingest_bin)
+SEND_MODE     = env("SEND_MODE", "frames")             # frames | meta (detections + frame size only)
+FULL_FRAME_EVERY_S = env("FULL_FRAME_EVERY_S", 0.0, float)  # meta mode: periodic full frame (0 = never)
+ADAPTIVE_ENCODE = env("ADAPTIVE_ENCODE", "0") in ("1", "true", "True")
+BW_BUDGET_KBPS = env("BW_BUDGET_KBPS", 0.0, float)     # uplink budget for the adaptive encoder (0 = none)
+MAX_SEND_MS   = env("MAX_SEND_MS", 250.0, float)       # send latency that counts as pressure
+SEND_DROP_POLICY = env("SEND_DROP_POLICY", "drop_newest")  # drop_newest | drop_oldest | latest_only
+SEND_CONCURRENCY = env("SEND_CONCURRENCY", 1, int)     # upload lanes (keep-alive connections)
+SEND_ENCODE_WORKERS = env("SEND_ENCODE_WORKERS", 2, int)  # JPEG encode threads
+# Outage spool (undeliverable frames to disk, replayed to /ingest_bin later)
+SPOOL_DIR     = env("SPOOL_DIR", "")                   # empty = no spool
+SPOOL_MAX_MB  = env("SPOOL_MAX_MB", 256.0, float)
+SPOOL_MAX_AGE_S = env("SPOOL_MAX_AGE_S", 3600.0, float)
+REPLAY_KBPS   = env("REPLAY_KBPS", 512.0, float)       # replay rate cap
+METRICS_PORT  = env("METRICS_PORT", 0, int)            # >0 = serve GET /metrics (Prometheus text)
+
+def run_sequential(cap, detector, sampler, metrics, sender, annot, live):
+    frame_id = 0
+    while True:
+        t0 = time.time()
+        ok, frame = cap.read()
+        if not ok:
+            # Wait instead of exiting when the RTSP stream isn't publishing yet.
+            if live:
+                time.sleep(0.25)
+                continue
+            else:
+                break
+        metrics.mark("capture", frame_id, t0)
+        t0 = getattr(cap, "last_ts", None) or t0  # when the frame was grabbed
+        metrics.mark("capture_age", frame_id, t0)
+
+        t1 = time.time()
+        persons = detector.predict(frame)          # [[x1,y1,x2,y2,score], ...]
+        motion = getattr(detector, "last_motion", None)
+        metrics.mark("detect", frame_id, t1)
+        if annot is not None:
+            annot.submit(frame_id, frame, persons, motion, ts=t0)
+
+        t2 = time.time()
+        forward = sampler.should_forward(frame, persons, t2, motion=motion)
+        metrics.mark("sample_decision", frame_id, t2)
+
+        if forward:
+            if sender is not None:
+                queued = sender.submit(frame, persons, ts_capture=t0, frame_id=frame_id)
+                if not queued:
+                    print("[EDGE->CLOUD] queue full; dropping frame", flush=True)
+            metrics.increment_forwarded()
+
+        metrics.tick_fps()
+        metrics.maybe_periodic_print()
+        frame_id += 1
 
 def main():
     print("[EDGE] starting with config:",
           json.dumps({
               "VIDEO_SOURCE": VIDEO_SOURCE,
+              "VIDEO_SOURCES": VIDEO_SOURCES,
               "SAMPLER_MODE": SAMPLER_MODE,
               "MOTION_THR": MOTION_THR,
               "HEARTBEAT_S": HEARTBEAT_S,
-              "CLOUD_URL": CLOUD_URL
+              "CLOUD_URL": CLOUD_URL,
+              "PIPELINE": PIPELINE,
+              "DET_BACKEND": DET_BACKEND,
+              "DET_SCHED": DET_SCHED
           }, indent=2), flush=True)
 
-    # resilient capture (auto-reconnects on RTSP hiccups)
-    cap = open_source(VIDEO_SOURCE)
-    if cap is None:
-        raise RuntimeError(f"Cannot open source: {VIDEO_SOURCE}")
+    sources = parse_sources(VIDEO_SOURCES, default_id=STREAM_ID) if VIDEO_SOURCES else []
+    cap = None
+    if not sources:
+        # resilient capture (auto-reconnects on RTSP hiccups)
+        cap = open_source(VIDEO_SOURCE, threaded=CAPTURE_THREAD)
+        if cap is None:
+            raise RuntimeError(f"Cannot open source: {VIDEO_SOURCE}")
 
-    detector = HogPersonDetector()
-    sampler  = Sampler(mode=SAMPLER_MODE, motion_thr=MOTION_THR, heartbeat_s=HEARTBEAT_S)
+    if DET_BACKEND == "pool":
+        base_det = HogDetectorPool(workers=DET_WORKERS, mode=DET_POOL_MODE,
+                                   tile_overlap=DET_TILE_OVERLAP)
+    else:
+        base_det = HogPersonDetector()
+    analyzer = MotionAnalyzer(work_w=MOTION_WORK_W, block=MOTION_BLOCK, block_thr=MOTION_BLOCK_THR)
+    sampler  = Sampler(mode=SAMPLER_MODE, motion_thr=MOTION_THR, heartbeat_s=HEARTBEAT_S,
+                       analyzer=analyzer)
+    detector = base_det
+    if DET_SCHED:
+        detector = DetectionScheduler(base_det, motion_fn=sampler.analyze,
+                                      motion_thr=DET_MOTION_THR, every_n=DET_EVERY_N,
+                                      max_interval_s=DET_MAX_INTERVAL_S,
+                                      motion_rois=DET_ROI_MOTION)
     metrics  = EdgeMetrics(csv_path=f"{RESULTS_DIR}/edge_metrics.csv")
 
-    annot = Annotator("/results/annotated.mp4", fps=ANNOTATE_FPS) if ANNOTATE else None
+    annot = None
+    if ANNOTATE and not sources:
+        annot = AsyncAnnotator(Annotator("/results/annotated.mp4", fps=ANNOTATE_FPS,
+                                         show_motion=ANNOTATE_MOTION),
+                               fps=ANNOTATE_FPS, qsize=ANNOTATE_QSIZE, metrics=metrics)
 
     # async sender with bounded queue; optional if CLOUD_URL unset
-    sender = None if not CLOUD_URL or CLOUD_URL.strip() == "" else SenderWorker(CLOUD_URL, maxsize=5, timeout=5)
+    sender = None
+    encoder = None
+    if ADAPTIVE_ENCODE:
+        # crops need the binary wire format's part table
+        encoder = AdaptiveEncoder(budget_kbps=BW_BUDGET_KBPS, max_send_ms=MAX_SEND_MS,
+                                  allow_crop=(SEND_WIRE == "bin"))
+    spool = replayer = None
+    if CLOUD_URL and CLOUD_URL.strip() != "":
+        if SPOOL_DIR:
+            spool = DiskSpool(SPOOL_DIR, max_bytes=int(SPOOL_MAX_MB * (1 << 20)), max_age_s=SPOOL_MAX_AGE_S)
+        sender = SenderWorker(CLOUD_URL, maxsize=max(SENDER_QSIZE, 2 * SEND_BATCH), timeout=5,
+                              stream_id=STREAM_ID, batch_size=SEND_BATCH,
+                              batch_linger_ms=SEND_LINGER_MS, wire=SEND_WIRE,
+                              mode=SEND_MODE, full_frame_every_s=FULL_FRAME_EVERY_S,
+                              encoder=encoder, metrics=metrics, drop_policy=SEND_DROP_POLICY,
+                              concurrency=SEND_CONCURRENCY, encode_workers=SEND_ENCODE_WORKERS,
+                              spool=spool)
+        if spool is not None:
+            # replay only while live sends succeed and the live queue is idle
+            replayer = SpoolReplayer(spool, sender.bin_url, rate_kbps=REPLAY_KBPS,
+                                     ready_fn=lambda: sender.online and sender.q.qsize() == 0)
 
-    frame_id = 0
+    # one CameraStream per source: own capture thread, Sampler and stream_id; detector pool and sender shared
+    streams = []
+    if sources:
+        fps = parse_fps(STREAM_FPS, [sid for sid, _ in sources])
+        for sid, spec in sources:
+            s_sampler = Sampler(mode=SAMPLER_MODE, motion_thr=MOTION_THR, heartbeat_s=HEARTBEAT_S,
+                                analyzer=MotionAnalyzer(work_w=MOTION_WORK_W, block=MOTION_BLOCK,
+                                                        block_thr=MOTION_BLOCK_THR))
+            s_det = None
+            if DET_SCHED:
+                s_det = DetectionScheduler(base_det, motion_fn=s_sampler.analyze,
+                                           motion_thr=DET_MOTION_THR, every_n=DET_EVERY_N,
+                                           max_interval_s=DET_MAX_INTERVAL_S,
+                                           motion_rois=DET_ROI_MOTION)
+            s_annot = None
+            if ANNOTATE:
+                s_annot = AsyncAnnotator(Annotator(f"/results/annotated_{sid}.mp4", fps=ANNOTATE_FPS,
+                                                   show_motion=ANNOTATE_MOTION),
+                                         fps=ANNOTATE_FPS, qsize=ANNOTATE_QSIZE, metrics=metrics)
+            streams.append(CameraStream(sid, ThreadedCapture(spec), s_sampler, fps=fps[sid],
+                                        detector=s_det, annot=s_annot))
+        print(f"[EDGE] multicam: {len(streams)} sources, policy={MULTICAM_POLICY}, fps={fps}", flush=True)
+
+    live = VIDEO_SOURCE.lower().startswith("rtsp://")
+    pipeline = None
+    multicam = None
+
+    def _counters():
+        c = {}
+        if sender is not None:
+            c.update({"edge_sender_sent_total": sender.sent, "edge_sender_dropped_total": sender.dropped,
+                      "edge_sender_bytes_total": sender.bytes_sent})
+            if spool is not None:
+                c["edge_sender_spooled_total"] = sender.spooled
+        if pipeline is not None:
+            for q, n in pipeline.dropped().items():
+                c[f'edge_pipeline_dropped_total{{queue="{q}"}}'] = n
+        if hasattr(cap, "skipped"):
+            c["edge_capture_skipped_total"] = cap.skipped
+        if multicam is not None:
+            c.update(multicam.counters())
+        if annot is not None:
+            c.update({"edge_annot_written_total": annot.written, "edge_annot_skipped_total": annot.skipped,
+                      "edge_annot_dropped_total": annot.dropped})
+        return c
+
+    metrics_srv = None
+    if METRICS_PORT > 0:
+        metrics_srv = start_metrics_server(METRICS_PORT, lambda: metrics.prometheus_text(_counters()))
     try:
-        while True:
-            t0 = time.time()
-            ok, frame = cap.read()
-            if not ok:
-                # Wait instead of exiting when the RTSP stream isn't publishing yet.
-                if VIDEO_SOURCE.lower().startswith("rtsp://"):
-                    time.sleep(0.25)
-                    continue
-                else:
-                    break
-            metrics.mark("capture", frame_id, t0)
-
-            t1 = time.time()
-            persons = detector.predict(frame)          # [[x1,y1,x2,y2,score], ...]
-            if ANNOTATE and annot is not None:
-                annot.draw_and_write(frame, persons)
-            metrics.mark("detect", frame_id, t1)
-
-            t2 = time.time()
-            forward = sampler.should_forward(frame, persons, t2)
-            metrics.mark("sample_decision", frame_id, t2)
-
-            if forward:
-                if sender is not None:
-                    queued = sender.submit(frame, persons, ts_capture=t0)
-                    if not queued:
-                        print("[EDGE->CLOUD] queue full; dropping frame", flush=True)
-                metrics.increment_forwarded()
-
-            metrics.tick_fps()
-            metrics.maybe_periodic_print()
-            frame_id += 1
+        if streams:
+            multicam = MultiCamRunner(streams, detector=base_det, metrics=metrics, sender=sender,
+                                      policy=MULTICAM_POLICY)
+            multicam.run()
+        elif PIPELINE:
+            pipeline = EdgePipeline(cap, detector, sampler, metrics, sender=sender,
+                                    annot=annot, qsize=PIPELINE_QSIZE, live=live)
+            pipeline.run()
+        else:
+            run_sequential(cap, detector, sampler, metrics, sender, annot, live)
 
     finally:
+        if metrics_srv is not None:
+            metrics_srv.shutdown()
         # stop sender thread cleanly
         try:
+            if replayer is not None:
+                replayer.stop()
             if sender is not None:
                 sender.stop()
+            if spool is not None:
+                spool.close()
         except Exception:
             pass
 
-        # release capture
-        try:
-            cap.release()
-        except Exception:
-            pass
+        # release capture(s)
+        for c in [cap] + [st.cap for st in streams]:
+            try:
+                if c is not None:
+                    c.release()
+            except Exception:
+                pass
 
-        if annot is not None:
+        if isinstance(base_det, HogDetectorPool):
+            try:
+                base_det.close()
+            except Exception:
+                pass
+
+        for a in [annot] + [st.annot for st in streams]:
             try:
-                annot.release()
+                if a is not None:
+                    a.release()
             except Exception:
                 pass
 
@@ -110,8 +285,33 @@ def main():
         summary = metrics.finalize()
         summary.update({
             "sender_sent": getattr(sender, "sent", 0) if sender is not None else 0,
-            "sender_dropped": getattr(sender, "dropped", 0) if sender is not None else 0
+            "sender_dropped": getattr(sender, "dropped", 0) if sender is not None else 0,
+            "sender_bytes": getattr(sender, "bytes_sent", 0) if sender is not None else 0,
+            "sender_with_image": getattr(sender, "frames_with_image", 0) if sender is not None else 0,
+            "sender_timings": sender.timing_stats() if sender is not None else {}
         })
+        if spool is not None:
+            summary["sender_spooled"] = sender.spooled
+            summary.update(spool.stats())
+        if replayer is not None:
+            summary.update(replayer.stats())
+        if hasattr(cap, "stats"):
+            summary.update(cap.stats())
+        if pipeline is not None:
+            summary["pipeline_dropped"] = pipeline.dropped()
+        if annot is not None:
+            summary.update(annot.stats())
+        if multicam is not None:
+            summary["multicam"] = multicam.stats()
+        if multicam is not None:
+            # the single-stream scheduler is unused here; sum the per-stream ones
+            runs = sum(s.detector.runs for s in streams if isinstance(s.detector, DetectionScheduler))
+            skipped = sum(s.detector.skipped for s in streams if isinstance(s.detector, DetectionScheduler))
+            if DET_SCHED:
+                summary.update({"det_runs": runs, "det_skipped": skipped,
+                                "det_run_ratio": round(runs / (runs + skipped), 3) if runs + skipped else 0.0})
+        elif isinstance(detector, DetectionScheduler):
+            summary.update(detector.stats())
         with open(f"{RESULTS_DIR}/edge_summary.json", "w") as f:
             json.dump(summary, f, indent=2)
         print("[EDGE] summary:", summary, flush=True)
@@ -0,0 +1,223 @@
+# edge/bench.py
+# Replayable offline benchmark for the edge pipeline. Drives the real
+# components (open_source, HogPersonDetector, Sampler, SenderWorker) from a
+# video file or a synthetic generator, with deterministic capture timestamps,
+# and sends to a local stub cloud (or --cloud-url). Prints per-stage
+# P50/P95/P99 latency + throughput and writes a JSON report to diff between commits.
+#
+#   python bench.py --source samples/input.mp4 --frames 500 --json /results/bench.json
+#   python bench.py --source synthetic:1280x720 --frames 1000 --fps 15
+import argparse, json, time, threading, platform
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np, cv2
+
+from video_source import open_source
+from detector import HogPersonDetector
+from sampler import Sampler
+from sender_worker import SenderWorker
+
+# ---------------
+# Frame sources
+# ---------------
+class SyntheticSource:
+    """Deterministic frames: textured background with a few moving person-sized blobs."""
+    def __init__(self, w=1280, h=720, people=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.w, self.h = w, h
+        self.bg = cv2.GaussianBlur(rng.integers(60, 200, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+        ph = int(0.3 * h); pw = ph // 2
+        self.people = [(rng.uniform(0, w - pw), rng.uniform(0.1 * h, h - ph - 1),
+                        rng.uniform(-6, 6), pw, ph) for _ in range(people)]
+        self.i = 0
+
+    def read(self):
+        f = self.bg.copy()
+        for (x0, y0, vx, pw, ph) in self.people:
+            x = int((x0 + vx * self.i) % (self.w - pw))
+            y = int(y0)
+            cv2.rectangle(f, (x, y), (x + pw, y + ph), (40, 40, 40), -1)
+            cv2.circle(f, (x + pw // 2, y - pw // 3), pw // 3, (40, 40, 40), -1)
+        self.i += 1
+        return True, f
+
+    def release(self):
+        pass
+
+def make_source(spec, threaded=False):
+    if spec.startswith("synthetic"):
+        w, h = 1280, 720
+        if ":" in spec:
+            w, h = map(int, spec.split(":", 1)[1].lower().split("x"))
+        return SyntheticSource(w, h)
+    return open_source(spec, threaded=threaded)
+
+# ---------------
+# Stub cloud
+# ---------------
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(n)
+        srv = self.server
+        with srv.lock:
+            srv.requests += 1
+            srv.bytes += n
+        if srv.delay_s:
+            time.sleep(srv.delay_s)
+        body = b'{"ok": true, "activities": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub_cloud(delay_ms=0.0):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    srv.lock = threading.Lock()
+    srv.requests = 0
+    srv.bytes = 0
+    srv.delay_s = delay_ms / 1000.0
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}/ingest"
+
+# ---------------
+# Report
+# ---------------
+def _pct(samples):
+    a = np.asarray(samples, dtype=np.float64)
+    if a.size == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"n": int(a.size), "mean_ms": round(float(a.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+def print_report(rep):
+    print(f"{'stage':<18}{'n':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, st in rep["stages"].items():
+        if not st.get("n"):
+            continue
+        print(f"{name:<18}{st['n']:>7}{st['mean_ms']:>9.2f}{st['p50_ms']:>9.2f}"
+              f"{st['p95_ms']:>9.2f}{st['p99_ms']:>9.2f}")
+    for name, st in rep.get("sender", {}).items():
+        print(f"sender {name}: mean={st['mean']:.2f} p95={st['p95']:.2f}")
+    print(" ".join(f"{k}={v}" for k, v in rep["throughput"].items()), flush=True)
+
+# ---------------
+# Run
+# ---------------
+def run(args):
+    cap = make_source(args.source, threaded=args.capture_thread)
+    detector = HogPersonDetector()
+    sampler = Sampler(mode=args.sampler_mode, motion_thr=args.motion_thr, heartbeat_s=args.heartbeat_s)
+
+    stub, url = (None, args.cloud_url) if args.cloud_url else start_stub_cloud(args.cloud_delay_ms)
+    sender = None
+    if url != "none":
+        sender = SenderWorker(url, maxsize=args.sender_qsize, timeout=5, wire=args.wire,
+                              batch_size=args.batch, batch_linger_ms=args.linger_ms,
+                              drop_policy=args.drop_policy, concurrency=args.concurrency,
+                              encode_workers=args.encode_workers)
+
+    stages = {k: [] for k in ("capture", "detect", "sample_decision", "submit", "frame_total")}
+    ts0 = args.ts_base
+    period = 1.0 / args.fps if args.fps > 0 else 0.0
+    forwarded = frames = 0
+    wall0 = time.perf_counter()
+    try:
+        while frames < args.frames:
+            t_start = time.perf_counter()
+            ok, frame = cap.read()
+            t_cap = time.perf_counter()
+            if not ok:
+                break
+            ts = ts0 + frames / args.ts_fps            # deterministic capture timestamp
+
+            persons = detector.predict(frame)
+            t_det = time.perf_counter()
+            forward = sampler.should_forward(frame, persons, ts)
+            t_smp = time.perf_counter()
+            if forward:
+                forwarded += 1
+                if sender is not None:
+                    sender.submit(frame, persons, ts_capture=ts, frame_id=frames)
+            t_end = time.perf_counter()
+
+            stages["capture"].append((t_cap - t_start) * 1e3)
+            stages["detect"].append((t_det - t_cap) * 1e3)
+            stages["sample_decision"].append((t_smp - t_det) * 1e3)
+            if forward:
+                stages["submit"].append((t_end - t_smp) * 1e3)
+            stages["frame_total"].append((t_end - t_start) * 1e3)
+            frames += 1
+
+            if period:
+                lag = wall0 + frames * period - time.perf_counter()
+                if lag > 0:
+                    time.sleep(lag)
+        loop_s = time.perf_counter() - wall0
+        if sender is not None:
+            sender.flush(timeout=args.drain_s)
+        wall_s = time.perf_counter() - wall0
+    finally:
+        if sender is not None:
+            sender.stop()
+        cap.release()
+        if stub is not None:
+            stub.shutdown()
+
+    rep = {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "host": {"python": platform.python_version(), "opencv": cv2.__version__,
+                 "machine": platform.machine()},
+        "stages": {k: _pct(v) for k, v in stages.items()},
+        "sender": sender.timing_stats() if sender is not None else {},
+        "throughput": {
+            "frames": frames,
+            "loop_s": round(loop_s, 3),
+            "wall_s": round(wall_s, 3),
+            "fps": round(frames / max(1e-9, loop_s), 2),
+            "forwarded": forwarded,
+            "sender_sent": getattr(sender, "sent", 0),
+            "sender_dropped": getattr(sender, "dropped", 0),
+            "capture_skipped": getattr(cap, "skipped", 0),
+            "cloud_received": stub.requests if stub is not None else None,
+            "cloud_bytes": stub.bytes if stub is not None else None,
+        },
+    }
+    return rep
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", default="synthetic:1280x720", help="video file, rtsp url or synthetic[:WxH]")
+    ap.add_argument("--capture-thread", action="store_true", help="decode on a ThreadedCapture thread")
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--fps", type=float, default=0.0, help="pace the loop; 0 = as fast as possible")
+    ap.add_argument("--ts-fps", type=float, default=15.0, help="rate used for deterministic capture timestamps")
+    ap.add_argument("--ts-base", type=float, default=1_700_000_000.0)
+    ap.add_argument("--sampler-mode", default="motion")
+    ap.add_argument("--motion-thr", type=float, default=12.0)
+    ap.add_argument("--heartbeat-s", type=float, default=2.0)
+    ap.add_argument("--sender-qsize", type=int, default=5)
+    ap.add_argument("--wire", default="multipart", choices=("multipart", "bin"))
+    ap.add_argument("--batch", type=int, default=1)
+    ap.add_argument("--linger-ms", type=float, default=0.0)
+    ap.add_argument("--drop-policy", default="drop_newest", choices=("drop_newest", "drop_oldest", "latest_only"))
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--encode-workers", type=int, default=2)
+    ap.add_argument("--cloud-url", default="", help='real cloud ingest url, or "none" to skip sending')
+    ap.add_argument("--cloud-delay-ms", type=float, default=0.0, help="stub cloud response delay")
+    ap.add_argument("--drain-s", type=float, default=10.0)
+    ap.add_argument("--json", default="")
+    args = ap.parse_args()
+
+    rep = run(args)
+    print_report(rep)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rep, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
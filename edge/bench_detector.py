@@ -0,0 +1,119 @@
+# edge/bench_detector.py
+# Latency / recall trade-off of HogPersonDetector settings on a recorded clip.
+# Recall is measured against the legacy full-resolution detector, which is
+# the best this HOG model can do on the clip (no ground truth needed).
+#
+#   python bench_detector.py samples/input.mp4 --frames 300 --work-h 360,480,720 \
+#       --roi "0.0,0.2,1.0,1.0" --json /results/bench_detector.json
+import argparse, json, time
+import cv2
+import numpy as np
+
+from detector import HogPersonDetector, parse_rois
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    ua = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / max(1e-6, ua)
+
+def _match(ref, got, thr):
+    # greedy one-to-one matching; returns number of ref boxes recovered
+    used, hits = set(), 0
+    for r in ref:
+        best, best_j = 0.0, -1
+        for j, g in enumerate(got):
+            if j in used:
+                continue
+            i = _iou(r, g)
+            if i > best:
+                best, best_j = i, j
+        if best >= thr:
+            used.add(best_j); hits += 1
+    return hits
+
+def load_frames(path, n, stride):
+    cap = cv2.VideoCapture(path)
+    frames, i = [], 0
+    while len(frames) < n:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if i % stride == 0:
+            frames.append(frame)
+        i += 1
+    cap.release()
+    return frames
+
+def run(det, frames):
+    lat, outs = [], []
+    for f in frames:
+        t0 = time.perf_counter()
+        outs.append(det.predict(f))
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return np.array(lat), outs
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("clip")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--stride", type=int, default=1, help="use every Nth frame of the clip")
+    ap.add_argument("--work-h", default="360,480,720", help="comma-separated working heights")
+    ap.add_argument("--max-h-frac", type=float, default=1.0)
+    ap.add_argument("--roi", default="", help='static ROI(s) "x1,y1,x2,y2;..." in frame fractions')
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--json", default="")
+    args = ap.parse_args()
+
+    frames = load_frames(args.clip, args.frames, args.stride)
+    if not frames:
+        raise SystemExit(f"no frames read from {args.clip}")
+    H, W = frames[0].shape[:2]
+    print(f"[BENCH] {len(frames)} frames @ {W}x{H}", flush=True)
+
+    ref_lat, ref = run(HogPersonDetector(mode="full", rois=[]), frames)
+    n_ref = sum(len(r) for r in ref)
+
+    settings = [("full", dict(mode="full", rois=[]))]
+    rois = parse_rois(args.roi)
+    for wh in [int(v) for v in args.work_h.split(",") if v]:
+        settings.append((f"scaled h={wh}", dict(mode="scaled", work_h=wh, max_h_frac=args.max_h_frac, rois=[])))
+        if rois:
+            settings.append((f"scaled h={wh} +roi", dict(mode="scaled", work_h=wh,
+                                                         max_h_frac=args.max_h_frac, rois=rois)))
+    if rois:
+        settings.append(("full +roi", dict(mode="full", rois=rois)))
+
+    rows = []
+    print(f"{'setting':<22}{'mean ms':>9}{'p50':>8}{'p95':>8}{'speedup':>9}{'recall':>8}{'dets':>7}")
+    for name, kw in settings:
+        if name == "full":
+            lat, outs = ref_lat, ref
+        else:
+            lat, outs = run(HogPersonDetector(**kw), frames)
+        hits = sum(_match([d[:4] for d in r], [d[:4] for d in o], args.iou) for r, o in zip(ref, outs))
+        row = {
+            "setting": name,
+            "mean_ms": round(float(lat.mean()), 2),
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            "speedup": round(float(ref_lat.mean() / max(1e-6, lat.mean())), 2),
+            "recall": round(hits / n_ref, 3) if n_ref else None,
+            "dets": int(sum(len(o) for o in outs)),
+        }
+        if "work_h" in kw:
+            r, nlevels = HogPersonDetector(**kw).work_params(H)
+            row["work_scale"], row["nlevels"] = round(r, 3), nlevels
+        rows.append(row)
+        rec = f"{row['recall']:.3f}" if row["recall"] is not None else "n/a"
+        print(f"{name:<22}{row['mean_ms']:>9.2f}{row['p50_ms']:>8.2f}{row['p95_ms']:>8.2f}"
+              f"{row['speedup']:>8.2f}x{rec:>8}{row['dets']:>7}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"clip": args.clip, "frames": len(frames), "size": [W, H],
+                       "ref_dets": n_ref, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
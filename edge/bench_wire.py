@@ -0,0 +1,83 @@
+# edge/bench_wire.py
+# Micro-benchmark: multipart form + JSON detections vs. the binary wire format.
+#
+# Offline (always): request-body build cost and size per frame, JPEG encoded once
+# up front since both paths share it.
+# Online (--url http://localhost:8000/ingest): N sequential POSTs per format
+# against a running cloud; reports client round trip and server cloud_latency_ms.
+#
+#   python bench_wire.py --frames 500 --dets 6 --url http://localhost:8000/ingest
+import argparse, json, time
+import numpy as np, requests
+
+from sender_worker import to_jpeg_bytes, det_dicts, encode_frame_bin, endpoint_url
+
+def _stats(ms):
+    a = np.asarray(ms, dtype=np.float64)
+    p50, p95 = np.percentile(a, [50, 95])
+    return f"mean={a.mean():.3f} p50={p50:.3f} p95={p95:.3f} ms"
+
+def make_inputs(w, h, n_dets, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    dets = []
+    for _ in range(n_dets):
+        x1, y1 = int(rng.integers(0, w - 100)), int(rng.integers(0, h - 200))
+        dets.append([x1, y1, x1 + 80, y1 + 180, float(rng.uniform(0.4, 0.99))])
+    return frame, dets
+
+def build_multipart(url, jpg, dets, ts, stream_id="bench"):
+    data = {"ts_capture": str(ts), "ts_edge_send": str(time.time()),
+            "stream_id": stream_id, "detections": json.dumps(det_dicts(dets))}
+    files = {"image": ("frame.jpg", jpg, "image/jpeg")}
+    return requests.Request("POST", url, data=data, files=files).prepare()
+
+def build_bin(url, jpg, dets, ts, w, h, i, stream_id="bench"):
+    body = encode_frame_bin(stream_id, i, ts, time.time(), w, h, dets, jpg)
+    return requests.Request("POST", endpoint_url(url, "/ingest_bin"), data=body,
+                            headers={"Content-Type": "application/octet-stream"}).prepare()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=500)
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=720)
+    ap.add_argument("--dets", type=int, default=6)
+    ap.add_argument("--url", default="", help="cloud /ingest url for the online round-trip part")
+    args = ap.parse_args()
+
+    frame, dets = make_inputs(args.width, args.height, args.dets)
+    jpg = to_jpeg_bytes(frame)
+    url = args.url or "http://localhost:8000/ingest"
+    ts0 = 1_700_000_000.0
+
+    print(f"[WIRE] {args.frames} frames, {args.dets} dets, jpeg={len(jpg)} B")
+    for name, build in (("multipart", lambda i: build_multipart(url, jpg, dets, ts0 + i / 15)),
+                        ("bin", lambda i: build_bin(url, jpg, dets, ts0 + i / 15, args.width, args.height, i))):
+        ms, size = [], 0
+        for i in range(args.frames):
+            t0 = time.perf_counter()
+            req = build(i)
+            ms.append((time.perf_counter() - t0) * 1e3)
+            size = len(req.body)
+        print(f"  build {name:<10} {_stats(ms)}  body={size} B (+{size - len(jpg)} B over jpeg)")
+
+    if not args.url:
+        return
+    s = requests.Session()
+    for name, build in (("multipart", lambda i: build_multipart(url, jpg, dets, time.time())),
+                        ("bin", lambda i: build_bin(url, jpg, dets, time.time(), args.width, args.height, i))):
+        rtt, srv = [], []
+        for i in range(args.frames):
+            req = build(i)
+            t0 = time.perf_counter()
+            r = s.send(req, timeout=5)
+            rtt.append((time.perf_counter() - t0) * 1e3)
+            r.raise_for_status()
+            js = r.json()
+            res = js["results"][0] if "results" in js else js
+            srv.append(res["cloud_latency_ms"])
+        print(f"  post  {name:<10} rtt {_stats(rtt)} | cloud {_stats(srv)}")
+
+if __name__ == "__main__":
+    main()
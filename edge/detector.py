@@ -1,5 +1,5 @@
 # edge/detector.py
-import os, cv2
+import os, math, cv2
 import numpy as np
 
 def env(name, default=None, cast=float):
@@ -19,6 +19,63 @@ BORDER_FRAC    = env("DET_BORDER_FRAC",0.02)
 DET_NMS_IOU    = env("DET_NMS_IOU",    0.40)
 MAX_DETS       = env("DET_MAX_DETS",   11, int)   # hard cap per frame
 
+# Scaled mode: run HOG on a downscaled copy with a pyramid bounded by the
+# person-size fractions, then map boxes back to full resolution.
+DET_MODE       = env("DET_MODE",       "full", None)  # full | scaled
+DET_WORK_H     = env("DET_WORK_H",     480, int)      # working height (px) in scaled mode
+DET_MAX_H_FRAC = env("DET_MAX_H_FRAC", 1.0)           # tallest person, fraction of frame height
+DET_ROI        = env("DET_ROI",        "", None)      # static ROIs "x1,y1,x2,y2;..." in frame fractions
+
+WIN_W, WIN_H = 64, 128   # default people detector window
+HOG_SCALE    = 1.05
+ROI_PAD      = 16        # work px of context around each ROI
+
+def parse_rois(spec):
+    # "0.1,0.2,0.9,1.0;..." -> [(x1,y1,x2,y2), ...] as fractions of the frame
+    rois = []
+    for part in (spec or "").split(";"):
+        vals = [v for v in part.replace(" ", "").split(",") if v]
+        if len(vals) == 4:
+            rois.append(tuple(float(v) for v in vals))
+    return rois
+
+def _fit_span(lo, hi, need, size):
+    """
+    [lo, hi) grown to at least `need` and shifted back inside [0, size) rather
+    than clipped, so a region at the frame border keeps its full extent
+    (detectMultiScale crashes on crops smaller than the window). None if the
+    frame itself is smaller than `need`.
+    """
+    if size < need:
+        return None
+    if hi - lo < need:
+        c = (lo + hi) / 2.0
+        lo, hi = c - need / 2.0, c + need / 2.0
+    if lo < 0:
+        lo, hi = 0, hi - lo
+    if hi > size:
+        lo, hi = lo - (hi - size), size
+    return max(0, int(lo)), min(size, int(math.ceil(hi)))
+
+def _merge_rects(rects):
+    # union overlapping/touching rects until stable; ROI lists are tiny
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for r in rects:
+            for o in out:
+                if r[0] <= o[2] and o[0] <= r[2] and r[1] <= o[3] and o[1] <= r[3]:
+                    o[0], o[1] = min(o[0], r[0]), min(o[1], r[1])
+                    o[2], o[3] = max(o[2], r[2]), max(o[3], r[3])
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rects = out
+    return [tuple(r) for r in rects]
+
 def _nms_xyxy(boxes, scores, iou_thr=0.4):
     if len(boxes) == 0:
         return []
@@ -46,24 +103,117 @@ def _nms_xyxy(boxes, scores, iou_thr=0.4):
     return keep
 
 class HogPersonDetector:
-    def __init__(self):
+    def __init__(self, mode=None, work_h=None, max_h_frac=None, rois=None):
         self.hog = cv2.HOGDescriptor()
         self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self.mode = mode or DET_MODE
+        self.work_h = work_h or DET_WORK_H
+        self.max_h_frac = max_h_frac or DET_MAX_H_FRAC
+        self.static_rois = parse_rois(DET_ROI) if rois is None else rois  # frame fractions
+        self._hogs = {}  # nlevels -> HOGDescriptor
+        self._warned_h = set()
 
-    def predict(self, frame_bgr):
-        H, W = frame_bgr.shape[:2]
+    def _hog_levels(self, nlevels):
+        # nlevels is read-only after construction, so keep one descriptor per pyramid depth
+        hog = self._hogs.get(nlevels)
+        if hog is None:
+            # same parameters as cv2.HOGDescriptor() (the people SVM was trained with
+            # gammaCorrection on); only nlevels differs
+            hog = cv2.HOGDescriptor((WIN_W, WIN_H), (16, 16), (8, 8), (8, 8), 9,
+                                    1, -1.0, 0, 0.2, True, nlevels)  # 0 = L2Hys
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+            self._hogs[nlevels] = hog
+        return hog
+
+    def work_params(self, H):
+        """
+        (r, nlevels) for scaled mode: the frame is resized by r so the smallest
+        person we keep (DET_MIN_H_FRAC) fills the 128 px window at level 0;
+        the pyramid stops once DET_MAX_H_FRAC fits. DET_WORK_H is a cap that
+        yields to DET_MIN_H_FRAC: shrinking further would make those people
+        smaller than the window and undetectable (logged once per height).
+        """
+        r = min(1.0, WIN_H / max(1.0, DET_MIN_H_FRAC * H))
+        if r * H > self.work_h + 0.5 and H not in self._warned_h:
+            self._warned_h.add(H)
+            print(f"[DET] DET_WORK_H={self.work_h} raised to {int(round(r * H))}px for {H}px frames "
+                  f"so people {DET_MIN_H_FRAC:.0%} of the frame height still fill the {WIN_H}px window",
+                  flush=True)
+        max_px = self.max_h_frac * H * r
+        nlevels = 1 + max(0, int(math.ceil(math.log(max(1.0, max_px / WIN_H)) / math.log(HOG_SCALE))))
+        return r, nlevels
 
+    def detect_raw(self, img, hog=None):
         # HOG detectMultiScale: use positional args (no kwargs!)
         # Signature: img, hitThreshold, winStride, padding, scale, groupThreshold
-        rects, weights = self.hog.detectMultiScale(
-            frame_bgr,
+        return (hog or self.hog).detectMultiScale(
+            img,
             0.0,               # hitThreshold
             (8, 8),            # winStride
             (8, 8),            # padding
-            1.05,              # scale
+            HOG_SCALE,         # scale
             2                  # groupThreshold (stronger grouping)
         )
 
+    def _regions(self, H, W, r, rois):
+        # search regions in work coords; rois are full-res (x1,y1,x2,y2) boxes
+        Hw, Ww = int(round(H * r)), int(round(W * r))
+        boxes = [(fx1 * W, fy1 * H, fx2 * W, fy2 * H) for (fx1, fy1, fx2, fy2) in self.static_rois]
+        if rois is not None:
+            boxes = list(rois) if not boxes else [
+                (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+                for a in rois for b in boxes
+                if min(a[2], b[2]) > max(a[0], b[0]) and min(a[3], b[3]) > max(a[1], b[1])]
+        out = []
+        for (x1, y1, x2, y2) in boxes:
+            # at least one padded window so HOG can fire inside it
+            xs = _fit_span(x1 * r - ROI_PAD, x2 * r + ROI_PAD, WIN_W + 16, Ww)
+            ys = _fit_span(y1 * r - ROI_PAD, y2 * r + ROI_PAD, WIN_H + 16, Hw)
+            if xs is not None and ys is not None:
+                out.append((xs[0], ys[0], xs[1], ys[1]))
+        return _merge_rects(out)
+
+    def predict(self, frame_bgr, rois=None):
+        """
+        rois: optional full-res (x1,y1,x2,y2) boxes to restrict the search to
+        (e.g. motion regions); intersected with DET_ROI when both are set.
+        An empty list means nothing to search.
+        """
+        H, W = frame_bgr.shape[:2]
+        if H < WIN_H or W < WIN_W:
+            return []           # smaller than one window: nothing to find, and HOG would crash
+        if self.mode != "scaled" and rois is None and not self.static_rois:
+            rects, weights = self.detect_raw(frame_bgr)
+            return self.postprocess(rects, weights, H, W)
+
+        r, hog = 1.0, self.hog
+        img = frame_bgr
+        if self.mode == "scaled":
+            r, nlevels = self.work_params(H)
+            hog = self._hog_levels(nlevels)
+            if r < 1.0:
+                img = cv2.resize(frame_bgr, (max(1, int(round(W * r))), max(1, int(round(H * r)))),
+                                 interpolation=cv2.INTER_AREA)
+
+        if rois is None and not self.static_rois:
+            if img.shape[0] < WIN_H or img.shape[1] < WIN_W:
+                return []
+            regions = [(0, 0, img.shape[1], img.shape[0])]
+        else:
+            regions = self._regions(H, W, r, rois)
+
+        rects, weights = [], []
+        for (x1, y1, x2, y2) in regions:
+            rr, ww = self.detect_raw(img[y1:y2, x1:x2], hog)
+            w_arr = np.array(ww, dtype=np.float32).reshape(-1)
+            for (x, y, w, h), sc in zip(rr, w_arr):
+                # back to full-resolution coordinates
+                rects.append([(x + x1) / r, (y + y1) / r, w / r, h / r])
+                weights.append(float(sc))
+        return self.postprocess(rects, weights, H, W)
+
+    def postprocess(self, rects, weights, H, W):
+        # rects are (x, y, w, h) in the H x W frame; applies score/size/AR/border gates + NMS
         if len(rects) == 0:
             return []
 
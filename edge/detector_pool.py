@@ -0,0 +1,270 @@
+# edge/detector_pool.py
+import math, queue, threading, itertools, time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np, cv2
+
+from detector import HogPersonDetector, WIN_W, WIN_H
+
+MIN_BAND_H = 144   # HOG window (128) + padding; thinner bands can't hold a person
+
+def _worker(task_q, result_q):
+    # Runs in a spawned process: one HOG model per worker, single-threaded
+    # OpenCV so N workers don't oversubscribe the cores.
+    cv2.setNumThreads(1)
+    det = HogPersonDetector()
+    attached = {}  # slot -> SharedMemory (re-attached when the parent grows a slot)
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        seq, part, slot, name, shape, y0, y1, extra = task
+        try:
+            shm = attached.get(slot)
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                shm = attached[slot] = shared_memory.SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            if y0 is None:
+                out = det.predict(frame, rois=extra)       # extra = ROI boxes
+            else:
+                hog = det._hog_levels(extra) if extra else None   # extra = nlevels
+                if y1 - y0 < WIN_H or shape[1] < WIN_W:
+                    rects, weights = (), ()                       # HOG crashes below one window
+                else:
+                    rects, weights = det.detect_raw(frame[y0:y1], hog)
+                w_arr = np.array(weights, dtype=np.float32).reshape(-1)
+                out = ([[int(x), int(y) + y0, int(w), int(h)] for (x, y, w, h) in rects],
+                       [float(v) for v in w_arr])
+            del frame
+            result_q.put((seq, part, out, None))
+        except Exception as e:
+            result_q.put((seq, part, None, repr(e)))
+    for shm in attached.values():
+        try:
+            shm.close()
+        except Exception:
+            pass
+
+
+class HogDetectorPool:
+    """
+    HOG person detection spread over `workers` processes. Frames are copied
+    once into shared-memory slots and workers attach by name, so pixels are
+    never pickled.
+
+    mode="frames": each frame goes to one worker. Keep several frames in
+                   flight with submit()/get(); results come back in submit order.
+    mode="tiles":  each frame is cut into horizontal bands with `tile_overlap`
+                   (fraction of frame height) of overlap, detected in parallel
+                   and merged, which lowers single-frame latency. People taller
+                   than a band are missed, so keep the overlap >= DET_MIN_H_FRAC.
+                   In DET_MODE=scaled the parent downscales once before tiling;
+                   ROIs are ignored in this mode.
+
+    predict(frame) works in both modes and returns the same
+    [[x1,y1,x2,y2,score], ...] as HogPersonDetector.predict; it gives up
+    after `predict_timeout_s` and returns [].
+
+    A worker that dies (e.g. a native crash in OpenCV) is respawned. Tasks
+    come off one shared queue, so its frame can't be told apart from the
+    others in flight: every pending frame completes with [] and counts as an
+    error, which keeps slots from leaking and get() callers from hanging.
+    """
+    def __init__(self, workers=4, mode="frames", tile_overlap=0.25, slots=None, predict_timeout_s=10.0):
+        self._ctx = mp.get_context("spawn")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.tile_overlap = tile_overlap
+        self.predict_timeout_s = predict_timeout_s
+        self._local = HogPersonDetector()   # postprocess for merged tiles
+        self._task_q = self._ctx.Queue()
+        self._result_q = self._ctx.Queue()
+        self._procs = [self._spawn() for _ in range(self.workers)]
+        self.respawns = 0
+
+        nslots = slots or self.workers * 2
+        self._slots = [None] * nslots
+        self._free = queue.Queue()
+        for i in range(nslots):
+            self._free.put(i)
+
+        self._seq = itertools.count()
+        self._pending = {}   # seq -> {"slot","tag","n","parts","shape","r"}
+        self._done = {}      # seq -> (tag, dets)
+        self._next_out = 0
+        self._cv = threading.Condition()
+        self._closed = False
+        self._closing = False   # workers are being shut down on purpose: don't respawn
+        self.errors = 0
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _spawn(self):
+        p = self._ctx.Process(target=_worker, args=(self._task_q, self._result_q), daemon=True)
+        p.start()
+        return p
+
+    def _check_workers(self):
+        dead = [i for i, p in enumerate(self._procs) if not p.is_alive()]
+        if not dead or self._closing:
+            return
+        for i in dead:
+            print(f"[DET-POOL] worker {i} died (exit code {self._procs[i].exitcode}); respawning", flush=True)
+            self._procs[i] = self._spawn()
+            self.respawns += 1
+        with self._cv:
+            failed, self._pending = self._pending, {}
+            for seq, p in failed.items():
+                self.errors += 1
+                if seq >= self._next_out:
+                    self._done[seq] = (p["tag"], [])
+            self._cv.notify_all()
+        # late parts for these frames are ignored (no longer pending)
+        for p in failed.values():
+            self._free.put(p["slot"])
+
+    # ---------- shared memory ----------
+    def _ensure_slot(self, slot, nbytes):
+        shm = self._slots[slot]
+        if shm is None or shm.size < nbytes:
+            # slot is free here, so no worker is reading it
+            if shm is not None:
+                shm.close(); shm.unlink()
+            shm = self._slots[slot] = shared_memory.SharedMemory(create=True, size=nbytes)
+        return shm
+
+    def _bands(self, H):
+        n = self.workers
+        step = int(math.ceil(H / n))
+        half_ov = int(self.tile_overlap * H) // 2
+        if n == 1 or step + half_ov < MIN_BAND_H:
+            return [(0, H)]
+        return [(max(0, i * step - half_ov), min(H, (i + 1) * step + half_ov)) for i in range(n)]
+
+    # ---------- API ----------
+    def submit(self, frame_bgr, tag=None, rois=None):
+        """Queue a frame; blocks while every slot is in flight (backpressure)."""
+        if self._closing:
+            raise RuntimeError("HogDetectorPool is closed")
+        H, W = frame_bgr.shape[:2]
+        r, extra = 1.0, rois
+        if self.mode == "tiles":
+            extra = None
+            if self._local.mode == "scaled":
+                r, extra = self._local.work_params(H)
+                if r < 1.0:
+                    frame_bgr = cv2.resize(frame_bgr, (max(1, int(round(W * r))), max(1, int(round(H * r)))),
+                                           interpolation=cv2.INTER_AREA)
+        frame = np.ascontiguousarray(frame_bgr, dtype=np.uint8)
+        while True:
+            try:
+                slot = self._free.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if self._closed:
+                    raise RuntimeError("HogDetectorPool is closed")
+        shm = self._ensure_slot(slot, frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)
+        view[...] = frame
+        del view
+        bands = self._bands(frame.shape[0]) if self.mode == "tiles" else [(None, None)]
+
+        seq = next(self._seq)
+        with self._cv:
+            self._pending[seq] = {"slot": slot, "tag": tag, "n": len(bands),
+                                  "parts": {}, "shape": (H, W), "r": r}
+        for part, (y0, y1) in enumerate(bands):
+            self._task_q.put((seq, part, slot, shm.name, frame.shape, y0, y1, extra))
+        return seq
+
+    def get(self, timeout=None):
+        """Next result in submit order as (tag, dets), or None on timeout."""
+        with self._cv:
+            ok = self._cv.wait_for(lambda: self._next_out in self._done or self._closed, timeout)
+            if not ok or self._next_out not in self._done:
+                return None
+            out = self._done.pop(self._next_out)
+            self._next_out += 1
+            return out
+
+    def predict(self, frame_bgr, rois=None):
+        # synchronous use; don't interleave with submit()/get() from other threads
+        seq = self.submit(frame_bgr, rois=rois)
+        res = self.get(timeout=self.predict_timeout_s)
+        if res is None:
+            with self._cv:
+                # skip the frame: its result is dropped whenever it turns up
+                self._done.pop(seq, None)
+                self._next_out = max(self._next_out, seq + 1)
+                self.errors += 1
+            print(f"[DET-POOL] frame {seq} timed out after {self.predict_timeout_s}s", flush=True)
+            return []
+        return res[1]
+
+    def _collect(self):
+        next_check = 0.0
+        while not self._closed:
+            now = time.monotonic()
+            if now >= next_check:
+                self._check_workers()
+                next_check = now + 0.5
+            try:
+                seq, part, out, err = self._result_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if err is not None:
+                self.errors += 1
+                print(f"[DET-POOL] worker error on frame {seq}: {err}", flush=True)
+            with self._cv:
+                p = self._pending.get(seq)
+                if p is None:
+                    continue
+                p["parts"][part] = out
+                if len(p["parts"]) < p["n"]:
+                    continue
+                del self._pending[seq]
+            self._free.put(p["slot"])
+            dets = self._merge(p)
+            with self._cv:
+                if seq >= self._next_out:      # else predict() already gave up on it
+                    self._done[seq] = (p["tag"], dets)
+                self._cv.notify_all()
+
+    def _merge(self, p):
+        parts = [p["parts"][k] for k in sorted(p["parts"])]
+        if self.mode != "tiles":
+            return parts[0] or []
+        rects, weights = [], []
+        r = p["r"]
+        for out in parts:
+            if out is None:
+                continue
+            rects.extend([[x / r, y / r, w / r, h / r] for (x, y, w, h) in out[0]])
+            weights.extend(out[1])
+        H, W = p["shape"]
+        # NMS in postprocess also removes duplicates from the band overlaps
+        return self._local.postprocess(rects, weights, H, W)
+
+    def close(self):
+        self._closing = True
+        for _ in self._procs:
+            self._task_q.put(None)
+        for p in self._procs:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+        self._collector.join(timeout=1)
+        for shm in self._slots:
+            if shm is not None:
+                try:
+                    shm.close(); shm.unlink()
+                except Exception:
+                    pass
+        self._slots = [None] * len(self._slots)
@@ -0,0 +1,125 @@
+# edge/encoder.py
+import time, threading
+from collections import deque
+import cv2
+
+from sender_worker import to_jpeg_bytes
+
+# (name, jpeg quality, scale, crop-to-detections); index = pressure level
+LEVELS = [
+    ("q80",      80, 1.00, False),
+    ("q65",      65, 1.00, False),
+    ("q50s75",   50, 0.75, False),
+    ("q40s50",   40, 0.50, False),
+    ("crop60",   60, 1.00, True),
+]
+
+def _merge_boxes(boxes):
+    boxes = [list(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for b in boxes:
+            for o in out:
+                if b[0] <= o[2] and o[0] <= b[2] and b[1] <= o[3] and o[1] <= b[3]:
+                    o[0], o[1], o[2], o[3] = min(o[0], b[0]), min(o[1], b[1]), max(o[2], b[2]), max(o[3], b[3])
+                    merged = True
+                    break
+            else:
+                out.append(b)
+        boxes = out
+    return boxes
+
+class AdaptiveEncoder:
+    """
+    Chooses a JPEG encode level per frame from sender pressure: queue fill,
+    an EMA of send latency and, if set, an uplink budget in kbit/s. Any
+    signal over its limit steps one level down (lower quality, then smaller
+    scale, then padded crops around the detections); `recover_s` of
+    sustained headroom steps one level back up.
+
+    encode() returns (jpeg, parts, level_name): a full (possibly downscaled)
+    frame in `jpeg`, or crop parts [(x, y, w, h, jpeg), ...] in full-res
+    coordinates. Crops need the binary wire format; with `allow_crop=False`
+    the last level is never used.
+    """
+    def __init__(self, budget_kbps=0.0, max_send_ms=250.0, high_fill=0.6, low_fill=0.2,
+                 hold_s=0.5, recover_s=3.0, crop_pad=0.15, allow_crop=True):
+        self.budget_Bps = budget_kbps * 1000.0 / 8.0
+        self.max_send_ms = max_send_ms
+        self.high_fill = high_fill
+        self.low_fill = low_fill
+        self.hold_s = hold_s
+        self.recover_s = recover_s
+        self.crop_pad = crop_pad
+        self.max_level = len(LEVELS) - (1 if allow_crop else 2)
+        self.level = 0
+        self.send_ema_ms = 0.0
+        self.queue_fill = 0.0
+        self._sent = deque()          # (ts, nbytes) over the last second
+        self._last_change = 0.0
+        self._headroom_since = None
+        self._lock = threading.Lock()   # encode/observe run on the sender's thread pool
+
+    # ---------- feedback ----------
+    def observe_queue(self, fill):
+        self.queue_fill = fill
+
+    def observe_send(self, send_ms, nbytes, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.send_ema_ms = 0.2 * send_ms + 0.8 * self.send_ema_ms
+            self._sent.append((now, nbytes))
+
+    def rate_Bps(self, now=None):
+        now = time.time() if now is None else now
+        while self._sent and now - self._sent[0][0] > 1.0:
+            self._sent.popleft()
+        return float(sum(n for _, n in self._sent))
+
+    def _update_level(self, now):
+        rate = self.rate_Bps(now)
+        pressure = (self.queue_fill >= self.high_fill or self.send_ema_ms > self.max_send_ms
+                    or (self.budget_Bps > 0 and rate > self.budget_Bps))
+        headroom = (self.queue_fill <= self.low_fill and self.send_ema_ms < 0.5 * self.max_send_ms
+                    and (self.budget_Bps <= 0 or rate < 0.7 * self.budget_Bps))
+        if pressure:
+            self._headroom_since = None
+            if self.level < self.max_level and now - self._last_change >= self.hold_s:
+                self.level += 1
+                self._last_change = now
+        elif headroom and self.level > 0:
+            if self._headroom_since is None:
+                self._headroom_since = now
+            elif now - self._headroom_since >= self.recover_s:
+                self.level -= 1
+                self._last_change = now
+                self._headroom_since = now
+        else:
+            self._headroom_since = None
+
+    # ---------- encode ----------
+    def encode(self, frame_bgr, dets):
+        now = time.time()
+        with self._lock:
+            self._update_level(now)
+            name, quality, scale, crop = LEVELS[self.level]
+        H, W = frame_bgr.shape[:2]
+        if not crop:
+            img = frame_bgr
+            if scale < 1.0:
+                img = cv2.resize(frame_bgr, (int(W * scale), int(H * scale)), interpolation=cv2.INTER_AREA)
+            return to_jpeg_bytes(img, quality=quality), None, name
+
+        parts = []
+        boxes = []
+        for (x1, y1, x2, y2, _) in dets:
+            px, py = self.crop_pad * (x2 - x1), self.crop_pad * (y2 - y1)
+            boxes.append((max(0, int(x1 - px)), max(0, int(y1 - py)),
+                          min(W, int(x2 + px)), min(H, int(y2 + py))))
+        for (x1, y1, x2, y2) in _merge_boxes(boxes):
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            parts.append((x1, y1, x2 - x1, y2 - y1, to_jpeg_bytes(frame_bgr[y1:y2, x1:x2], quality=quality)))
+        return None, parts, name
@@ -1,23 +1,140 @@
-import time, csv, psutil
+import time, csv, psutil, threading
+from array import array
 from collections import deque
 
+from histogram import LogHistogram, prom_histogram
+
+DEPTH_LES = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
 class EdgeMetrics:
-    def __init__(self, csv_path):
+    """
+    In-memory metrics core. mark() records into a per-stage LogHistogram and
+    a preallocated ring of raw samples; nothing on the hot path touches the
+    disk or psutil. A background thread samples CPU/memory every
+    `resource_every_s` and flushes new ring rows to the CSV every
+    `flush_every_s` (rows overwritten before a flush are counted in
+    `ring_overwritten`). Live percentiles: stage_percentiles().
+
+    Every 64th mark is timed; finalize() reports the mean as
+    metrics_overhead_us.
+    """
+    def __init__(self, csv_path, ring_size=65536, flush_every_s=2.0, resource_every_s=1.0):
         self.csv = open(csv_path, "w", newline="")
         self.w = csv.writer(self.csv)
-        self.w.writerow(["ts","stage","frame_id","dt_ms","fps","cpu_pct","mem_pct","forwarded"])
+        self.w.writerow(["ts","stage","frame_id","dt_ms","fps","cpu_pct","mem_pct","forwarded","bytes","level"])
         self._first_ts = time.time()
         self._frame_count = 0
         self._forwarded = 0
         self._fps_window = deque(maxlen=60)
+        self._qdepth = {}  # queue name -> {"last","max","sum","n"}
+        self._send_bytes = 0
+        self._send_frames = 0
+        self._levels = {}  # encode level -> frames
+        self._lock = threading.Lock()  # stages may mark from several threads
+
+        # per-stage histograms; stage / level names are interned to small ints for the ring
+        self._hists = {}
+        self._names = []
+        self._name_idx = {}
+        # raw sample ring (struct of arrays, preallocated)
+        self._cap = ring_size
+        self._r_ts = array("d", bytes(8 * ring_size))
+        self._r_dt = array("d", bytes(8 * ring_size))
+        self._r_fid = array("q", bytes(8 * ring_size))
+        self._r_stage = array("H", bytes(2 * ring_size))
+        self._r_bytes = array("q", bytes(8 * ring_size))
+        self._r_level = array("H", bytes(2 * ring_size))  # 0 = none, else name index + 1
+        self._w = 0             # total samples written
+        self._flushed = 0       # total samples flushed to csv
+        self.ring_overwritten = 0
+
+        # mark() self-timing
+        self._n_marks = 0
+        self._ovh_s = 0.0
+        self._ovh_n = 0
+
+        # resources, sampled off-thread
+        self.cpu_pct = 0.0
+        self.mem_pct = 0.0
+        self._res = []          # (ts, cpu, mem) since the last flush
+        self._cpu_sum = self._mem_sum = 0.0
+        self._cpu_max = self._mem_max = 0.0
+        self._res_n = 0
+        self.flush_every_s = flush_every_s
+        self.resource_every_s = resource_every_s
+        self._stop = threading.Event()
+        psutil.cpu_percent(interval=None)  # prime; first call always returns 0
+        self._bg = threading.Thread(target=self._background, daemon=True)
+        self._bg.start()
+
+    # ---------- hot path ----------
+    def _intern(self, name):
+        i = self._name_idx.get(name)
+        if i is None:
+            with self._lock:
+                i = self._name_idx.get(name)
+                if i is None:
+                    i = self._name_idx[name] = len(self._names)
+                    self._names.append(name)
+        return i
+
+    def _hist(self, stage):
+        h = self._hists.get(stage)
+        if h is None:
+            h = self._hists.setdefault(stage, LogHistogram())
+        return h
+
+    def _push(self, now, stage, frame_id, dt_ms, nbytes=0, level=0):
+        with self._lock:
+            i = self._w % self._cap
+            self._r_ts[i] = now
+            self._r_dt[i] = dt_ms
+            self._r_fid[i] = frame_id
+            self._r_stage[i] = stage
+            self._r_bytes[i] = nbytes
+            self._r_level[i] = level
+            self._w += 1
 
     def mark(self, stage, frame_id, start_ts):
+        self._n_marks += 1
+        timed = not (self._n_marks & 63)
+        if timed:
+            t = time.perf_counter()
         now = time.time()
         dt_ms = (now - start_ts) * 1000.0
-        self.w.writerow([f"{now:.3f}", stage, frame_id, f"{dt_ms:.1f}",
-                         "", f"{psutil.cpu_percent(interval=None):.1f}",
-                         f"{psutil.virtual_memory().percent:.1f}",
-                         self._forwarded])
+        self._hist(stage).record(dt_ms)
+        self._push(now, self._intern(stage), frame_id, dt_ms)
+        if timed:
+            self._ovh_s += time.perf_counter() - t
+            self._ovh_n += 1
+
+    def record_send(self, frame_id, send_ms, nbytes, level):
+        # one sample per delivered frame: send latency, payload bytes, encode level
+        now = time.time()
+        self._hist("send").record(send_ms)
+        with self._lock:
+            self._send_bytes += nbytes
+            self._send_frames += 1
+            self._levels[level] = self._levels.get(level, 0) + 1
+        self._push(now, self._intern("send"), frame_id, send_ms, nbytes, self._intern(level) + 1)
+
+    def record_queue_depth(self, name, depth):
+        # called from several stage threads
+        with self._lock:
+            q = self._qdepth.get(name)
+            if q is None:
+                q = self._qdepth[name] = {"last": 0, "max": 0, "sum": 0, "n": 0,
+                                          "counts": [0] * (DEPTH_LES[-1] + 2)}  # exact per depth, last = overflow
+            q["counts"][min(depth, DEPTH_LES[-1] + 1)] += 1
+            q["last"] = depth
+            q["max"] = max(q["max"], depth)
+            q["sum"] += depth
+            q["n"] += 1
+
+    def queue_depths(self):
+        with self._lock:
+            items = [(name, q["sum"], q["n"], q["max"]) for name, q in self._qdepth.items()]
+        return {name: {"avg": round(s / max(1, n), 2), "max": mx} for name, s, n, mx in items}
 
     def tick_fps(self):
         now = time.time()
@@ -27,6 +144,107 @@ class EdgeMetrics:
     def increment_forwarded(self):
         self._forwarded += 1
 
+    # ---------- background ----------
+    def _background(self):
+        next_res = next_flush = time.time()
+        while not self._stop.is_set():
+            now = time.time()
+            if now >= next_res:
+                self._sample_resources(now)
+                next_res = now + self.resource_every_s
+            if now >= next_flush:
+                self._flush_rows()
+                next_flush = now + self.flush_every_s
+            self._stop.wait(max(0.0, min(next_res, next_flush) - time.time()))
+
+    def _sample_resources(self, now):
+        cpu = psutil.cpu_percent(interval=None)
+        mem = psutil.virtual_memory().percent
+        self.cpu_pct, self.mem_pct = cpu, mem
+        with self._lock:
+            self._res.append((now, cpu, mem))
+        self._cpu_sum += cpu; self._mem_sum += mem
+        self._cpu_max = max(self._cpu_max, cpu); self._mem_max = max(self._mem_max, mem)
+        self._res_n += 1
+
+    def _flush_rows(self):
+        with self._lock:
+            w, start = self._w, self._flushed
+            if w - start > self._cap:
+                self.ring_overwritten += w - start - self._cap
+                start = w - self._cap
+            # copy the pending span (two slices if it wraps) so the lock is held for memcpy only
+            a, b = start % self._cap, w % self._cap
+            cols = (self._r_ts, self._r_stage, self._r_fid, self._r_dt, self._r_bytes, self._r_level)
+            if w == start:
+                cols = [c[0:0] for c in cols]
+            elif a < b:
+                cols = [c[a:b] for c in cols]
+            else:
+                cols = [c[a:] + c[:b] for c in cols]
+            res, self._res = self._res, []
+            self._flushed = w
+            names = list(self._names)
+        fwd = self._forwarded
+        out = []
+        for ts, st, fid, dt, nb, lv in zip(*cols):
+            if lv:
+                out.append([f"{ts:.3f}", names[st], fid, f"{dt:.1f}", "", "", "", fwd, nb, names[lv - 1]])
+            else:
+                out.append([f"{ts:.3f}", names[st], fid, f"{dt:.1f}", "", "", "", fwd, "", ""])
+        for ts, cpu, mem in res:
+            out.append([f"{ts:.3f}", "resource", "", "", f"{self.current_fps():.2f}",
+                        f"{cpu:.1f}", f"{mem:.1f}", fwd, "", ""])
+        if out:
+            out.sort(key=lambda r: r[0])
+            self.w.writerows(out)
+            self.csv.flush()
+
+    # ---------- reporting ----------
+    def stage_percentiles(self):
+        return {name: h.summary() for name, h in list(self._hists.items())}
+
+    def prometheus_text(self, counters=None):
+        """
+        Scrape body for /metrics. `counters` maps extra counter names (e.g.
+        sender sent/dropped, optionally with a {label="..."} suffix) to
+        values; histograms are read via snapshots so
+        scraping never blocks a mark() for more than a list copy.
+        """
+        lines = ["# TYPE edge_stage_latency_ms histogram"]
+        for name, h in sorted(list(self._hists.items())):   # stages may register mid-scrape
+            lines += prom_histogram("edge_stage_latency_ms", h, f'stage="{name}"')
+        with self._lock:
+            qdepth = [(name, list(q["counts"]), q["sum"], q["n"]) for name, q in self._qdepth.items()]
+        if qdepth:
+            lines.append("# TYPE edge_queue_depth histogram")
+            for name, counts, qsum, qn in sorted(qdepth):
+                acc, lo = 0, 0
+                for le in DEPTH_LES:
+                    acc += sum(counts[lo:le + 1])
+                    lo = le + 1
+                    lines.append(f'edge_queue_depth_bucket{{queue="{name}",le="{le}"}} {acc}')
+                lines.append(f'edge_queue_depth_bucket{{queue="{name}",le="+Inf"}} {sum(counts)}')
+                lines.append(f'edge_queue_depth_sum{{queue="{name}"}} {qsum}')
+                lines.append(f'edge_queue_depth_count{{queue="{name}"}} {qn}')
+        all_counters = {"edge_frames_total": self._frame_count, "edge_forwarded_total": self._forwarded}
+        all_counters.update(counters or {})
+        typed = set()
+        for name, v in all_counters.items():     # names may carry {labels}
+            base = name.split("{", 1)[0]
+            if base not in typed:
+                typed.add(base)
+                lines.append(f"# TYPE {base} counter")
+            lines.append(f"{name} {v}")
+        for name, v in (("edge_fps", self.current_fps()), ("edge_cpu_pct", self.cpu_pct),
+                        ("edge_mem_pct", self.mem_pct)):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {v:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def mark_overhead_us(self):
+        return self._ovh_s / self._ovh_n * 1e6 if self._ovh_n else 0.0
+
     def maybe_periodic_print(self, every_s=5):
         now = time.time()
         if not hasattr(self, "_last_print"):
@@ -34,7 +252,11 @@ class EdgeMetrics:
             return
         if (now - self._last_print) >= every_s:
             fps = self.current_fps()
-            print(f"[EDGE] fps={fps:.2f} cpu={psutil.cpu_percent():.1f}% mem={psutil.virtual_memory().percent:.1f}% fwd={self._forwarded}")
+            qd = " ".join(f"q_{name}={q['last']}" for name, q in list(self._qdepth.items()))
+            det = self._hists.get("detect")
+            p95 = f" det_p95={det.percentiles((95,))[0]:.1f}ms" if det is not None and det.count else ""
+            print(f"[EDGE] fps={fps:.2f} cpu={self.cpu_pct:.1f}% mem={self.mem_pct:.1f}% fwd={self._forwarded}"
+                  + p95 + (f" {qd}" if qd else ""))
             self._last_print = now
 
     def current_fps(self):
@@ -42,9 +264,25 @@ class EdgeMetrics:
         return (len(self._fps_window)-1) / (self._fps_window[-1] - self._fps_window[0])
 
     def finalize(self):
-        self.csv.flush(); self.csv.close()
+        self._stop.set()
+        self._bg.join(timeout=5)
+        self._flush_rows()
+        with self._lock:
+            self.csv.flush(); self.csv.close()
         runtime_s = time.time() - self._first_ts
-        return {"runtime_s": round(runtime_s,2),
-                "frames": self._frame_count,
-                "forwarded": self._forwarded,
-                "avg_fps": round(self.current_fps(),2)}
+        out = {"runtime_s": round(runtime_s,2),
+               "frames": self._frame_count,
+               "forwarded": self._forwarded,
+               "avg_fps": round(self.current_fps(),2),
+               "stages": self.stage_percentiles(),
+               "metrics_overhead_us": round(self.mark_overhead_us(), 2),
+               "ring_overwritten": self.ring_overwritten}
+        if self._res_n:
+            out["cpu_pct"] = {"avg": round(self._cpu_sum / self._res_n, 1), "max": self._cpu_max}
+            out["mem_pct"] = {"avg": round(self._mem_sum / self._res_n, 1), "max": self._mem_max}
+        if self._qdepth:
+            out["queue_depth"] = self.queue_depths()
+        if self._send_frames:
+            out["send_bytes_per_frame"] = round(self._send_bytes / self._send_frames, 1)
+            out["send_levels"] = dict(self._levels)
+        return out
@@ -0,0 +1,31 @@
+# edge/metrics_server.py
+# Tiny scrape endpoint: GET /metrics -> Prometheus text format, served from a daemon thread.
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            body = self.server.render().encode("utf-8")
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port, render, host="0.0.0.0"):
+    """Serve render() at /metrics; returns the server (call .shutdown() to stop)."""
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    srv.render = render
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
@@ -0,0 +1,271 @@
+# edge/multicam.py
+# Several cameras in one edge process: per-camera capture thread, Sampler
+# and stream_id, one shared detector (HOG or HogDetectorPool) and one
+# SenderWorker, with a fair scheduler deciding whose frame is detected next.
+import re, threading, time
+from collections import deque
+
+POLICIES = ("rr", "deadline")
+
+def parse_sources(spec, default_id="cam"):
+    """
+    "cam1=rtsp://a/x,cam2=samples/b.mp4" -> [("cam1", "rtsp://a/x"), ("cam2", "samples/b.mp4")].
+    Entries without an `id=` prefix become <default_id>-<index>.
+    """
+    out = []
+    for i, item in enumerate(s.strip() for s in spec.split(",")):
+        if not item:
+            continue
+        m = re.match(r"^([A-Za-z0-9_.-]+)=(.+)$", item)
+        out.append((m.group(1), m.group(2)) if m else (f"{default_id}-{i}", item))
+    return out
+
+def parse_fps(spec, stream_ids):
+    """"15" -> same target for every stream; "cam1=15,cam2=5" -> per stream (others 0 = unlimited)."""
+    spec = (spec or "").strip()
+    if not spec:
+        return {sid: 0.0 for sid in stream_ids}
+    if "=" not in spec:
+        return {sid: float(spec) for sid in stream_ids}
+    out = {sid: 0.0 for sid in stream_ids}
+    for item in spec.split(","):
+        k, _, v = item.partition("=")
+        if k.strip() in out:
+            out[k.strip()] = float(v)
+    return out
+
+
+class CameraStream:
+    """
+    One camera. `cap` must be a ThreadedCapture so polling it never blocks;
+    `detector` is an optional per-stream wrapper (e.g. a DetectionScheduler
+    around the shared detector) and `annot` an optional AsyncAnnotator.
+    `fps` is the detection-rate target used by the deadline policy (0 = as
+    fast as the fair share allows).
+    """
+    def __init__(self, stream_id, cap, sampler, fps=0.0, detector=None, annot=None):
+        self.stream_id = stream_id
+        self.cap = cap
+        self.sampler = sampler
+        self.fps = fps
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.detector = detector
+        self.annot = annot
+        self.frame_id = 0
+        self.frames = 0          # frames detected
+        self.forwarded = 0
+        self.late = 0            # served after its deadline had already passed by a full period
+        self.next_due = 0.0
+        self.last_served = 0.0
+        self._fps_window = deque(maxlen=60)
+
+    @property
+    def done(self):
+        return self.cap.done
+
+    def served(self, now):
+        if self.period:
+            if self.last_served and now - self.next_due >= self.period:
+                self.late += 1
+            # keep the cadence; resync after a gap instead of bursting to catch up
+            self.next_due = self.next_due + self.period if now - self.next_due < self.period else now + self.period
+        self.last_served = now
+
+    def tick(self, now):
+        self.frames += 1
+        self._fps_window.append(now)
+
+    def current_fps(self):
+        w = self._fps_window
+        if len(w) < 2 or w[-1] == w[0]:
+            return 0.0
+        return (len(w) - 1) / (w[-1] - w[0])
+
+    def stats(self):
+        out = {"frames": self.frames, "forwarded": self.forwarded, "fps": round(self.current_fps(), 2),
+               "fps_target": self.fps, "late": self.late}
+        if hasattr(self.cap, "skipped"):
+            out["capture_skipped"] = self.cap.skipped
+        if hasattr(self.detector, "stats"):
+            out.update(self.detector.stats())
+        return out
+
+
+class FairScheduler:
+    """
+    Picks the next stream to detect among those with a frame waiting.
+
+    rr:       least recently served first, so every camera with frames gets
+              an equal share whatever its frame rate or activity.
+    deadline: earliest deadline first over per-stream `fps` targets; a
+              stream is not eligible before its next deadline, so a camera
+              cannot take more than its target and the slack goes to the
+              others. Streams without a target (fps=0) are always eligible
+              and ordered by last service, like rr.
+    """
+    def __init__(self, streams, policy="rr", idle_sleep_s=0.005):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}; expected one of {POLICIES}")
+        self.streams = list(streams)
+        self.policy = policy
+        self.idle_sleep_s = idle_sleep_s
+
+    def _order(self, now):
+        if self.policy == "rr":
+            return sorted(self.streams, key=lambda s: s.last_served)
+        ready = [s for s in self.streams if not s.period or s.next_due <= now]
+        return sorted(ready, key=lambda s: s.next_due if s.period else s.last_served)
+
+    def next(self, stop):
+        """(stream, frame, ts_capture), or None once every stream is exhausted or `stop` is set."""
+        while not stop.is_set():
+            now = time.time()
+            for s in self._order(now):
+                ok, frame = s.cap.read(timeout=0)
+                if ok:
+                    s.served(now)
+                    return s, frame, s.cap.last_ts or now
+            if all(s.done for s in self.streams):
+                return None
+            wait = self.idle_sleep_s
+            if self.policy == "deadline":
+                pending = [s.next_due - now for s in self.streams if s.period and s.next_due > now]
+                if pending and len(pending) == len(self.streams):
+                    wait = max(wait, min(pending))
+            stop.wait(wait)
+        return None
+
+
+class MultiCamRunner:
+    """
+    Runs every CameraStream through the shared detector. With a
+    HogDetectorPool in "frames" mode (and no per-stream detector wrappers)
+    frames from all cameras are kept in flight together: a dispatcher thread
+    submits in scheduler order and a collector finishes them in the same
+    order. Otherwise one loop picks, detects, samples and forwards.
+    """
+    def __init__(self, streams, detector, metrics, sender=None, policy="rr", print_every_s=5.0):
+        self.streams = list(streams)
+        self.detector = detector
+        self.metrics = metrics
+        self.sender = sender
+        self.sched = FairScheduler(self.streams, policy)
+        self.print_every_s = print_every_s
+        self._stop = threading.Event()
+        self._pooled = (hasattr(detector, "submit") and getattr(detector, "mode", None) == "frames"
+                        and all(s.detector is None for s in self.streams))
+        self._submitted = 0
+        self._collected = 0
+        self._feed_done = False
+        self._t_start = time.time()
+        self._last_print = self._t_start
+
+    # ---------- per frame ----------
+    def _finish(self, s, frame_id, frame, t0, persons, motion=None):
+        if s.annot is not None:
+            s.annot.submit(frame_id, frame, persons, motion, ts=t0)
+        t2 = time.time()
+        forward = s.sampler.should_forward(frame, persons, t2, motion=motion)
+        self.metrics.mark("sample_decision", frame_id, t2)
+        if forward:
+            if self.sender is not None:
+                if not self.sender.submit(frame, persons, ts_capture=t0, stream_id=s.stream_id, frame_id=frame_id):
+                    print(f"[EDGE->CLOUD] queue full; dropping frame ({s.stream_id})", flush=True)
+            s.forwarded += 1
+            self.metrics.increment_forwarded()
+        s.tick(time.time())
+        self.metrics.tick_fps()
+        self.metrics.maybe_periodic_print()
+        self.maybe_periodic_print()
+
+    def _pick(self):
+        nxt = self.sched.next(self._stop)
+        if nxt is None:
+            return None
+        s, frame, t0 = nxt
+        frame_id = s.frame_id
+        s.frame_id += 1
+        self.metrics.mark("capture_age", frame_id, t0)
+        return s, frame_id, frame, t0
+
+    # ---------- loops ----------
+    def _run_sequential(self):
+        while True:
+            nxt = self._pick()
+            if nxt is None:
+                break
+            s, frame_id, frame, t0 = nxt
+            det = s.detector or self.detector
+            t1 = time.time()
+            persons = det.predict(frame)
+            self.metrics.mark("detect", frame_id, t1)
+            self._finish(s, frame_id, frame, t0, persons, getattr(det, "last_motion", None))
+
+    def _dispatch(self):
+        # blocks in submit() while every pool slot is busy; live captures keep only their newest frame meanwhile
+        try:
+            while True:
+                nxt = self._pick()
+                if nxt is None:
+                    break
+                s, frame_id, frame, t0 = nxt
+                self.detector.submit(frame, tag=(s, frame_id, frame, t0, time.time()))
+                self._submitted += 1
+        finally:
+            self._feed_done = True
+
+    def _collect(self):
+        while not (self._feed_done and self._collected >= self._submitted):
+            res = self.detector.get(timeout=0.5)
+            if res is None:
+                continue
+            self._collected += 1
+            (s, frame_id, frame, t0, t1), persons = res
+            self.metrics.mark("detect", frame_id, t1)
+            self._finish(s, frame_id, frame, t0, persons)
+
+    def run(self):
+        if not self._pooled:
+            try:
+                self._run_sequential()
+            except KeyboardInterrupt:
+                pass
+            return
+        threads = [threading.Thread(target=fn, name=f"multicam-{fn.__name__[1:]}", daemon=True)
+                   for fn in (self._dispatch, self._collect)]
+        for th in threads:
+            th.start()
+        try:
+            for th in threads:
+                while th.is_alive():
+                    th.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for th in threads:
+                th.join(timeout=2)
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- reporting ----------
+    def stats(self):
+        runtime = max(1e-9, time.time() - self._t_start)
+        frames = sum(s.frames for s in self.streams)
+        return {"policy": self.sched.policy,
+                "aggregate_fps": round(frames / runtime, 2),
+                "streams": {s.stream_id: dict(s.stats(), avg_fps=round(s.frames / runtime, 2))
+                            for s in self.streams}}
+
+    def counters(self):
+        c = {}
+        for s in self.streams:
+            c[f'edge_stream_frames_total{{stream="{s.stream_id}"}}'] = s.frames
+            c[f'edge_stream_forwarded_total{{stream="{s.stream_id}"}}'] = s.forwarded
+        return c
+
+    def maybe_periodic_print(self):
+        now = time.time()
+        if now - self._last_print >= self.print_every_s:
+            per = " ".join(f"{s.stream_id}={s.current_fps():.1f}fps/fwd{s.forwarded}" for s in self.streams)
+            print(f"[EDGE] multicam {self.sched.policy}: {per}", flush=True)
+            self._last_print = now
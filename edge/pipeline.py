@@ -0,0 +1,203 @@
+# edge/pipeline.py
+import threading, time
+from collections import deque
+
+class LatestQueue:
+    """
+    Bounded hand-off between pipeline stages. When full, the oldest item is
+    evicted so a slow consumer always sees the most recent frame
+    ("latest frame wins") and latency stays bounded under overload.
+    """
+    def __init__(self, maxsize=2):
+        self.maxsize = max(1, int(maxsize))
+        self._dq = deque()
+        self._cv = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cv:
+            if len(self._dq) >= self.maxsize:
+                self._dq.popleft()
+                self.dropped += 1
+            self._dq.append(item)
+            self._cv.notify()
+
+    def get(self, timeout=0.5):
+        # returns None on timeout, or once closed and drained (check .drained)
+        with self._cv:
+            if not self._dq and not self._closed:
+                self._cv.wait(timeout)
+            if self._dq:
+                return self._dq.popleft()
+            return None
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    @property
+    def drained(self):
+        return self._closed and not self._dq
+
+    def qsize(self):
+        return len(self._dq)
+
+
+class EdgePipeline:
+    """
+    Staged edge loop: capture -> detect -> sample/forward (+ optional annotate,
+    an AsyncAnnotator running on its own thread).
+    Every stage runs on its own thread and hands frames on through a
+    LatestQueue, so throughput is limited by the slowest stage rather than
+    the sum of all stages. A detector exposing submit()/get() (the
+    HogDetectorPool in "frames" mode) keeps several frames in flight, with
+    results collected in frame order on a separate thread.
+    """
+    def __init__(self, cap, detector, sampler, metrics, sender=None, annot=None,
+                 qsize=2, live=False):
+        self.cap = cap
+        self.detector = detector
+        self.sampler = sampler
+        self.metrics = metrics
+        self.sender = sender
+        self.annot = annot
+        self.live = live
+        self.det_q = LatestQueue(qsize)
+        self.fwd_q = LatestQueue(qsize)
+        self._stop = threading.Event()
+        self._pooled = hasattr(detector, "submit") and getattr(detector, "mode", None) == "frames"
+        self._submitted = 0
+        self._collected = 0
+        self._feed_done = False
+
+    # ---------- stages ----------
+    def _capture(self):
+        frame_id = 0
+        try:
+            while not self._stop.is_set():
+                t0 = time.time()
+                ok, frame = self.cap.read()
+                if not ok:
+                    # Wait instead of exiting when the RTSP stream isn't publishing yet.
+                    if self.live:
+                        time.sleep(0.25)
+                        continue
+                    break
+                self.metrics.mark("capture", frame_id, t0)
+                t0 = getattr(self.cap, "last_ts", None) or t0     # when the frame was grabbed
+                self.metrics.mark("capture_age", frame_id, t0)
+                self.det_q.put((frame_id, frame, t0))
+                frame_id += 1
+        finally:
+            self.det_q.close()
+
+    def _emit(self, frame_id, frame, t0, persons, motion=None):
+        self.fwd_q.put((frame_id, frame, t0, persons, motion))
+        if self.annot is not None:
+            self.annot.submit(frame_id, frame, persons, motion, ts=t0)
+
+    def _close_downstream(self):
+        self.fwd_q.close()
+
+    def _detect(self):
+        try:
+            while True:
+                item = self.det_q.get()
+                if item is None:
+                    if self.det_q.drained:
+                        break
+                    continue
+                self.metrics.record_queue_depth("detect", self.det_q.qsize())
+                frame_id, frame, t0 = item
+                t1 = time.time()
+                persons = self.detector.predict(frame)      # [[x1,y1,x2,y2,score], ...]
+                self.metrics.mark("detect", frame_id, t1)
+                # a DetectionScheduler already scored motion; hand it to the sampler
+                self._emit(frame_id, frame, t0, persons, getattr(self.detector, "last_motion", None))
+        finally:
+            self._close_downstream()
+
+    def _detect_submit(self):
+        # pooled detection, feeder half: blocks in submit() while all slots are busy,
+        # meanwhile det_q keeps evicting stale frames
+        try:
+            while True:
+                item = self.det_q.get()
+                if item is None:
+                    if self.det_q.drained:
+                        break
+                    continue
+                self.metrics.record_queue_depth("detect", self.det_q.qsize())
+                frame_id, frame, t0 = item
+                self.detector.submit(frame, tag=(frame_id, frame, t0, time.time()))
+                self._submitted += 1
+        finally:
+            self._feed_done = True
+
+    def _detect_collect(self):
+        # pooled detection, collector half: results arrive in submit order
+        try:
+            while not (self._feed_done and self._collected >= self._submitted):
+                res = self.detector.get(timeout=0.5)
+                if res is None:
+                    continue
+                self._collected += 1
+                (frame_id, frame, t0, t1), persons = res
+                self.metrics.mark("detect", frame_id, t1)
+                self._emit(frame_id, frame, t0, persons)
+        finally:
+            self._close_downstream()
+
+    def _forward(self):
+        while True:
+            item = self.fwd_q.get()
+            if item is None:
+                if self.fwd_q.drained:
+                    break
+                continue
+            self.metrics.record_queue_depth("forward", self.fwd_q.qsize())
+            frame_id, frame, t0, persons, motion = item
+
+            t2 = time.time()
+            forward = self.sampler.should_forward(frame, persons, t2, motion=motion)
+            self.metrics.mark("sample_decision", frame_id, t2)
+
+            if forward:
+                if self.sender is not None:
+                    queued = self.sender.submit(frame, persons, ts_capture=t0, frame_id=frame_id)
+                    if not queued:
+                        print("[EDGE->CLOUD] queue full; dropping frame", flush=True)
+                self.metrics.increment_forwarded()
+
+            self.metrics.tick_fps()
+            self.metrics.maybe_periodic_print()
+
+    # ---------- control ----------
+    def run(self):
+        if self._pooled:
+            stages = [self._capture, self._detect_submit, self._detect_collect, self._forward]
+        else:
+            stages = [self._capture, self._detect, self._forward]
+        threads = [threading.Thread(target=fn, name=f"edge-{fn.__name__[1:]}", daemon=True)
+                   for fn in stages]
+        for th in threads:
+            th.start()
+        try:
+            for th in threads:
+                while th.is_alive():
+                    th.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for th in threads:
+                th.join(timeout=2)
+
+    def stop(self):
+        self._stop.set()
+
+    def dropped(self):
+        out = {"detect": self.det_q.dropped, "forward": self.fwd_q.dropped}
+        if self.annot is not None:
+            out["annotate"] = self.annot.dropped
+        return out
@@ -1,31 +1,34 @@
-import cv2, numpy as np
+from motion import MotionAnalyzer
 
 class Sampler:
-    def __init__(self, mode="motion", motion_thr=12.0, heartbeat_s=2.0):
+    def __init__(self, mode="motion", motion_thr=12.0, heartbeat_s=2.0, analyzer=None):
         self.mode = mode
         self.motion_thr = motion_thr
         self.heartbeat_s = heartbeat_s
-        self._last_gray = None
+        self.analyzer = analyzer or MotionAnalyzer()
+        self.last_motion = None   # MotionResult of the last analyzed frame
         self._last_forward_ts = 0.0
 
-    def _motion_score(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        if self._last_gray is None:
-            self._last_gray = gray
-            return 0.0
-        diff = cv2.absdiff(gray, self._last_gray)
-        score = float(np.mean(diff))
-        self._last_gray = gray
-        return score
+    def analyze(self, frame):
+        # one motion pass per frame; the result is shared with the detector/annotator
+        self.last_motion = self.analyzer.analyze(frame)
+        return self.last_motion
 
-    def should_forward(self, frame, detections, now_ts):
+    def motion_score(self, frame):
+        return self.analyze(frame).score
+
+    def should_forward(self, frame, detections, now_ts, motion=None):
+        # motion: MotionResult (or bare score) already computed for this frame
         if detections and max([d[-1] for d in detections]) > 0.5:
             self._last_forward_ts = now_ts
             return True
 
         forward = False
         if self.mode in ("motion", "both"):
-            if self._motion_score(frame) > self.motion_thr:
+            if motion is None:
+                motion = self.analyze(frame)
+            score = getattr(motion, "score", motion)
+            if score > self.motion_thr:
                 forward = True
         if not forward and self.mode in ("heartbeat", "both"):
             if (now_ts - self._last_forward_ts) >= self.heartbeat_s:
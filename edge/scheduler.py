@@ -0,0 +1,142 @@
+# edge/scheduler.py
+import time
+import numpy as np
+
+MIN_BOX_SIDE = 8    # px; carried boxes / ROIs clipped thinner than this are dropped
+
+def _iou_matrix(a, b):
+    # a: (N,4), b: (M,4) xyxy -> (N,M)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(1e-6, area_a[:, None] + area_b[None, :] - inter)
+
+def _clip_rois(rois, W, H, min_side=MIN_BOX_SIDE):
+    # clip to the frame and drop slivers (a box pushed past an edge collapses to zero width/height)
+    out = []
+    for (x1, y1, x2, y2) in rois:
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(W, x2), min(H, y2)
+        if x2 - x1 >= min_side and y2 - y1 >= min_side:
+            out.append((x1, y1, x2, y2))
+    return out
+
+class BoxPropagator:
+    """
+    Lightweight edge-side tracker. Each detection pass is matched to the
+    previous one by IoU to get a per-box velocity (px/s); on skipped frames
+    the last boxes are extrapolated with it (capped at `max_extrapolate_s`).
+    Boxes extrapolated out of the frame (clipped below `min_side`) are dropped.
+    """
+    def __init__(self, iou_thr=0.3, max_extrapolate_s=1.0, vel_alpha=0.5, min_side=MIN_BOX_SIDE):
+        self.iou_thr = iou_thr
+        self.min_side = min_side
+        self.max_extrapolate_s = max_extrapolate_s
+        self.vel_alpha = vel_alpha
+        self.boxes = np.zeros((0, 4), np.float32)
+        self.vel = np.zeros((0, 4), np.float32)
+        self.scores = []
+        self.ts = None
+
+    def update(self, dets, ts):
+        new = np.array([d[:4] for d in dets], dtype=np.float32).reshape(-1, 4)
+        vel = np.zeros_like(new)
+        if self.ts is not None and ts > self.ts and len(new) and len(self.boxes):
+            dt = ts - self.ts
+            iou = _iou_matrix(new, self.boxes)
+            # greedy by IoU, one-to-one
+            used_new, used_old = set(), set()
+            for flat in np.argsort(-iou, axis=None):
+                j, i = divmod(int(flat), iou.shape[1])
+                if iou[j, i] < self.iou_thr:
+                    break
+                if j in used_new or i in used_old:
+                    continue
+                used_new.add(j); used_old.add(i)
+                v = (new[j] - self.boxes[i]) / dt
+                vel[j] = self.vel_alpha * v + (1.0 - self.vel_alpha) * self.vel[i]
+        self.boxes, self.vel = new, vel
+        self.scores = [float(d[4]) for d in dets]
+        self.ts = ts
+
+    def predict(self, ts, frame_w=None, frame_h=None):
+        if self.ts is None or not len(self.boxes):
+            return []
+        dt = min(max(0.0, ts - self.ts), self.max_extrapolate_s)
+        boxes = self.boxes + self.vel * dt
+        scores = self.scores
+        if frame_w is not None:
+            boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, frame_w - 1)
+            boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, frame_h - 1)
+            keep = ((boxes[:, 2] - boxes[:, 0]) >= self.min_side) & ((boxes[:, 3] - boxes[:, 1]) >= self.min_side)
+            boxes, scores = boxes[keep], [sc for sc, k in zip(scores, keep) if k]
+        return [[int(x1), int(y1), int(x2), int(y2), sc]
+                for (x1, y1, x2, y2), sc in zip(boxes, scores)]
+
+
+class DetectionScheduler:
+    """
+    Decides per frame whether to pay for a detector pass. Detection runs on
+    key frames (every `every_n`-th) whose motion score is >= `motion_thr`,
+    and is forced once `max_interval_s` has passed since the last pass so
+    carried boxes can't drift. Other frames get the previous boxes carried
+    forward by a BoxPropagator, in the same [x1,y1,x2,y2,score] shape.
+
+    motion_fn(frame) is typically Sampler.analyze and returns a MotionResult
+    (a bare float score also works); it is kept in `last_motion` so the
+    sampler and annotator reuse it. With `motion_rois`, non-forced passes
+    only search the moving blocks plus the carried boxes (people standing
+    still); forced passes always scan the whole frame.
+    """
+    def __init__(self, detector, motion_fn=None, motion_thr=2.0, every_n=1, max_interval_s=1.0,
+                 motion_rois=False):
+        self.detector = detector
+        self.motion_fn = motion_fn
+        self.motion_rois = motion_rois
+        self.motion_thr = motion_thr
+        self.every_n = max(1, int(every_n))
+        self.max_interval_s = max_interval_s
+        self.tracker = BoxPropagator(max_extrapolate_s=max_interval_s)
+        self.last_motion = None
+        self.last_ran = False
+        self.runs = 0
+        self.skipped = 0
+        self._idx = 0
+        self._last_det_ts = None
+
+    def predict(self, frame_bgr, ts=None):
+        if ts is None:
+            ts = time.time()
+        self.last_motion = self.motion_fn(frame_bgr) if self.motion_fn is not None else None
+
+        forced = self._last_det_ts is None or (ts - self._last_det_ts) >= self.max_interval_s
+        key = (self._idx % self.every_n) == 0
+        score = getattr(self.last_motion, "score", self.last_motion)
+        moving = score is None or score >= self.motion_thr
+        self._idx += 1
+        H, W = frame_bgr.shape[:2]
+
+        if forced or (key and moving):
+            if self.motion_rois and not forced and hasattr(self.last_motion, "rois"):
+                rois = self.last_motion.rois() + [tuple(d[:4]) for d in self.tracker.predict(ts, W, H)]
+                rois = _clip_rois(rois, W, H)
+                dets = self.detector.predict(frame_bgr, rois=rois)
+            else:
+                dets = self.detector.predict(frame_bgr)
+            self.tracker.update(dets, ts)
+            self._last_det_ts = ts
+            self.runs += 1
+            self.last_ran = True
+            return dets
+
+        self.skipped += 1
+        self.last_ran = False
+        return self.tracker.predict(ts, W, H)
+
+    def stats(self):
+        total = self.runs + self.skipped
+        return {"det_runs": self.runs, "det_skipped": self.skipped,
+                "det_run_ratio": round(self.runs / total, 3) if total else 0.0}
@@ -1,61 +1,441 @@
-import threading, queue, time, json, requests, cv2
+import threading, queue, time, json, struct, itertools, zlib, requests, cv2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 def to_jpeg_bytes(frame, quality=80):
     ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
     if not ok: raise RuntimeError("JPEG encode failed")
     return buf.tobytes()
 
+def endpoint_url(cloud_url, path):
+    # CLOUD_URL points at .../ingest; sibling endpoints live next to it
+    base = cloud_url.rstrip("/")
+    if base.endswith("/ingest"):
+        base = base[:-len("/ingest")]
+    return base + path
+
+def det_dicts(dets):
+    return [{"x1":int(x1),"y1":int(y1),"x2":int(x2),"y2":int(y2),"score":float(s)}
+            for (x1,y1,x2,y2,s) in dets]
+
+# ---- compact binary wire format (POST /ingest_bin) ----
+# header  <4sBBHIddHHHI  magic b"PNF1", version, flags, sid_len, frame_id,
+#                        ts_capture, ts_edge_send, width, height, n_dets, img_len
+# then    stream_id (utf-8) | n_dets x <iiiif (x1,y1,x2,y2,score) | image section
+# image section: JPEG bytes, or with FLAG_PARTS: <H n_parts, n_parts x <HHHHI
+# (x, y, w, h, nbytes) in full-res coords, then the part JPEGs back to back.
+# FLAG_REPLAY marks records replayed from the edge spool after an outage.
+# Records can be concatenated into one body. Decoder: cloud/wire.py.
+WIRE_MAGIC = b"PNF1"
+WIRE_VERSION = 1
+WIRE_HDR = struct.Struct("<4sBBHIddHHHI")
+WIRE_DET = np.dtype([("x1", "<i4"), ("y1", "<i4"), ("x2", "<i4"), ("y2", "<i4"), ("score", "<f4")])
+WIRE_PART = struct.Struct("<HHHHI")
+FLAG_PARTS = 0x01
+FLAG_REPLAY = 0x02      # record delivered late from the edge spool
+
+def encode_frame_bin(stream_id, frame_id, ts_capture, ts_edge_send, width, height,
+                     dets, img_bytes=b"", flags=0, parts=None):
+    if parts is not None:
+        flags |= FLAG_PARTS
+        img_bytes = b"".join([struct.pack("<H", len(parts))]
+                             + [WIRE_PART.pack(x, y, w, h, len(jpg)) for (x, y, w, h, jpg) in parts]
+                             + [jpg for (_, _, _, _, jpg) in parts])
+    sid = stream_id.encode("utf-8")
+    arr = np.array([(int(x1), int(y1), int(x2), int(y2), float(sc)) for (x1, y1, x2, y2, sc) in dets],
+                   dtype=WIRE_DET)
+    hdr = WIRE_HDR.pack(WIRE_MAGIC, WIRE_VERSION, flags, len(sid), frame_id & 0xFFFFFFFF,
+                        float(ts_capture), float(ts_edge_send), width, height, len(arr), len(img_bytes))
+    return b"".join((hdr, sid, arr.tobytes(), img_bytes))
+
+class Payload:
+    __slots__ = ("stream_id", "frame_id", "ts_capture", "width", "height", "dets",
+                 "jpeg", "parts", "level")
+
+    def __init__(self, stream_id, frame_id, ts_capture, width, height, dets,
+                 jpeg=None, parts=None, level="q80"):
+        self.stream_id = stream_id
+        self.frame_id = frame_id
+        self.ts_capture = ts_capture
+        self.width, self.height = width, height   # full-res frame size
+        self.dets = dets
+        self.jpeg = jpeg            # full frame, possibly downscaled; None = no pixels
+        self.parts = parts          # [(x, y, w, h, jpeg), ...] crops (binary wire only)
+        self.level = level          # encode level name for metrics
+
+    @property
+    def has_image(self):
+        return self.jpeg is not None or bool(self.parts)
+
+    def nbytes(self):
+        n = len(self.jpeg) if self.jpeg is not None else 0
+        return n + sum(len(p[4]) for p in (self.parts or ())) + 20 * len(self.dets)
+
+DROP_POLICIES = ("drop_newest", "drop_oldest", "latest_only")
+
+class _SendQueue:
+    """
+    Bounded input queue with a selectable overflow policy:
+      drop_newest  reject the incoming frame (old behaviour)
+      drop_oldest  evict the oldest queued frame to make room
+      latest_only  keep at most one pending frame per stream (a newer frame
+                   replaces the queued one), plus drop_oldest when full
+    put() returns (accepted, n_dropped).
+    """
+    def __init__(self, maxsize, policy="drop_newest"):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"unknown drop policy {policy!r}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self._dq = deque()
+        self._cv = threading.Condition()
+
+    def put(self, item, key):
+        with self._cv:
+            dropped = 0
+            if self.policy == "latest_only":
+                for i, it in enumerate(self._dq):
+                    if it[3] == key:
+                        del self._dq[i]
+                        dropped += 1
+                        break
+            if len(self._dq) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    return False, 1
+                self._dq.popleft()
+                dropped += 1
+            self._dq.append(item)
+            self._cv.notify()
+            return True, dropped
+
+    def get(self, timeout):
+        with self._cv:
+            if not self._dq:
+                self._cv.wait(timeout)
+            return self._dq.popleft() if self._dq else None
+
+    def qsize(self):
+        return len(self._dq)
+
 class SenderWorker:
-    def __init__(self, cloud_url: str, maxsize=5, timeout=5):
+    """
+    Background HTTP sender: a dispatcher thread takes frames off a bounded
+    input queue, JPEG-encodes them on a small thread pool (cv2.imencode
+    releases the GIL) and hands them to `concurrency` upload lanes, each with
+    its own keep-alive Session. A stream always maps to the same lane and a
+    lane waits for encodes in submit order, so per-stream order is kept.
+
+    drop_policy picks what happens when the input queue is full, see
+    _SendQueue; "drop_newest" stays the default.
+
+    batch_size > 1 gathers up to `batch_size` frames, or whatever arrived
+    within `batch_linger_ms` of the first one, into a single POST to
+    /ingest_batch. Larger batches / longer linger trade latency for throughput.
+
+    wire="bin" sends the compact binary format to /ingest_bin instead of
+    multipart (batches are concatenated records); "multipart" stays the default.
+
+    mode="meta" sends only detections + frame size (no JPEG encode); a full
+    frame still goes out every `full_frame_every_s` seconds per stream (0 =
+    never) or when the cloud answers with "want_frame" (annotation on).
+
+    encoder: optional AdaptiveEncoder fed with queue fill, send latency and
+    bytes; metrics: optional EdgeMetrics receiving per-frame bytes + level and
+    the send_queue / send_encode / send_post stage timings.
+
+    spool: optional DiskSpool. Frames whose POST fails are written there as
+    binary records (FLAG_REPLAY) instead of being lost; after a failure the
+    lanes spool straight away for `offline_retry_s` before probing the cloud
+    again, so an outage doesn't back up the input queue. `online` tells a
+    SpoolReplayer when it may drain.
+    """
+    def __init__(self, cloud_url: str, maxsize=5, timeout=5, stream_id="default",
+                 batch_size=1, batch_linger_ms=0.0, wire="multipart",
+                 mode="frames", full_frame_every_s=0.0, encoder=None, metrics=None,
+                 drop_policy="drop_newest", concurrency=1, encode_workers=2,
+                 spool=None, offline_retry_s=2.0):
         self.cloud_url = cloud_url
+        self.batch_url = endpoint_url(cloud_url, "/ingest_batch")
+        self.bin_url = endpoint_url(cloud_url, "/ingest_bin")
+        self.wire = wire
+        self.mode = mode
+        self.encoder = encoder
+        self.metrics = metrics
+        self.maxsize = maxsize
+        self.full_frame_every_s = full_frame_every_s
+        self._last_full = {}        # stream_id -> ts of last frame sent with pixels
+        self._frame_wanted = set()  # streams the cloud asked a frame for
+        self._frame_ids = itertools.count()
         self.timeout = timeout
-        self.q = queue.Queue(maxsize=maxsize)
+        self.stream_id = stream_id
+        self.batch_size = max(1, int(batch_size))
+        self.batch_linger_s = max(0.0, batch_linger_ms) / 1000.0
+        self.concurrency = max(1, int(concurrency))
+        self.spool = spool
+        self.offline_retry_s = offline_retry_s
+        self.online = True
+        self._retry_at = 0.0        # while offline: next time a lane may probe the cloud
+        self.q = _SendQueue(maxsize, drop_policy)
         self._stop = False
+        self._lock = threading.Lock()
+        self._pending = 0           # accepted frames not yet attempted
         self.sent = 0
         self.dropped = 0
-        self.th = threading.Thread(target=self._run, daemon=True)
-        self.th.start()
+        self.spooled = 0
+        self.batches = 0
+        self.frames_with_image = 0
+        self.bytes_sent = 0
+        self.timings = {k: deque(maxlen=2048) for k in ("queue_wait_ms", "encode_ms", "send_ms")}
+        # frames between the input queue and a finished POST; bounds the
+        # backlog so overflow is still decided by the drop policy
+        self._inflight = threading.Semaphore(max(1, int(encode_workers)) + self.concurrency * self.batch_size)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(encode_workers)),
+                                        thread_name_prefix="sender-encode")
+        self._lanes = [queue.Queue() for _ in range(self.concurrency)]
+        self._threads = [threading.Thread(target=self._dispatch, daemon=True)]
+        self._threads += [threading.Thread(target=self._lane, args=(q,), daemon=True) for q in self._lanes]
+        for th in self._threads:
+            th.start()
 
-    def submit(self, frame_bgr, detections, ts_capture):
-        # Backpressure: drop newest when full
-        try:
-            self.q.put_nowait((frame_bgr, detections, ts_capture))
+    def submit(self, frame_bgr, detections, ts_capture, stream_id=None, frame_id=None):
+        if frame_id is None:
+            frame_id = next(self._frame_ids)
+        sid = stream_id or self.stream_id
+        ok, dropped = self.q.put((frame_bgr, detections, ts_capture, sid, frame_id, time.time()), sid)
+        with self._lock:
+            self.dropped += dropped
+            self._pending += int(ok) - (dropped if ok else 0)
+        return ok
+
+    def _done(self, n=1):
+        with self._lock:
+            self._pending -= n
+
+    # ---------- encoding ----------
+    def _wants_image(self, stream_id):
+        if self.mode != "meta":
             return True
-        except queue.Full:
-            self.dropped += 1
-            return False
+        now = time.time()
+        with self._lock:
+            due = self.full_frame_every_s > 0 and (now - self._last_full.get(stream_id, 0.0)) >= self.full_frame_every_s
+            if due or stream_id in self._frame_wanted:
+                self._frame_wanted.discard(stream_id)
+                self._last_full[stream_id] = now
+                return True
+        return False
+
+    def _encode(self, item):
+        t0 = time.time()
+        frame_bgr, dets, ts_cap, stream_id, frame_id, _ = item
+        h, w = frame_bgr.shape[:2]
+        if not self._wants_image(stream_id):
+            return Payload(stream_id, frame_id, ts_cap, w, h, dets, level="meta")
+        if self.encoder is None:
+            p = Payload(stream_id, frame_id, ts_cap, w, h, dets, to_jpeg_bytes(frame_bgr, quality=80))
+        else:
+            self.encoder.observe_queue(self.q.qsize() / max(1, self.maxsize))
+            jpeg, parts, level = self.encoder.encode(frame_bgr, dets)
+            p = Payload(stream_id, frame_id, ts_cap, w, h, dets, jpeg, parts, level)
+        self.timings["encode_ms"].append((time.time() - t0) * 1000.0)
+        if self.metrics is not None:
+            self.metrics.mark("send_encode", frame_id, t0)
+        return p
 
-    def _run(self):
-        s = requests.Session()
+    # ---------- dispatch ----------
+    def _dispatch(self):
         while not self._stop:
+            if not self._inflight.acquire(timeout=0.5):
+                continue
+            item = self.q.get(timeout=0.5)
+            if item is None:
+                self._inflight.release()
+                continue
+            self.timings["queue_wait_ms"].append((time.time() - item[5]) * 1000.0)
+            if self.metrics is not None:
+                self.metrics.mark("send_queue", item[4], item[5])
+            fut = self._pool.submit(self._encode, item)
+            self._lanes[zlib.crc32(item[3].encode("utf-8")) % self.concurrency].put(fut)
+
+    def _gather(self, lane_q):
+        try:
+            batch = [lane_q.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.batch_linger_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
             try:
-                frame_bgr, dets, ts_cap = self.q.get(timeout=0.5)
+                batch.append(lane_q.get(timeout=remaining) if remaining > 0 else lane_q.get_nowait())
             except queue.Empty:
+                break
+        return batch
+
+    # ---------- transport ----------
+    def _post_one(self, s, p):
+        files = {"image": ("frame.jpg", p.jpeg, "image/jpeg")} if p.jpeg is not None else None
+        data = {
+            "ts_capture": str(p.ts_capture),
+            "ts_edge_send": str(time.time()),
+            "stream_id": p.stream_id,
+            "width": str(p.width),
+            "height": str(p.height),
+            "detections": json.dumps(det_dicts(p.dets)),
+        }
+        r = s.post(self.cloud_url, data=data, files=files, timeout=self.timeout,
+                   headers={"X-Stream-Id": p.stream_id})
+        r.raise_for_status()
+        return [r.json()], len(r.request.body or b"")
+
+    def _post_batch(self, s, payloads, delivered):
+        # one POST per stream so a sharded cloud can route each batch by X-Stream-Id;
+        # results are returned in `payloads` order. Payloads whose sub-POST went
+        # through are appended to `delivered`, so a later failure only spools the rest.
+        by_stream = {}
+        for i, p in enumerate(payloads):
+            by_stream.setdefault(p.stream_id, []).append(i)
+        if len(by_stream) == 1:
+            return self._post_stream_batch(s, payloads)
+        results, nbytes = [None] * len(payloads), 0
+        for idx in by_stream.values():
+            sub = [payloads[i] for i in idx]
+            res, n = self._post_stream_batch(s, sub)
+            delivered.extend(sub)
+            nbytes += n
+            for i, r in zip(idx, res):
+                results[i] = r
+        return results, nbytes
+
+    def _post_stream_batch(self, s, payloads):
+        files, meta = [], []
+        ts_send = time.time()
+        for i, p in enumerate(payloads):
+            if p.jpeg is not None:
+                files.append(("images", (f"frame{i}.jpg", p.jpeg, "image/jpeg")))
+            meta.append({"ts_capture": p.ts_capture, "ts_edge_send": ts_send, "stream_id": p.stream_id,
+                         "width": p.width, "height": p.height, "has_image": p.jpeg is not None,
+                         "detections": det_dicts(p.dets)})
+        r = s.post(self.batch_url, data={"meta": json.dumps(meta)}, files=files or None,
+                   timeout=self.timeout, headers={"X-Stream-Id": payloads[0].stream_id})
+        r.raise_for_status()
+        return r.json().get("results", []), len(r.request.body or b"")
+
+    def _post_bin(self, s, payloads):
+        ts_send = time.time()
+        body = b"".join(
+            encode_frame_bin(p.stream_id, p.frame_id, p.ts_capture, ts_send, p.width, p.height,
+                             p.dets, p.jpeg or b"", parts=p.parts or None)
+            for p in payloads)
+        headers = {"Content-Type": "application/octet-stream"}
+        sids = {p.stream_id for p in payloads}
+        if len(sids) == 1:
+            headers["X-Stream-Id"] = sids.pop()     # else a sharded cloud splits the records itself
+        r = s.post(self.bin_url, data=body, timeout=self.timeout, headers=headers)
+        r.raise_for_status()
+        return r.json().get("results", []), len(body)
+
+    def _note_results(self, payloads, results):
+        # results come back in request order; remember which streams want pixels
+        with self._lock:
+            for p, res in zip(payloads, results):
+                if isinstance(res, dict) and res.get("want_frame"):
+                    self._frame_wanted.add(p.stream_id)
+
+    def _spool(self, payloads):
+        body = b"".join(
+            encode_frame_bin(p.stream_id, p.frame_id, p.ts_capture, p.ts_capture, p.width, p.height,
+                             p.dets, p.jpeg or b"", flags=FLAG_REPLAY, parts=p.parts or None)
+            for p in payloads)
+        if self.spool.put(body, len(payloads)):
+            with self._lock:
+                self.spooled += len(payloads)
+        else:
+            with self._lock:
+                self.dropped += len(payloads)
+
+    def _lane(self, lane_q):
+        s = requests.Session()      # one keep-alive connection per lane
+        while not self._stop:
+            batch = self._gather(lane_q)
+            if not batch:
                 continue
+            payloads, delivered = [], []
             try:
-                img = to_jpeg_bytes(frame_bgr, quality=80)
-                files = {"image": ("frame.jpg", img, "image/jpeg")}
-                data = {
-                    "ts_capture": str(ts_cap),
-                    "ts_edge_send": str(time.time()),
-                    "stream_id": "default",
-                    "detections": json.dumps([
-                        {"x1":int(x1),"y1":int(y1),"x2":int(x2),"y2":int(y2),"score":float(s)}
-                        for (x1,y1,x2,y2,s) in dets
-                    ]),
-                }
-                r = s.post(self.cloud_url, data=data, files=files, timeout=self.timeout)
-                r.raise_for_status()
-                self.sent += 1
+                for fut in batch:   # submit order == per-stream order
+                    try:
+                        payloads.append(fut.result())
+                    except Exception:
+                        with self._lock:
+                            self.dropped += 1   # encode failed
+                if not payloads:
+                    continue
+                if self.spool is not None and not self.online and time.time() < self._retry_at:
+                    self._spool(payloads)
+                    continue
+                t_send = time.time()
+                if self.wire == "bin":
+                    results, nbytes = self._post_bin(s, payloads)
+                elif self.batch_size == 1:
+                    results, nbytes = self._post_one(s, payloads[0])
+                else:
+                    results, nbytes = self._post_batch(s, payloads, delivered)
+                send_ms = (time.time() - t_send) * 1000.0
+                self.online = True
+                self.timings["send_ms"].append(send_ms)
+                with self._lock:
+                    if len(payloads) > 1:
+                        self.batches += 1
+                    self.sent += len(payloads)
+                    self.bytes_sent += nbytes
+                    self.frames_with_image += sum(p.has_image for p in payloads)
+                self._note_results(payloads, results)
+                if self.encoder is not None:
+                    self.encoder.observe_send(send_ms, nbytes)
+                if self.metrics is not None:
+                    for p in payloads:
+                        self.metrics.mark("send_post", p.frame_id, t_send)
+                        self.metrics.record_send(p.frame_id, send_ms, p.nbytes(), p.level)
             except Exception:
-                # swallow and continue; metrics printed by edge app
-                pass
+                # spool what did not get through if configured, otherwise drop it;
+                # metrics printed by edge app
+                done = {id(p) for p in delivered}
+                rest = [p for p in payloads if id(p) not in done]
+                with self._lock:
+                    self.sent += len(delivered)
+                    self.frames_with_image += sum(p.has_image for p in delivered)
+                    if self.spool is None:
+                        self.dropped += len(rest)
+                if self.spool is not None and rest:
+                    self.online = False
+                    self._retry_at = time.time() + self.offline_retry_s
+                    self._spool(rest)
             finally:
-                self.q.task_done()
+                for _ in batch:
+                    self._inflight.release()
+                self._done(len(batch))
+
+    # ---------- stats / lifecycle ----------
+    def timing_stats(self):
+        out = {}
+        for k, d in self.timings.items():
+            a = list(d)
+            if a:
+                # same percentile method as bench.py
+                out[k] = {"mean": round(sum(a) / len(a), 2), "p95": round(float(np.percentile(a, 95)), 2)}
+        return out
+
+    def flush(self, timeout=10.0):
+        # wait until every queued frame has been attempted
+        deadline = time.time() + timeout
+        while self._pending > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        return self._pending <= 0
 
     def stop(self):
         self._stop = True
-        try:
-            self.th.join(timeout=2)
-        except Exception:
-            pass
+        for th in self._threads:
+            try:
+                th.join(timeout=2)
+            except Exception:
+                pass
+        self._pool.shutdown(wait=False)
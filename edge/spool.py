@@ -0,0 +1,267 @@
+# edge/spool.py
+# Bounded on-disk spool for frames the sender could not deliver, plus a
+# rate-limited background replayer to /ingest_bin.
+#
+# Segments are append-only files <dir>/seg-<seq>.spool holding entries
+#   <IdH  body_len, ts_spooled, n_frames
+#   body  binary wire records (sender_worker.encode_frame_bin), concatenated
+# Replay is at-least-once: a segment is deleted only after all of it was
+# delivered, so a crash mid-segment resends its delivered prefix.
+import os, glob, struct, threading, queue, time
+import requests
+
+ENTRY = struct.Struct("<IdH")
+
+class _Segment:
+    __slots__ = ("path", "seq", "size", "frames", "t_last", "read_off", "read_frames")
+
+    def __init__(self, path, seq, ts):
+        self.path, self.seq = path, seq
+        self.size = self.frames = 0
+        self.t_last = ts
+        self.read_off = self.read_frames = 0
+
+class DiskSpool:
+    """
+    Append-only segment spool capped by `max_bytes` and `max_age_s`; when a
+    cap is hit whole segments are evicted oldest first. put() never touches
+    the disk: entries go through a bounded queue to a writer thread and are
+    counted as `overflow` if that queue is full.
+    """
+    def __init__(self, dirpath, max_bytes=256 << 20, max_age_s=3600.0,
+                 segment_bytes=8 << 20, segment_s=60.0, qsize=256):
+        os.makedirs(dirpath, exist_ok=True)
+        self.dir = dirpath
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.segment_bytes = segment_bytes
+        self.segment_s = segment_s
+        self._lock = threading.Lock()
+        self._segs = self._scan()
+        self._fh = None             # open handle of the active (last) segment
+        self._t_open = 0.0
+        self._q = queue.Queue(maxsize=qsize)
+        self._stop = False
+        self.spooled = 0            # frames written
+        self.evicted = 0            # frames dropped by the size/age caps
+        self.overflow = 0           # frames dropped before reaching disk
+        self.th = threading.Thread(target=self._writer, daemon=True)
+        self.th.start()
+
+    def _scan(self):
+        # pick up segments left by a previous run; a torn tail entry is ignored
+        segs = []
+        for path in sorted(glob.glob(os.path.join(self.dir, "seg-*.spool"))):
+            try:
+                seq = int(os.path.basename(path)[4:-6])
+                seg = _Segment(path, seq, os.path.getmtime(path))
+                with open(path, "rb") as f:
+                    while True:
+                        hdr = f.read(ENTRY.size)
+                        if len(hdr) < ENTRY.size:
+                            break
+                        n, _, frames = ENTRY.unpack(hdr)
+                        if len(f.read(n)) < n:
+                            break
+                        seg.size += ENTRY.size + n
+                        seg.frames += frames
+            except (OSError, ValueError):
+                continue
+            if seg.size:
+                segs.append(seg)
+            else:
+                os.remove(path)
+        return segs
+
+    # ---------- write side ----------
+    def put(self, body, n_frames=1):
+        try:
+            self._q.put_nowait((time.time(), body, n_frames))
+            return True
+        except queue.Full:
+            self.overflow += n_frames
+            return False
+
+    def _writer(self):
+        while not (self._stop and self._q.empty()):
+            try:
+                ts, body, n = self._q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._append(ts, body, n)
+            except OSError:
+                self.overflow += n
+
+    def _append(self, ts, body, n):
+        with self._lock:
+            if (self._fh is None or self._segs[-1].size >= self.segment_bytes
+                    or ts - self._t_open >= self.segment_s):
+                self._roll(ts)
+            seg = self._segs[-1]
+            self._fh.write(ENTRY.pack(len(body), ts, n))
+            self._fh.write(body)
+            self._fh.flush()
+            seg.size += ENTRY.size + len(body)
+            seg.frames += n
+            seg.t_last = ts
+            self.spooled += n
+            self._enforce(ts)
+
+    def _roll(self, ts):
+        if self._fh is not None:
+            self._fh.close()
+        seq = self._segs[-1].seq + 1 if self._segs else 0
+        path = os.path.join(self.dir, f"seg-{seq:08d}.spool")
+        self._fh = open(path, "ab")
+        self._t_open = ts
+        self._segs.append(_Segment(path, seq, ts))
+
+    def _enforce(self, now):
+        # oldest first; the active segment is never evicted
+        total = sum(s.size - s.read_off for s in self._segs)
+        while len(self._segs) > 1 and (total > self.max_bytes
+                                       or now - self._segs[0].t_last > self.max_age_s):
+            seg = self._segs.pop(0)
+            total -= seg.size - seg.read_off
+            self.evicted += seg.frames - seg.read_frames
+            self._remove(seg)
+
+    def _remove(self, seg):
+        try:
+            os.remove(seg.path)
+        except OSError:
+            pass
+
+    # ---------- read side ----------
+    def read(self, max_bytes=256 << 10):
+        """
+        Oldest undelivered entries: (bodies, n_frames, token), or None when
+        empty. Entries older than max_age_s are skipped (counted as evicted
+        on commit). Pass the token to commit() once the bodies were delivered.
+        """
+        with self._lock:
+            if not self._segs:
+                return None
+            seg = self._segs[0]
+            path, seq, off, end = seg.path, seg.seq, seg.read_off, seg.size
+        bodies, frames, live, size = [], 0, 0, 0
+        stale = time.time() - self.max_age_s
+        try:
+            with open(path, "rb") as f:
+                f.seek(off)
+                while off < end and size < max_bytes:
+                    n, ts, k = ENTRY.unpack(f.read(ENTRY.size))
+                    body = f.read(n)
+                    off += ENTRY.size + n
+                    frames += k
+                    if ts >= stale:
+                        bodies.append(body)
+                        live += k
+                        size += n
+        except (OSError, struct.error):
+            return None                 # evicted under us; try again next round
+        if off == end and not frames:
+            return None
+        return bodies, live, (seq, off, frames, frames - live)
+
+    def commit(self, token):
+        seq, off, frames, stale = token
+        with self._lock:
+            self.evicted += stale
+            if not self._segs or self._segs[0].seq != seq:
+                return                  # segment was evicted meanwhile
+            seg = self._segs[0]
+            seg.read_off, seg.read_frames = off, seg.read_frames + frames
+            if seg.read_off < seg.size:
+                return
+            if len(self._segs) == 1 and self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            self._segs.pop(0)
+            self._remove(seg)
+
+    # ---------- stats / lifecycle ----------
+    def depth(self):
+        with self._lock:
+            return {"frames": sum(s.frames - s.read_frames for s in self._segs),
+                    "bytes": sum(s.size - s.read_off for s in self._segs),
+                    "segments": len(self._segs)}
+
+    def stats(self):
+        d = self.depth()
+        return {"spool_frames": d["frames"], "spool_bytes": d["bytes"], "spool_segments": d["segments"],
+                "spooled": self.spooled, "spool_evicted": self.evicted, "spool_overflow": self.overflow}
+
+    def close(self):
+        self._stop = True
+        self.th.join(timeout=5)
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class SpoolReplayer:
+    """
+    Drains a DiskSpool to /ingest_bin in the background at most at
+    `rate_kbps`. Replay only runs while ready_fn() is true (typically: the
+    live sender's last POST succeeded and its queue is idle), so live
+    traffic keeps priority; on a failed POST it backs off `retry_s`.
+    """
+    def __init__(self, spool, bin_url, rate_kbps=512.0, timeout=5, retry_s=2.0, ready_fn=None):
+        self.spool = spool
+        self.url = bin_url
+        self.rate_Bps = max(1.0, rate_kbps * 1000.0 / 8.0)
+        self.timeout = timeout
+        self.retry_s = retry_s
+        self.ready_fn = ready_fn
+        self.replayed = 0
+        self.replayed_bytes = 0
+        self.failures = 0
+        self._active_s = 0.0        # time spent replaying (for the replay rate)
+        self._stop = False
+        self.th = threading.Thread(target=self._run, daemon=True)
+        self.th.start()
+
+    def _run(self):
+        s = requests.Session()
+        while not self._stop:
+            if self.ready_fn is not None and not self.ready_fn():
+                time.sleep(0.2)
+                continue
+            chunk = self.spool.read(max_bytes=max(4096, int(self.rate_Bps * 0.25)))
+            if chunk is None:
+                time.sleep(0.5)
+                continue
+            bodies, frames, token = chunk
+            body = b"".join(bodies)
+            t0 = time.time()
+            if body:
+                try:
+                    r = s.post(self.url, data=body, timeout=self.timeout,
+                               headers={"Content-Type": "application/octet-stream"})
+                    r.raise_for_status()
+                except Exception:
+                    self.failures += 1
+                    time.sleep(self.retry_s)
+                    continue
+            self.spool.commit(token)
+            self.replayed += frames
+            self.replayed_bytes += len(body)
+            # pace to the byte budget
+            wait = len(body) / self.rate_Bps - (time.time() - t0)
+            if wait > 0:
+                time.sleep(wait)
+            self._active_s += time.time() - t0
+
+    def stats(self):
+        rate = self.replayed / self._active_s if self._active_s > 0 else 0.0
+        kbps = self.replayed_bytes * 8 / 1000.0 / self._active_s if self._active_s > 0 else 0.0
+        return {"replayed": self.replayed, "replay_bytes": self.replayed_bytes,
+                "replay_failures": self.failures, "replay_fps": round(rate, 2),
+                "replay_kbps": round(kbps, 1)}
+
+    def stop(self):
+        self._stop = True
+        self.th.join(timeout=2)
@@ -0,0 +1,5 @@
+# edge/tests/conftest.py
+# The edge modules are flat scripts run from edge/ (the image WORKDIR), not a package.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
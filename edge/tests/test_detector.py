@@ -0,0 +1,48 @@
+# edge/tests/test_detector.py
+import numpy as np
+import pytest
+
+from detector import HogPersonDetector, WIN_W, WIN_H, _fit_span
+
+H, W = 720, 1280
+BORDER_ROIS = [
+    (600, 719, 700, 719),       # bottom edge, zero height
+    (600, 0, 700, 0),           # top edge
+    (0, 300, 0, 400),           # left edge, zero width
+    (1279, 300, 1279, 400),     # right edge
+    (1270, 710, 1279, 719),     # bottom-right corner
+    (0, 0, 5, 5),               # top-left corner
+]
+
+
+def test_fit_span_shifts_inside_instead_of_clipping():
+    assert _fit_span(700, 720, 144, 720) == (576, 720)
+    assert _fit_span(-10, 5, 144, 720) == (0, 144)
+    assert _fit_span(100, 400, 144, 720) == (100, 400)
+    assert _fit_span(0, 10, 144, 100) is None
+
+
+@pytest.mark.parametrize("roi", BORDER_ROIS)
+def test_regions_at_frame_border_keep_a_full_window(roi):
+    det = HogPersonDetector()
+    regions = det._regions(H, W, 1.0, [roi])
+    assert regions
+    for (x1, y1, x2, y2) in regions:
+        assert 0 <= x1 < x2 <= W and 0 <= y1 < y2 <= H
+        assert x2 - x1 >= WIN_W + 16 and y2 - y1 >= WIN_H + 16
+
+
+def test_regions_skipped_when_frame_smaller_than_window():
+    det = HogPersonDetector()
+    assert det._regions(100, 60, 1.0, [(0, 0, 60, 100)]) == []
+
+
+@pytest.mark.parametrize("roi", BORDER_ROIS)
+def test_predict_with_border_rois_does_not_crash(roi):
+    # used to segfault inside detectMultiScale on crops shorter than the window
+    det = HogPersonDetector()
+    assert det.predict(np.zeros((H, W, 3), np.uint8), rois=[roi]) == []
+
+
+def test_predict_on_frame_smaller_than_window():
+    assert HogPersonDetector().predict(np.zeros((64, 96, 3), np.uint8)) == []
@@ -0,0 +1,85 @@
+# edge/tests/test_detector_pool.py
+import os, signal, threading, time
+import numpy as np
+import pytest
+
+from detector_pool import HogDetectorPool
+
+
+@pytest.fixture
+def pool():
+    p = HogDetectorPool(workers=2, mode="frames", predict_timeout_s=5.0)
+    yield p
+    p.close()
+
+
+def _frame(v=0):
+    return np.full((240, 320, 3), v, np.uint8)
+
+
+def test_dead_worker_fails_pending_frames_and_is_respawned(pool):
+    for p in pool._procs:
+        os.kill(p.pid, signal.SIGKILL)
+    for p in pool._procs:
+        p.join(timeout=5)
+    pool.submit(_frame(), tag="lost")
+    assert pool.get(timeout=5) == ("lost", [])
+    assert pool.respawns == 2
+    assert pool.errors >= 1
+    # respawned workers pick up new work and every slot came back
+    for i in range(len(pool._slots) + 2):
+        pool.submit(_frame(), tag=i)
+        assert pool.get(timeout=10) == (i, [])
+
+
+def test_predict_times_out_and_skips_the_late_result(pool):
+    pool.predict_timeout_s = 0.5
+    for p in pool._procs:
+        os.kill(p.pid, signal.SIGSTOP)
+    try:
+        t0 = time.time()
+        assert pool.predict(_frame()) == []
+        assert time.time() - t0 < 3.0
+    finally:
+        for p in pool._procs:
+            os.kill(p.pid, signal.SIGCONT)
+    pool.submit(_frame(), tag="next")
+    assert pool.get(timeout=10) == ("next", [])
+
+
+def test_results_come_back_in_submit_order(pool):
+    n = 3 * len(pool._slots)            # more than the slots, so submit() has to wait for some
+    seqs = []
+
+    def feed():
+        for i in range(n):
+            seqs.append(pool.submit(_frame(i % 255), tag=i))
+
+    th = threading.Thread(target=feed)
+    th.start()
+    tags = [pool.get(timeout=10)[0] for _ in range(n)]
+    th.join(timeout=10)
+    assert tags == list(range(n))
+    assert seqs == sorted(seqs)
+    assert pool._free.qsize() == len(pool._slots)
+
+
+def test_tiles_mode_predict_matches_frames_shape():
+    p = HogDetectorPool(workers=2, mode="tiles", tile_overlap=0.25)
+    try:
+        assert p.predict(np.zeros((480, 640, 3), np.uint8)) == []
+        assert p.predict(np.zeros((100, 100, 3), np.uint8)) == []      # thinner than one window
+    finally:
+        p.close()
+
+
+def test_close_stops_workers_without_respawning():
+    p = HogDetectorPool(workers=2, mode="frames")
+    procs = list(p._procs)
+    p.close()
+    assert not any(proc.is_alive() for proc in procs)
+    time.sleep(0.6)                 # a collector pass would have respawned them
+    assert p.respawns == 0
+    with pytest.raises(RuntimeError):
+        p.submit(_frame())
+    assert p.get(timeout=0.1) is None
@@ -0,0 +1,44 @@
+# edge/tests/test_pipeline.py
+import threading, time
+
+from pipeline import LatestQueue
+
+
+def test_full_queue_evicts_oldest():
+    q = LatestQueue(maxsize=2)
+    for i in range(5):
+        q.put(i)
+    assert q.dropped == 3 and q.qsize() == 2
+    assert [q.get(timeout=0), q.get(timeout=0)] == [3, 4]
+    assert q.get(timeout=0) is None
+
+
+def test_get_times_out_when_empty():
+    q = LatestQueue()
+    t0 = time.time()
+    assert q.get(timeout=0.1) is None
+    assert 0.05 <= time.time() - t0 < 1.0
+    assert not q.drained
+
+
+def test_close_wakes_consumer_and_drains_remaining_items():
+    q = LatestQueue(maxsize=3)
+    got = []
+
+    def consume():
+        while True:
+            item = q.get(timeout=5)
+            if item is None:
+                if q.drained:
+                    return
+                continue
+            got.append(item)
+
+    th = threading.Thread(target=consume)
+    th.start()
+    q.put("a")
+    q.put("b")
+    q.close()
+    th.join(timeout=2)
+    assert not th.is_alive()
+    assert got == ["a", "b"]
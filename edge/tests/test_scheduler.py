@@ -0,0 +1,51 @@
+# edge/tests/test_scheduler.py
+import numpy as np
+
+from scheduler import BoxPropagator, DetectionScheduler, MIN_BOX_SIDE
+
+
+class _Motion:
+    score = 50.0
+
+    def __init__(self, rois):
+        self._rois = rois
+
+    def rois(self):
+        return list(self._rois)
+
+
+class _RecordingDetector:
+    def __init__(self, dets):
+        self.dets = dets
+        self.calls = []
+
+    def predict(self, frame, rois=None):
+        self.calls.append(rois)
+        return self.dets
+
+
+def test_propagator_drops_boxes_extrapolated_out_of_frame():
+    bp = BoxPropagator(max_extrapolate_s=1.0)
+    bp.update([[100, 500, 160, 700, 0.9], [400, 100, 460, 300, 0.8]], ts=0.0)
+    bp.update([[100, 600, 160, 800, 0.9], [400, 100, 460, 300, 0.8]], ts=0.1)   # first moves down 1000 px/s
+    out = bp.predict(0.5, frame_w=1280, frame_h=720)
+    assert [d[4] for d in out] == [0.8]
+
+
+def test_motion_rois_never_contain_slivers():
+    H, W = 720, 1280
+    det = _RecordingDetector([[600, 560, 660, 719, 0.9]])
+    motion = _Motion([(1200, 700, 1280, 720), (1279, 0, 1285, 100)])   # second one is past the right edge
+    sched = DetectionScheduler(det, motion_fn=lambda f: motion, motion_thr=1.0,
+                               max_interval_s=10.0, motion_rois=True)
+    frame = np.zeros((H, W, 3), np.uint8)
+    sched.predict(frame, ts=0.0)            # forced full pass
+    det.dets = [[600, 620, 660, 719, 0.9]]
+    sched.predict(frame, ts=0.1)
+    sched.predict(frame, ts=1.0)            # carried box extrapolated below the frame
+    for rois in det.calls[1:]:
+        for (x1, y1, x2, y2) in rois:
+            assert 0 <= x1 and x2 <= W and 0 <= y1 and y2 <= H
+            assert x2 - x1 >= MIN_BOX_SIDE and y2 - y1 >= MIN_BOX_SIDE
+    assert det.calls[0] is None
+    assert (1200, 700, 1280, 720) in det.calls[-1]
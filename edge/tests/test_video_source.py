@@ -0,0 +1,39 @@
+# edge/tests/test_video_source.py
+import time
+import numpy as np
+import cv2
+
+from video_source import ThreadedCapture
+
+
+def _write_clip(path, n):
+    w = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(n):
+        w.write(np.full((48, 64, 3), i * 10, np.uint8))
+    w.release()
+
+
+def test_file_source_reads_every_frame_then_eof(tmp_path):
+    clip = tmp_path / "clip.avi"
+    _write_clip(clip, 5)
+    cap = ThreadedCapture(str(clip), prefetch=1)
+    frames = 0
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames += 1
+    assert frames == 5 and cap.done
+    cap.release()
+
+
+def test_release_cuts_reconnect_backoff_short(tmp_path):
+    cap = ThreadedCapture(str(tmp_path / "missing.mp4"), live=True, backoff_min=20.0, backoff_max=20.0)
+    deadline = time.time() + 5
+    while cap.reconnects == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    assert cap.reconnects >= 1
+    t0 = time.time()
+    cap.release()
+    assert time.time() - t0 < 2.0
+    assert not cap.th.is_alive()
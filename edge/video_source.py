@@ -1,10 +1,18 @@
-import time, cv2
+import time, threading
+from collections import deque
+import cv2
+
+def is_live(spec: str):
+    s = str(spec).lower()
+    return s.startswith(("rtsp://", "rtmp://", "http://", "https://", "udp://")) or s.isdigit()
 
 class ResilientCapture:
     def __init__(self, spec: str, retry_delay=1.0):
         self.spec = spec
         self.retry_delay = retry_delay
         self.cap = None
+        self.last_ts = None         # capture time of the last frame returned
+        self.last_age_ms = 0.0
         self._open()
 
     def _open(self):
@@ -13,6 +21,7 @@ class ResilientCapture:
     def read(self):
         ok, frame = self.cap.read()
         if ok and frame is not None:
+            self.last_ts = time.time()
             return True, frame
 
         # Reconnect on failure
@@ -23,6 +32,8 @@ class ResilientCapture:
         time.sleep(self.retry_delay)
         self._open()
         ok, frame = self.cap.read()
+        if ok:
+            self.last_ts = time.time()
         return ok, frame
 
     def release(self):
@@ -31,5 +42,121 @@ class ResilientCapture:
         except Exception:
             pass
 
-def open_source(spec: str):
+class ThreadedCapture:
+    """
+    Grab + decode on a dedicated thread so the consumer never waits on the
+    network or the decoder.
+
+    live=True keeps only the newest frame: a frame replaced before read()
+    took it counts in `skipped`, so OpenCV's RTSP buffer is drained at
+    source rate and the consumer always gets the freshest frame. Files are
+    prefetched through a `prefetch`-deep buffer instead, without skipping,
+    and read() blocks for the next frame, returning (False, None) only at EOF.
+
+    A failed read on a live source reconnects in the background with
+    exponential backoff (backoff_min doubling up to backoff_max, reset on
+    the first good frame); read() just times out meanwhile.
+
+    After read(): `last_ts` is the frame's capture time and `last_age_ms`
+    its capture-to-consume age.
+    """
+    def __init__(self, spec: str, live=None, prefetch=2, backoff_min=0.5, backoff_max=30.0):
+        self.spec = spec
+        self.live = is_live(spec) if live is None else live
+        self.prefetch = max(1, int(prefetch))
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.cap = None
+        self.last_ts = None
+        self.last_age_ms = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.reconnects = 0
+        self._buf = deque()
+        self._cv = threading.Condition()
+        self._eof = False
+        self._stop = threading.Event()
+        self.th = threading.Thread(target=self._run, daemon=True)
+        self.th.start()
+
+    def _run(self):
+        backoff = self.backoff_min
+        while not self._stop.is_set():
+            if self.cap is None:
+                self.cap = cv2.VideoCapture(self.spec)
+            ok, frame = self.cap.read()
+            ts = time.time()
+            if not ok or frame is None:
+                if not self.live:
+                    break
+                try:
+                    self.cap.release()
+                except Exception:
+                    pass
+                self.cap = None
+                self.reconnects += 1
+                self._stop.wait(backoff)        # release() cuts the backoff short
+                backoff = min(self.backoff_max, backoff * 2)
+                continue
+            backoff = self.backoff_min
+            with self._cv:
+                if self.live:
+                    if self._buf:
+                        self._buf.clear()
+                        self.skipped += 1
+                else:
+                    while len(self._buf) >= self.prefetch and not self._stop.is_set():
+                        self._cv.wait(0.5)
+                self._buf.append((frame, ts))
+                self.frames += 1
+                self._cv.notify_all()
+        with self._cv:
+            self._eof = True
+            self._cv.notify_all()
+        # the grab thread owns the VideoCapture, so it is released here, never mid-read
+        try:
+            if self.cap is not None:
+                self.cap.release()
+        except Exception:
+            pass
+        self.cap = None
+
+    def read(self, timeout=None):
+        # timeout=None: live sources wait up to 1 s (reconnects time out), files
+        # block until the next frame or EOF so a slow decode never looks like the end
+        if timeout is None:
+            timeout = 1.0 if self.live else None
+        with self._cv:
+            if timeout is None:
+                self._cv.wait_for(lambda: self._buf or self._eof or self._stop.is_set())
+            elif not self._buf and not self._eof:
+                self._cv.wait(timeout)
+            if not self._buf:
+                return False, None
+            frame, ts = self._buf.popleft()
+            self._cv.notify_all()
+        self.last_ts = ts
+        self.last_age_ms = (time.time() - ts) * 1000.0
+        return True, frame
+
+    @property
+    def done(self):
+        # file source exhausted and fully consumed (never true for live sources)
+        return self._eof and not self._buf
+
+    def stats(self):
+        return {"capture_frames": self.frames, "capture_skipped": self.skipped,
+                "capture_reconnects": self.reconnects}
+
+    def release(self):
+        self._stop.set()
+        with self._cv:
+            self._cv.notify_all()
+        # the grab thread releases the capture on its way out; a read stuck on the
+        # network finishes (and releases) on its own after this returns
+        self.th.join(timeout=5)
+
+def open_source(spec: str, threaded=False):
+    if threaded:
+        return ThreadedCapture(spec)
     return ResilientCapture(spec)